@@ -0,0 +1,92 @@
+"""Range-partition steps by run id
+
+Retention then drops a block of expired runs' steps as one partition
+(app.storage.retention) instead of deleting them row by row. The schema
+itself comes from `python -m app.storage.postgres`; this revision converts
+its steps table in place on Postgres and does nothing elsewhere.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+
+from sqlalchemy import text
+
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Defaults of steps_partition_runs and steps_partitions_ahead; later
+# partitions are created by the retention job from the settings
+PARTITION_RUNS = 10000
+PARTITIONS_AHEAD = 2
+
+INDEXES = (
+    "CREATE INDEX ix_steps_id ON steps (id)",
+    "CREATE INDEX idx_run_stage_step ON steps (run_id, stage, step)",
+    "CREATE UNIQUE INDEX uq_steps_run_span ON steps (run_id, span_id)",
+)
+
+
+def _is_partitioned() -> bool:
+    return (
+        op.get_bind()
+        .execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'steps'"
+            )
+        )
+        .first()
+        is not None
+    )
+
+
+def _replace_steps(old: str, key: str, partition_by: str) -> None:
+    """Rename steps to old, recreate it with the given key and copy the rows over"""
+    op.execute(f"ALTER TABLE steps RENAME TO {old}")
+    op.execute(f"ALTER TABLE {old} RENAME CONSTRAINT steps_pkey TO {old}_pkey")
+    for index in ("ix_steps_id", "idx_run_stage_step", "uq_steps_run_span"):
+        op.execute(f"DROP INDEX IF EXISTS {index}")
+
+    op.execute(
+        f"CREATE TABLE steps (LIKE {old} INCLUDING DEFAULTS, PRIMARY KEY ({key}), "
+        f"FOREIGN KEY (run_id) REFERENCES runs (id)) {partition_by}"
+    )
+    for statement in INDEXES:
+        op.execute(statement)
+
+
+def _copy_steps(old: str) -> None:
+    op.execute(f"INSERT INTO steps SELECT * FROM {old}")
+    op.execute("ALTER SEQUENCE steps_id_seq OWNED BY steps.id")
+    op.execute(f"DROP TABLE {old}")
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql" or _is_partitioned():
+        return
+
+    # A partitioned table's keys must include run_id, the partition key
+    _replace_steps("steps_unpartitioned", "id, run_id", "PARTITION BY RANGE (run_id)")
+
+    newest = op.get_bind().execute(text("SELECT coalesce(max(id), 0) FROM runs")).scalar_one()
+    for lo in range(0, newest + 1 + PARTITION_RUNS * PARTITIONS_AHEAD, PARTITION_RUNS):
+        op.execute(
+            f"CREATE TABLE steps_p{lo} PARTITION OF steps "
+            f"FOR VALUES FROM ({lo}) TO ({lo + PARTITION_RUNS})"
+        )
+    op.execute("CREATE TABLE steps_default PARTITION OF steps DEFAULT")
+
+    _copy_steps("steps_unpartitioned")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql" or not _is_partitioned():
+        return
+
+    _replace_steps("steps_partitioned", "id", "")
+    _copy_steps("steps_partitioned")
@@ -7,7 +7,7 @@ from fastapi.security import APIKeyHeader
 from sqlalchemy.orm import Session
 
 from .config import settings
-from .storage.postgres import SessionLocal
+from .storage.postgres import ReadSessionLocal, SessionLocal
 
 # Security
 api_key_header = APIKeyHeader(name="X-IM-Token", auto_error=False)
@@ -22,6 +22,15 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+def get_read_db() -> Generator[Session, None, None]:
+    """Read-only database session dependency (replica when available)"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def verify_api_key(api_key: str | None = Security(api_key_header)) -> str:
     """Verify API key"""
     if not api_key or api_key != settings.api_key:
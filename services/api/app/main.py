@@ -1,25 +1,55 @@
 """FastAPI main application"""
 
+from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .config import settings
-from .routers import builds, features, health, optimize, runs
-from .storage.postgres import engine, Base
-from .middleware.rate_limit import setup_rate_limiting
-from .middleware.metrics import metrics_middleware, metrics_endpoint
+from .middleware.admission import controller as admission
+from .middleware.admission import setup_admission_control
+from .middleware.compression import CompressionMiddleware
+from .middleware.metrics import (
+    MetricsMiddleware,
+    cleanup_dead_workers,
+    mark_worker_exited,
+    metrics_endpoint,
+)
+from .middleware.rate_limit import limiter, setup_rate_limiting
+from .ml import inference
+from .routers import builds, export, features, health, optimize, runs, steps, traces
+from .storage import feature_cache
+from .storage.agent_scraper import scraper
+from .storage.health import prober
+from .storage.postgres import ensure_schema
+from .storage.redis import close_async_redis, init_async_redis
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """Application lifespan manager"""
-    # Startup: Create tables
-    Base.metadata.create_all(bind=engine)
+    # Startup: verify the schema, then warm up the inference pool in the background
+    ensure_schema()
+    cleanup_dead_workers()
+    init_async_redis()
+    feature_cache.start_invalidation_listener()
+    limiter.start()
+    admission.start()
+    prober.start()
+    scraper.start()
+    warm_up = inference.pool.start()
     yield
     # Shutdown: cleanup if needed
+    await warm_up
+    await inference.pool.stop()
+    await scraper.stop()
+    await prober.stop()
+    await admission.stop()
+    await limiter.stop()
+    feature_cache.stop_invalidation_listener()
+    await close_async_redis()
+    mark_worker_exited()
 
 
 app = FastAPI(
@@ -37,18 +67,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add Prometheus metrics middleware
-app.middleware("http")(metrics_middleware)
+# Compress large JSON responses and exports (zstd or gzip, as the client accepts)
+app.add_middleware(CompressionMiddleware, minimum_size=settings.response_compress_min_bytes)
 
-# Setup rate limiting (uses Redis for distributed rate limiting)
+# Setup rate limiting (local token buckets, reconciled through Redis)
 setup_rate_limiting(app)
 
+# Shed load per route class before requests outlive their clients
+setup_admission_control(app)
+
+# Add Prometheus metrics middleware (outermost, so rejected requests are counted)
+app.add_middleware(MetricsMiddleware)
+
 # Routers
 app.include_router(health.router, tags=["health"])
 app.include_router(builds.router, prefix="/builds", tags=["builds"])
 app.include_router(runs.router, tags=["runs"])
+app.include_router(traces.router, tags=["traces"])
 app.include_router(optimize.router, tags=["optimize"])
 app.include_router(features.router, prefix="/features", tags=["features"])
+app.include_router(steps.router, prefix="/steps", tags=["steps"])
+app.include_router(export.router, prefix="/export", tags=["export"])
 
 # Prometheus metrics endpoint
 app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
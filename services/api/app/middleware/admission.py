@@ -0,0 +1,195 @@
+"""Admission control: shed load before requests outlive their clients
+
+Clients give up after about 10 s (the CLI's requests timeout), so work on a
+request that will not finish in time is wasted. For each route class the
+controller projects how long a new request would take: the worker's current
+queueing delay (event loop lag) plus the class's recent latency, an EWMA over
+completed requests, stretched by how many requests of the class are already
+in flight relative to the concurrency the worker serves without slowing
+down (ewma * (1 + in_flight / capacity)). Requests whose projection exceeds their class target are
+rejected at once with 503 and Retry-After. Optimize has the lowest target, so
+it is shed first and ingest last: a stale suggestion beats lost telemetry.
+Recent latency decays while nothing completes, so a class that was shed
+entirely is admitted again to probe. Streaming exports run for as long as
+the export is large, which says nothing about load, so they are not admitted
+or measured here.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import math
+import time
+from collections.abc import Callable
+
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ..config import settings
+from .metrics import event_loop_lag_seconds, requests_shed_total
+from .rate_limit import classify
+
+logger = logging.getLogger(__name__)
+
+# Rate limit class -> admission class
+ROUTE_CLASSES = {"ingest": "ingest", "optimize": "optimize", "default": "reads"}
+
+# Long-lived streaming responses, neither shed nor counted towards "reads"
+STREAMING_PREFIXES = ("/export/",)
+
+
+def default_targets() -> dict[str, float]:
+    """Per-class latency targets in seconds, from settings"""
+    return {
+        "ingest": settings.admission_target_ingest_ms / 1000,
+        "reads": settings.admission_target_reads_ms / 1000,
+        "optimize": settings.admission_target_optimize_ms / 1000,
+    }
+
+
+class ClassState:
+    """Latency and in-flight requests of one route class"""
+
+    __slots__ = ("target_s", "latency_s", "updated", "in_flight")
+
+    def __init__(self, target_s: float, now: float) -> None:
+        self.target_s = target_s
+        self.latency_s = 0.0
+        self.updated = now
+        # ticket -> start time
+        self.in_flight: dict[int, float] = {}
+
+
+class AdmissionController:
+    """Admit or shed requests per route class from projected latency"""
+
+    def __init__(
+        self,
+        targets: dict[str, float],
+        enabled: bool = True,
+        alpha: float = 0.2,
+        decay_s: float = 5.0,
+        lag_interval_s: float = 0.1,
+        capacity: int = 16,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.enabled = enabled
+        self.alpha = alpha
+        self.capacity = capacity
+        self.decay_s = decay_s
+        self.lag_interval_s = lag_interval_s
+        self.loop_lag_s = 0.0
+        self._clock = clock
+        now = clock()
+        self.classes = {name: ClassState(target, now) for name, target in targets.items()}
+        self._tickets = itertools.count(1)
+        self._task: asyncio.Task | None = None
+
+    def projected_latency(self, route_class: str) -> float:
+        """Expected latency of a request of this class admitted now"""
+        state = self.classes[route_class]
+        now = self._clock()
+        recent = state.latency_s * math.exp(-(now - state.updated) / self.decay_s)
+        return self.loop_lag_s + recent * (1 + len(state.in_flight) / self.capacity)
+
+    def admit(self, route_class: str) -> int | None:
+        """A ticket to pass to release(), or None if the request should be shed"""
+        state = self.classes[route_class]
+        if self.projected_latency(route_class) > state.target_s:
+            requests_shed_total.labels(route_class=route_class).inc()
+            return None
+        ticket = next(self._tickets)
+        state.in_flight[ticket] = self._clock()
+        return ticket
+
+    def release(self, route_class: str, ticket: int) -> None:
+        """Record a finished request"""
+        state = self.classes[route_class]
+        now = self._clock()
+        latency = now - state.in_flight.pop(ticket)
+        state.latency_s += self.alpha * (latency - state.latency_s)
+        state.updated = now
+
+    async def _measure_lag(self) -> None:
+        # A request arriving now waits about as long as this sleep overshoots
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.lag_interval_s)
+            lag = max(0.0, time.perf_counter() - start - self.lag_interval_s)
+            self.loop_lag_s += self.alpha * (lag - self.loop_lag_s)
+            event_loop_lag_seconds.set(self.loop_lag_s)
+
+    def start(self) -> None:
+        """Start measuring event loop lag on the running loop"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._measure_lag())
+
+    async def stop(self) -> None:
+        """Stop measuring event loop lag"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.loop_lag_s = 0.0
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware answering 503 with Retry-After for requests it sheds"""
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController) -> None:
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.controller.enabled:
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        limit_class = classify(path)
+        if limit_class is None or path.startswith(STREAMING_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        route_class = ROUTE_CLASSES[limit_class]
+        ticket = self.controller.admit(route_class)
+        if ticket is not None:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self.controller.release(route_class, ticket)
+            return
+
+        projected = self.controller.projected_latency(route_class)
+        target = self.controller.classes[route_class].target_s
+        body = json.dumps({"detail": f"Overloaded ({route_class}), retry later"}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(max(1, math.ceil(projected - target))).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+controller = AdmissionController(
+    default_targets(),
+    enabled=settings.admission_enabled,
+    decay_s=settings.admission_decay_s,
+    capacity=settings.admission_capacity,
+)
+
+
+def setup_admission_control(app: FastAPI) -> None:
+    """Shed requests whose projected latency exceeds their class target"""
+    app.state.admission = controller
+    app.add_middleware(AdmissionMiddleware, controller=controller)
@@ -0,0 +1,149 @@
+"""Negotiated zstd/gzip response compression"""
+
+import zlib
+from typing import Any
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/vnd.apache.arrow.stream",
+    "text/",
+)
+
+
+def _zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def choose_encoding(accept_encoding: str, zstd: bool = True) -> str | None:
+    """Pick zstd or gzip from an Accept-Encoding header, preferring zstd"""
+    offered = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[coding.strip().lower()] = q
+    if zstd and offered.get("zstd", 0) > 0:
+        return "zstd"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    """Incremental compressor that flushes at every chunk so streams stay live"""
+
+    def __init__(self, encoding: str, gzip_level: int, zstd_level: int) -> None:
+        if encoding == "zstd":
+            import zstandard
+
+            self._obj: Any = zstandard.ZstdCompressor(level=zstd_level).compressobj()
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._obj = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+
+    def chunk(self, data: bytes) -> bytes:
+        out: bytes = self._obj.compress(data) + self._obj.flush(self._flush_mode)
+        return out
+
+    def finish(self, data: bytes = b"") -> bytes:
+        out: bytes = self._obj.compress(data) + self._obj.flush()
+        return out
+
+
+class CompressionMiddleware:
+    """
+    Compress JSON, NDJSON, CSV and Arrow responses with the best coding the
+    client accepts. Whole responses under minimum_size are sent as is;
+    streamed responses (exports) are compressed chunk by chunk. Compressed
+    variants get their own strong ETag ("<etag>-<coding>").
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 5,
+        zstd_level: int = 3,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+        self.zstd = _zstd_available()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.zstd)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        compressor: _Compressor | None = None
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                passthrough = (
+                    "content-encoding" in headers
+                    or message["status"] in (204, 304)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                assert start is not None
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.zstd_level)
+                headers = MutableHeaders(raw=list(start["headers"]))
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and etag.endswith('"'):
+                    headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+                if more_body:
+                    if "content-length" in headers:
+                        del headers["Content-Length"]
+                    await send({**start, "headers": headers.raw})
+                else:
+                    data = compressor.finish(body)
+                    headers["Content-Length"] = str(len(data))
+                    await send({**start, "headers": headers.raw})
+                    await send({"type": "http.response.body", "body": data})
+                    return
+
+            data = compressor.chunk(body) if more_body else compressor.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
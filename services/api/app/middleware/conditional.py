@@ -0,0 +1,43 @@
+"""Conditional GET: strong ETags and If-None-Match handling"""
+
+import hashlib
+import json
+from typing import Any
+
+from fastapi import Response
+
+# CompressionMiddleware tags compressed variants as "<etag>-<coding>"
+ENCODING_SUFFIXES = ("-zstd", "-gzip")
+
+CACHE_CONTROL = "no-cache"  # Clients may store responses but must revalidate
+
+
+def make_etag(value: Any) -> str:
+    """Strong ETag for a JSON-serializable value"""
+    body = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return '"' + hashlib.blake2b(body.encode(), digest_size=16).hexdigest() + '"'
+
+
+def _strip_coding(tag: str) -> str:
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[: -len(suffix) - 1] + '"'
+    return tag
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header matches etag (weak comparison, as RFC 9110 requires)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/")
+        if _strip_coding(tag) == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    """304 response for a matching ETag"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
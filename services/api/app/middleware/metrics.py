@@ -1,8 +1,44 @@
-"""Prometheus metrics for API monitoring"""
+"""Prometheus metrics for API monitoring
 
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
-from fastapi import Request, Response
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory shared by the workers before they start. prometheus_client then
+keeps every value in per-process files there, and /metrics aggregates all
+workers' files instead of reporting whichever worker answered. Each worker
+restart leaves the dead worker's counter and histogram files behind; at
+startup they are folded into one archive file per type, so totals stay
+monotonic while the directory stays bounded.
+"""
+
+import fcntl
+import glob
+import os
+import re
 import time
+from typing import Any
+
+from fastapi import Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.mmap_dict import MmapedDict
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Read by prometheus_client at import time, so it must come from the environment
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get(
+    "prometheus_multiproc_dir"
+)
+
+_PID_FILE = re.compile(r"_(\d+)\.db$")
+
+# Value files that must keep counting after their worker exits
+_ARCHIVED_TYPES = ("counter", "histogram")
 
 # Request metrics
 http_requests_total = Counter(
@@ -18,10 +54,13 @@ http_request_duration_seconds = Histogram(
     buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
 )
 
+# The route is only known once routing has run, so in-flight requests are
+# counted per method
 http_requests_in_progress = Gauge(
     "http_requests_in_progress",
     "Number of HTTP requests in progress",
-    ["method", "endpoint"]
+    ["method"],
+    multiprocess_mode="livesum",
 )
 
 # Application metrics
@@ -68,53 +107,217 @@ redis_operations_total = Counter(
     ["operation", "status"]
 )
 
+redis_operation_duration_seconds = Histogram(
+    "redis_operation_duration_seconds",
+    "Redis operation latency",
+    ["operation"],
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0]
+)
 
-async def metrics_middleware(request: Request, call_next):
-    """Middleware to track request metrics"""
-    # Skip metrics for the metrics endpoint itself
-    if request.url.path == "/metrics":
-        return await call_next(request)
+redis_pool_connections = Gauge(
+    "redis_pool_connections",
+    "Redis asyncio connection pool usage",
+    ["state"],
+    multiprocess_mode="livesum",
+)
 
-    method = request.method
-    endpoint = request.url.path
+circuit_breaker_state = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state (0=closed, 1=half-open, 2=open)",
+    ["name"],
+    multiprocess_mode="livemax",
+)
 
-    # Track in-progress requests
-    http_requests_in_progress.labels(method=method, endpoint=endpoint).inc()
+requests_shed_total = Counter(
+    "requests_shed_total",
+    "Requests rejected by admission control",
+    ["route_class"]
+)
 
-    # Track request duration
-    start_time = time.time()
-    try:
-        response = await call_next(request)
-        status_code = response.status_code
-    except Exception:
+event_loop_lag_seconds = Gauge(
+    "event_loop_lag_seconds",
+    "Smoothed event loop scheduling delay",
+    multiprocess_mode="livemax",
+)
+
+optimize_batch_size = Histogram(
+    "optimize_batch_size",
+    "Optimize requests scored together in one micro-batch",
+    buckets=[1, 2, 4, 8, 16, 32, 64, 128]
+)
+
+optimize_batch_queue_wait_seconds = Histogram(
+    "optimize_batch_queue_wait_seconds",
+    "Time an optimize request waited for its micro-batch to be dispatched",
+    buckets=[0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1]
+)
+
+agent_scrapes_total = Counter(
+    "agent_scrapes_total",
+    "Node agent metric scrapes",
+    ["result"]
+)
+
+build_regressions_total = Counter(
+    "build_regressions_total",
+    "Build duration regressions detected (stage is empty for the whole run)",
+    ["pipeline", "stage"]
+)
+
+
+# Label for requests that matched no route, so 404 scans add no series
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def route_template(scope: Scope) -> str:
+    """Path template of the route that handled a request"""
+    # Newer FastAPI resolves included routers per request: scope["route"] is
+    # then the router-relative route and the prefixed template is kept in
+    # FastAPI's own scope entry
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    path = getattr(context, "path_format", None) or getattr(scope.get("route"), "path", None)
+    return path or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request count, latency and concurrency.
+
+    Series are labelled with the matched route template (e.g.
+    `/features/{run_id}`) rather than the raw path, so cardinality is bounded
+    by the route table. Labelled children are cached, so the steady state
+    allocates only the send wrapper per request.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._in_progress: dict[str, Any] = {}
+        self._durations: dict[tuple[str, str], Any] = {}
+        self._counts: dict[tuple[str, str, int], Any] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        in_progress = self._in_progress.get(method)
+        if in_progress is None:
+            in_progress = self._in_progress[method] = http_requests_in_progress.labels(method)
         status_code = 500
-        raise
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            in_progress.dec()
+
+            # Routing records the matched route in the shared scope
+            key = (method, route_template(scope))
+            histogram = self._durations.get(key)
+            if histogram is None:
+                histogram = self._durations[key] = http_request_duration_seconds.labels(*key)
+            histogram.observe(duration)
+
+            count_key = (*key, status_code)
+            counter = self._counts.get(count_key)
+            if counter is None:
+                counter = self._counts[count_key] = http_requests_total.labels(*count_key)
+            counter.inc()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _archive(paths: list[str], archive: str) -> None:
+    """Add the values in paths to archive, then remove them"""
+    totals: dict[str, float] = {}
+    for path in [archive, *paths] if os.path.exists(archive) else paths:
+        for key, value, _, _ in MmapedDict.read_all_values_from_file(path):
+            totals[key] = totals.get(key, 0.0) + value
+    # Written aside and renamed, so a scrape never reads a half-written archive
+    staging = archive + ".tmp"
+    if os.path.exists(staging):
+        os.remove(staging)
+    values = MmapedDict(staging)
+    try:
+        for key, value in totals.items():
+            values.write_value(key, value, 0.0)
     finally:
-        duration = time.time() - start_time
+        values.close()
+    os.replace(staging, archive)
+    for path in paths:
+        os.remove(path)
+
+
+def cleanup_dead_workers() -> list[int]:
+    """
+    Drop the files of workers that are no longer running.
 
-        # Record metrics
-        http_requests_total.labels(
-            method=method,
-            endpoint=endpoint,
-            status_code=status_code
-        ).inc()
+    Live-gauge files are deleted. Counter and histogram values are added to
+    a per-type archive file before their files are deleted, so totals stay
+    monotonic across worker restarts.
+    """
+    if not MULTIPROC_DIR:
+        return []
+    # Workers starting together would otherwise archive the same files twice
+    with open(os.path.join(MULTIPROC_DIR, ".cleanup.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        pids = set()
+        for path in glob.glob(os.path.join(MULTIPROC_DIR, "*.db")):
+            match = _PID_FILE.search(path)
+            if match:
+                pids.add(int(match.group(1)))
+        dead = sorted(pid for pid in pids if not _pid_alive(pid))
+        for pid in dead:
+            multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
+        for typ in _ARCHIVED_TYPES:
+            paths = [os.path.join(MULTIPROC_DIR, f"{typ}_{pid}.db") for pid in dead]
+            paths = [path for path in paths if os.path.exists(path)]
+            if paths:
+                _archive(paths, os.path.join(MULTIPROC_DIR, f"{typ}_archive.db"))
+    return dead
 
-        http_request_duration_seconds.labels(
-            method=method,
-            endpoint=endpoint
-        ).observe(duration)
 
-        http_requests_in_progress.labels(
-            method=method,
-            endpoint=endpoint
-        ).dec()
+def mark_worker_exited() -> None:
+    """Drop this worker's live-gauge files on shutdown"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid(), MULTIPROC_DIR)
 
-    return response
+
+def collect_metrics() -> bytes:
+    """Render metrics for this process, or for all workers in multiprocess mode"""
+    if not MULTIPROC_DIR:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+    try:
+        return generate_latest(registry)
+    except FileNotFoundError:
+        # A starting worker archived a dead worker's file after it was listed
+        return generate_latest(registry)
 
 
 async def metrics_endpoint():
     """Endpoint to expose Prometheus metrics"""
+    # Reading every worker's files is blocking I/O, so keep it off the event loop
+    content = await run_in_threadpool(collect_metrics)
     return Response(
-        content=generate_latest(),
+        content=content,
         media_type=CONTENT_TYPE_LATEST
     )
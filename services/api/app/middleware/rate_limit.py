@@ -1,35 +1,285 @@
-"""Rate limiting middleware using slowapi"""
+"""Hybrid rate limiting: local token buckets reconciled with Redis
 
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from fastapi import Request
+Each worker admits requests from in-process token buckets, so the hot path
+never touches the network. A background task periodically adds each
+worker's admitted counts to per-minute window counters in Redis and reads
+the totals back; a client whose total across all workers reaches its
+per-minute limit is rejected by every worker until the window ends. Global
+limits are therefore approximate, overshooting by at most what the workers
+admit between two syncs. If Redis is unavailable the local buckets still
+apply.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import time
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+
+import redis
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from ..config import settings
+from ..storage import redis as redis_store
+from ..storage.local_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+WINDOW_S = 60
+
+# Path prefix -> limit class; anything else is "default"
+ROUTE_CLASSES = (
+    ("/runs", "ingest"),
+    ("/builds", "ingest"),
+    ("/v1/traces", "ingest"),
+    ("/optimize", "optimize"),
+)
+
+EXEMPT_PATHS = frozenset({"/", "/healthz", "/readyz", "/metrics"})
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Sustained requests per minute and the burst allowed on top of that rate"""
+
+    per_minute: int
+    burst: int
+
+
+def default_limits() -> dict[str, Limit]:
+    """Per-class limits from settings"""
+    return {
+        "default": Limit(settings.rate_limit_per_minute, settings.rate_limit_burst),
+        "ingest": Limit(settings.rate_limit_ingest_per_minute, settings.rate_limit_ingest_burst),
+        "optimize": Limit(
+            settings.rate_limit_optimize_per_minute, settings.rate_limit_optimize_burst
+        ),
+    }
+
+
+class TokenBucket:
+    """Token bucket refilled at a constant rate up to its capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take one token; returns 0 on success, else seconds until one is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class HybridRateLimiter:
+    """Per-process token buckets with periodic reconciliation through Redis"""
+
+    def __init__(
+        self,
+        limits: dict[str, Limit],
+        sync_interval_s: float = 1.0,
+        enabled: bool = True,
+        max_keys: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.limits = limits
+        self.sync_interval_s = sync_interval_s
+        self.enabled = enabled
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._buckets = LRUCache(maxsize=max_keys)
+        # (class, key) -> requests admitted here and not yet reported to Redis
+        self._pending: dict[tuple[str, str], int] = {}
+        # (class, key) -> window start for keys seen in the current window
+        self._active: dict[tuple[str, str], int] = {}
+        # (class, key) -> wall time at which its exhausted window ends
+        self._blocked: dict[tuple[str, str], float] = {}
+        self._task: asyncio.Task | None = None
+
+    def check(self, limit_class: str, key: str) -> float:
+        """Admit one request; returns 0 if allowed, else seconds to retry after"""
+        limit = self.limits[limit_class]
+        bucket_key = (limit_class, key)
+
+        blocked_until = self._blocked.get(bucket_key)
+        if blocked_until is not None:
+            wait = blocked_until - self._wall_clock()
+            if wait > 0:
+                return wait
+            del self._blocked[bucket_key]
 
+        now = self._clock()
+        bucket: TokenBucket | None = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = TokenBucket(limit.per_minute / WINDOW_S, limit.burst, now)
+            self._buckets.set(bucket_key, bucket)
+        wait = bucket.take(now)
+        if wait:
+            return wait
 
-def get_api_key_or_ip(request: Request) -> str:
+        self._pending[bucket_key] = self._pending.get(bucket_key, 0) + 1
+        return 0.0
+
+    async def sync(self) -> None:
+        """Report admitted counts to Redis and block keys over their global limit"""
+        now = self._wall_clock()
+        window = int(now // WINDOW_S) * WINDOW_S
+        self._active = {k: w for k, w in self._active.items() if w == window}
+        pending, self._pending = self._pending, {}
+        for bucket_key in pending:
+            self._active[bucket_key] = window
+
+        keys = list(self._active)
+        counts = {_redis_key(c, k, window): pending.get((c, k), 0) for c, k in keys}
+        try:
+            totals = await redis_store.aincr_many(counts, ttl=WINDOW_S * 2)
+        except redis.RedisError as e:
+            # Keep the counts for the next attempt; local buckets still apply
+            for bucket_key, count in pending.items():
+                self._pending[bucket_key] = self._pending.get(bucket_key, 0) + count
+            logger.debug("Rate limit sync skipped: %s", e)
+            return
+
+        for bucket_key, total in zip(keys, totals):
+            if total >= self.limits[bucket_key[0]].per_minute:
+                self._blocked[bucket_key] = window + WINDOW_S
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval_s)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Rate limit sync failed")
+
+    def start(self) -> None:
+        """Start the background sync task on the running loop"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background sync task after a final sync"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.sync()
+
+    def reset(self) -> None:
+        """Forget all local state"""
+        self._buckets.clear()
+        self._pending.clear()
+        self._active.clear()
+        self._blocked.clear()
+
+
+def _redis_key(limit_class: str, key: str, window: int) -> str:
+    return f"im:rl:{limit_class}:{key}:{window}"
+
+
+def classify(path: str) -> str | None:
+    """Limit class for a request path, or None if it is not limited"""
+    if path in EXEMPT_PATHS:
+        return None
+    for prefix, limit_class in ROUTE_CLASSES:
+        if path == prefix or path.startswith(prefix + "/"):
+            return limit_class
+    return "default"
+
+
+def _token_digest(token: bytes) -> str:
+    # Never keep raw tokens in Redis key names
+    return hashlib.sha256(token).hexdigest()[:16]
+
+
+def client_key(scope: Scope, api_keys: frozenset[str]) -> str:
     """
-    Rate limit by API key if present, otherwise by IP address.
-    This allows authenticated users to have separate rate limits.
+    Rate limit by the client address, and within it by the X-IM-Token the
+    client authenticates with, so agents with their own keys behind one NAT
+    get separate buckets. A key shared by every agent (the default single
+    api_key) still yields one bucket per address rather than one global
+    bucket. Only a valid API key (api_keys holds their digests) splits an
+    address: random tokens cannot mint fresh buckets.
     """
-    api_key = request.headers.get("X-API-Key") or request.headers.get("Authorization")
-    if api_key:
-        return f"key:{api_key[:16]}"  # Use first 16 chars of key
-    return get_remote_address(request)
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    for name, value in scope["headers"]:
+        if name == b"x-im-token":
+            digest = _token_digest(value)
+            if digest in api_keys:
+                return f"token:{digest}:{address}"
+            break
+    return "ip:" + address
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware answering 429 with Retry-After once a client is over its limit"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limiter: "HybridRateLimiter",
+        api_keys: Iterable[str] | None = None,
+    ) -> None:
+        self.app = app
+        self.limiter = limiter
+        keys = (settings.api_key,) if api_keys is None else api_keys
+        self.api_keys = frozenset(_token_digest(key.encode()) for key in keys)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+        limit_class = classify(scope["path"])
+        if limit_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        wait = self.limiter.check(limit_class, client_key(scope, self.api_keys))
+        if not wait:
+            await self.app(scope, receive, send)
+            return
+
+        body = json.dumps({"detail": f"Rate limit exceeded ({limit_class})"}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
 
 
 # Create limiter instance
-limiter = Limiter(
-    key_func=get_api_key_or_ip,
-    default_limits=[f"{settings.rate_limit_per_minute}/minute"],
+limiter = HybridRateLimiter(
+    default_limits(),
+    sync_interval_s=settings.rate_limit_sync_interval_s,
     enabled=settings.rate_limit_enabled,
-    storage_uri=settings.redis_url,  # Use Redis for distributed rate limiting
 )
 
 
 def setup_rate_limiting(app):
     """Configure rate limiting for the app"""
     app.state.limiter = limiter
-    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+    app.add_middleware(RateLimitMiddleware, limiter=limiter)
     return limiter
@@ -0,0 +1,79 @@
+"""Dynamic micro-batching of concurrent requests
+
+Bursty CI traffic sends many /optimize calls within milliseconds of each
+other. MicroBatcher collects the items submitted by concurrent coroutines
+until max_size items are waiting or the oldest has waited max_wait_s, runs
+them as one batch and hands each caller its own result. A lone request
+waits at most max_wait_s longer than it would unbatched.
+"""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from typing import Generic, TypeVar
+
+from ..middleware.metrics import optimize_batch_queue_wait_seconds, optimize_batch_size
+
+Item = TypeVar("Item")
+Result = TypeVar("Result")
+
+
+class MicroBatcher(Generic[Item, Result]):
+    """Gather concurrent submissions into batches for run_batch"""
+
+    def __init__(
+        self,
+        run_batch: Callable[[list[Item]], Awaitable[list[Result]]],
+        max_wait_s: float = 0.002,
+        max_size: int = 32,
+    ) -> None:
+        self.run_batch = run_batch
+        self.max_wait_s = max_wait_s
+        self.max_size = max_size
+        self._waiting: list[tuple[Item, asyncio.Future[Result], float]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, item: Item) -> Result:
+        """Add an item to the next batch and wait for its result"""
+        if self.max_wait_s <= 0 or self.max_size <= 1:
+            optimize_batch_size.observe(1)
+            optimize_batch_queue_wait_seconds.observe(0)
+            return (await self.run_batch([item]))[0]
+
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[Result] = loop.create_future()
+        self._waiting.append((item, future, time.perf_counter()))
+        if len(self._waiting) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait_s, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._waiting = self._waiting, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[Item, asyncio.Future, float]]) -> None:
+        now = time.perf_counter()
+        optimize_batch_size.observe(len(batch))
+        for _, _, enqueued in batch:
+            optimize_batch_queue_wait_seconds.observe(now - enqueued)
+
+        try:
+            results = await self.run_batch([item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            # Callers that went away (client disconnects) are skipped
+            if not future.done():
+                future.set_result(result)
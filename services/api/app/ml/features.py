@@ -6,7 +6,7 @@ from sqlalchemy.orm import Session
 from ..models.orm import Run, Step
 
 if TYPE_CHECKING:
-    from ..models.schemas import RunStepReq
+    from ..models.schemas import RunStepColumns
 
 
 def compute_features(run_id: str, db: Session) -> dict[str, Any]:
@@ -22,8 +22,8 @@ def compute_features(run_id: str, db: Session) -> dict[str, Any]:
     max_rss = max((s.rss_max_bytes or 0 for s in steps), default=0)
     total_io_read = sum(s.io_r_bytes or 0 for s in steps)
     total_io_write = sum(s.io_w_bytes or 0 for s in steps)
-    total_cache_hits = sum(s.cache_hits for s in steps)
-    total_cache_misses = sum(s.cache_misses for s in steps)
+    total_cache_hits = sum(s.cache_hits or 0 for s in steps)
+    total_cache_misses = sum(s.cache_misses or 0 for s in steps)
 
     cache_hit_ratio = (
         total_cache_hits / (total_cache_hits + total_cache_misses)
@@ -84,16 +84,16 @@ def build_feature_matrix(runs: list[Run], db: Session) -> tuple[list[dict], list
     return X, y
 
 
-def extract_features(run: Run, steps: list["RunStepReq"]) -> dict[str, Any]:
+def extract_features(run: Run, steps: "RunStepColumns") -> dict[str, Any]:
     """Extract features from run and step data (for ingestion)"""
     # Aggregate step metrics
-    max_rss = max((s.rss_max_bytes for s in steps), default=0)
-    total_io_read = sum(s.io_r_bytes for s in steps)
-    total_io_write = sum(s.io_w_bytes for s in steps)
-    total_cpu = sum(s.cpu_usage_pct for s in steps)
+    max_rss = max(steps.rss_max_bytes, default=0)
+    total_io_read = sum(steps.io_r_bytes)
+    total_io_write = sum(steps.io_w_bytes)
+    total_cpu = sum(steps.cpu_usage_pct)
 
     # Step durations
-    step_durations = [s.duration_s for s in steps]
+    step_durations = steps.duration_s
     avg_step_duration = sum(step_durations) / len(step_durations) if step_durations else 0
     max_step_duration = max(step_durations, default=0)
 
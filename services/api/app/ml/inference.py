@@ -0,0 +1,197 @@
+"""Inference off the event loop
+
+Candidate search and model prediction are CPU-bound. Running them inside an
+async handler stalls every other request on the worker, health probes and
+ingest included. InferencePool runs them in a process pool (or, with
+inference_workers=0, a single thread) whose workers are preloaded with the
+active model. A watcher reloads the pool when the active model version
+changes in Redis: a new pool is warmed up before it replaces the old one,
+which finishes the jobs it already accepted. The number of jobs in flight
+or waiting is bounded, and callers give up after a timeout. A job keeps its
+slot until it actually finishes, not until its caller gives up, so timed-out
+jobs still running in a worker count against the bound.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, TypeVar
+
+import redis
+
+from ..config import settings
+from ..storage.redis import aget_active_model_version
+from . import model_store
+from .batching import MicroBatcher
+from .optimizer import suggest_many
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class InferenceUnavailableError(Exception):
+    """The pool cannot take or finish a job in time; retry later"""
+
+
+class InferenceOverloadedError(InferenceUnavailableError):
+    """Too many jobs already queued"""
+
+
+class InferenceTimeoutError(InferenceUnavailableError):
+    """A job did not finish within the timeout"""
+
+
+class InferencePool:
+    """Bounded, versioned pool running model work away from the event loop"""
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_queue: int = 64,
+        timeout_s: float = 5.0,
+        version_check_s: float = 30.0,
+    ) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout_s = timeout_s
+        self.version_check_s = version_check_s
+        self.version: str | None = None
+        self._executor: Executor | None = None
+        self._pending = 0
+        self._warming = False
+        self._watcher: asyncio.Task | None = None
+
+    def _new_executor(self) -> Executor:
+        if self.workers <= 0:
+            return ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        # Spawned, not forked: the API process has an event loop and threads running
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    async def _warm(self, executor: Executor, version: str) -> None:
+        # One job per worker so every process loads the model before traffic
+        loop = asyncio.get_running_loop()
+        jobs = max(1, self.workers)
+        await asyncio.gather(
+            *(loop.run_in_executor(executor, model_store.warm_up, version) for _ in range(jobs))
+        )
+
+    async def load(self, version: str) -> None:
+        """Warm a pool for a model version, then swap it in for the current one"""
+        executor = self._new_executor()
+        self._warming = self._executor is None
+        try:
+            await self._warm(executor, version)
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            self._warming = False
+        old, self._executor, self.version = self._executor, executor, version
+        if old is not None:
+            # Jobs already accepted by the old pool still finish
+            old.shutdown(wait=False)
+        logger.info("Inference pool serving model %s", version)
+
+    async def check_version(self) -> None:
+        """Reload the pool if the active model version changed"""
+        try:
+            version = await aget_active_model_version()
+        except redis.RedisError as e:
+            logger.debug("Model version check skipped: %s", e)
+            return
+        if version != self.version:
+            await self.load(version)
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.version_check_s)
+            try:
+                await self.check_version()
+            except Exception:
+                logger.exception("Inference pool reload failed")
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run fn(*args) in the pool; raises InferenceUnavailableError when saturated or slow"""
+        if self._pending >= self.max_queue:
+            raise InferenceOverloadedError(f"{self._pending} inference jobs queued")
+        if self._executor is None:
+            # Not started through the lifespan (scripts, tests): start cold
+            self._executor = self._new_executor()
+        loop = asyncio.get_running_loop()
+        job = self._executor.submit(fn, *args)
+        self._pending += 1
+        job.add_done_callback(lambda _: self._release(loop))
+        try:
+            # On timeout the job is cancelled if still queued; a running one keeps its slot
+            return await asyncio.wait_for(asyncio.wrap_future(job), self.timeout_s)
+        except TimeoutError:
+            raise InferenceTimeoutError(f"inference took longer than {self.timeout_s}s") from None
+
+    def _release(self, loop: asyncio.AbstractEventLoop) -> None:
+        # Called from the executor's thread when the job finishes or is cancelled
+        try:
+            loop.call_soon_threadsafe(self._finished)
+        except RuntimeError:
+            self._finished()  # loop already closed
+
+    def _finished(self) -> None:
+        self._pending -= 1
+
+    def warming_up(self) -> bool:
+        """Whether the first pool is still loading the model"""
+        return self._warming
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self) -> asyncio.Task:
+        """Warm up the pool in the background and watch for model version changes"""
+        self._warming = True
+        loop = asyncio.get_running_loop()
+        self._watcher = loop.create_task(self._watch())
+        return loop.create_task(self.check_version())
+
+    async def stop(self) -> None:
+        """Stop the watcher and shut the pool down"""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self.version = None
+        self._warming = False
+
+
+pool = InferencePool(
+    workers=settings.inference_workers,
+    max_queue=settings.inference_max_queue,
+    timeout_s=settings.inference_timeout_s,
+    version_check_s=settings.model_version_check_s,
+)
+
+
+SuggestRequest = tuple[dict[str, Any], dict[str, Any], dict[str, Any] | None]
+Suggestion = tuple[dict[str, Any], str, float]
+
+
+async def _suggest_batch(requests: list[SuggestRequest]) -> list[Suggestion]:
+    return await pool.run(suggest_many, requests)
+
+
+# Concurrent /optimize calls are scored together: one pool job, one model pass
+suggest_batcher: MicroBatcher[SuggestRequest, Suggestion] = MicroBatcher(
+    _suggest_batch,
+    max_wait_s=settings.optimize_batch_max_wait_ms / 1000,
+    max_size=settings.optimize_batch_max_size,
+)
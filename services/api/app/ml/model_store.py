@@ -1,14 +1,26 @@
-"""Model storage and loading"""
+"""Model storage and loading
 
+joblib, numpy and scikit-learn are imported on first use rather than at
+import time, so starting the API does not pay for them. Loaded models are
+kept per version, and warm_up() loads the active one ahead of traffic (see
+ml.inference, which runs it in every inference worker).
+"""
+
+import json
+import logging
+import threading
 from pathlib import Path
 from typing import Any
 
-import joblib
-import numpy as np
-from sklearn.ensemble import RandomForestRegressor
-
 from ..config import settings
 
+logger = logging.getLogger(__name__)
+
+# version -> loaded model, or None when no model file exists
+_models: dict[str, Any] = {}
+_models_lock = threading.Lock()
+_active_version = settings.model_version
+
 
 def get_model_path(version: str = "v1") -> Path:
     """Get path to model file"""
@@ -17,42 +29,58 @@ def get_model_path(version: str = "v1") -> Path:
 
 def save_model(model: Any, version: str, metrics: dict[str, float]) -> None:
     """Save trained model"""
+    import joblib
+
     model_path = get_model_path(version)
     model_path.parent.mkdir(parents=True, exist_ok=True)
 
     # Save model
     joblib.dump(model, model_path)
+    _models.pop(version, None)
 
     # Save metrics
     metrics_path = model_path.with_suffix(".json")
-    import json
-
     with open(metrics_path, "w") as f:
         json.dump(metrics, f, indent=2)
 
 
 def load_model(version: str = "v1") -> Any:
     """Load trained model"""
-    model_path = get_model_path(version)
-    if not model_path.exists():
+    model = get_model(version)
+    if model is None:
+        from sklearn.ensemble import RandomForestRegressor
+
         # Return default model if none exists
         return RandomForestRegressor(
             n_estimators=50,
             max_depth=10,
             random_state=42,
         )
-    return joblib.load(model_path)
+    return model
 
 
-def predict_duration(context: dict[str, Any], config: dict[str, Any]) -> float:
-    """Predict build duration given context and config"""
-    model = load_model(settings.model_version)
+def get_model(version: str) -> Any | None:
+    """Loaded model for a version, or None if it has not been trained"""
+    if version in _models:
+        return _models[version]
+    with _models_lock:
+        if version not in _models:
+            model_path = get_model_path(version)
+            if model_path.exists():
+                import joblib
+
+                _models[version] = joblib.load(model_path)
+            else:
+                _models[version] = None
+        return _models[version]
+
 
-    # Build feature vector
+def feature_row(context: dict[str, Any], config: dict[str, Any]) -> list[float]:
+    """Model input for one (context, config) pair"""
     features = {**context, **config}
 
     # Convert categorical to numeric (simple encoding for demo)
-    feature_vector = [
+    return [
         features.get("cpu_req", 4),
         features.get("mem_req_gb", 8),
         features.get("concurrency", 4),
@@ -64,11 +92,49 @@ def predict_duration(context: dict[str, Any], config: dict[str, Any]) -> float:
         features.get("avg_step_duration_s", 30),
     ]
 
-    # Predict
+
+def heuristic_duration(context: dict[str, Any], config: dict[str, Any]) -> float:
+    """Fallback estimate when no trained model can score a row"""
+    features = {**context, **config}
+    return features.get("avg_step_duration_s", 30) * features.get("num_steps", 10)
+
+
+def predict_durations(rows: list[tuple[dict[str, Any], dict[str, Any]]]) -> list[float]:
+    """Predict build durations for many (context, config) pairs in one model pass"""
+    if not rows:
+        return []
+    model = get_model(_active_version)
+    if model is not None:
+        try:
+            import numpy as np
+
+            X = np.array([feature_row(context, config) for context, config in rows])
+            return [float(pred) for pred in model.predict(X)]
+        except Exception:
+            pass
+    return [heuristic_duration(context, config) for context, config in rows]
+
+
+def predict_duration(context: dict[str, Any], config: dict[str, Any]) -> float:
+    """Predict build duration given context and config"""
+    return predict_durations([(context, config)])[0]
+
+
+def warm_up(version: str | None = None) -> str:
+    """
+    Load the active model and run one prediction through it, so the first
+    request pays neither the import nor the load. Returns the version.
+    """
+    global _active_version
     try:
-        X = np.array([feature_vector])
-        pred = model.predict(X)[0]
-        return float(pred)
+        if version is None:
+            from ..storage.redis import get_active_model_version
+
+            version = get_active_model_version()
+        get_model(version)
+        _active_version = version
+        predict_duration({}, {})
+        logger.info("Model %s warmed up", version)
     except Exception:
-        # Fallback: simple heuristic
-        return features.get("avg_step_duration_s", 30) * features.get("num_steps", 10)
+        logger.exception("Model warm-up failed; serving with the duration heuristic")
+    return _active_version
@@ -4,7 +4,7 @@ from typing import Any
 import random
 
 from ..config import settings
-from .model_store import predict_duration
+from .model_store import predict_durations
 
 # Parameter bounds
 BOUNDS = {
@@ -20,18 +20,17 @@ def clamp(v: float, lo: float, hi: float) -> float:
     return max(lo, min(hi, v))
 
 
-def candidate_configs(context: dict[str, Any]) -> list[dict[str, Any]]:
+def candidate_configs(
+    context: dict[str, Any], stats: dict[str, Any] | None = None
+) -> list[dict[str, Any]]:
     """Generate candidate configurations"""
-    # Get last successful config or defaults
-    base = context.get(
-        "last_success",
-        {
-            "concurrency": 4,
-            "cpu_req": 4,
-            "mem_req_gb": 8,
-            "cache_size_gb": 10,
-        },
-    )
+    # Get last successful config (caller's, then server-side rollup) or defaults
+    base = context.get("last_success") or (stats or {}).get("last_success") or {
+        "concurrency": 4,
+        "cpu_req": 4,
+        "mem_req_gb": 8,
+        "cache_size_gb": 10,
+    }
 
     candidates = []
 
@@ -84,11 +83,14 @@ def candidate_configs(context: dict[str, Any]) -> list[dict[str, Any]]:
 
 
 def apply_safety_guards(
-    config: dict[str, Any], context: dict[str, Any]
+    config: dict[str, Any], context: dict[str, Any], stats: dict[str, Any] | None = None
 ) -> dict[str, Any]:
     """Apply safety constraints to config"""
-    # Ensure memory is above RSS p95 * multiplier
-    rss_p95_bytes = context.get("max_rss_bytes", 0)
+    # Ensure memory is above RSS p95 * multiplier (the larger of caller and rollup)
+    rss_p95_bytes = max(
+        context.get("max_rss_bytes") or 0,
+        (stats or {}).get("rss_p95_bytes") or 0,
+    )
     min_mem_gb = max(
         BOUNDS["mem_req_gb"][0],
         int((rss_p95_bytes * settings.safe_multiplier) / (1024**3)),
@@ -104,16 +106,17 @@ def apply_safety_guards(
     return config
 
 
-def suggest(
-    context: dict[str, Any], constraints: dict[str, Any]
-) -> tuple[dict[str, Any], str, float]:
-    """
-    Generate optimization suggestions
+def plan_candidates(
+    context: dict[str, Any],
+    constraints: dict[str, Any],
+    stats: dict[str, Any] | None = None,
+) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+    """Merged context and the constrained, safety-guarded candidates to score"""
+    if stats:
+        context = {**stats, **context}
 
-    Returns: (suggestions, rationale, confidence)
-    """
     # Generate candidates
-    candidates = candidate_configs(context)
+    candidates = candidate_configs(context, stats)
 
     # Apply constraints if provided
     if constraints:
@@ -128,22 +131,21 @@ def suggest(
             for cfg in candidates:
                 cfg["mem_req_gb"] = max(cfg["mem_req_gb"], min_ram_gb)
 
-    # Score each candidate
-    best_cfg = None
-    best_pred = float("inf")
-    predictions = []
+    # Apply safety guards
+    return context, [apply_safety_guards(cfg.copy(), context, stats) for cfg in candidates]
 
-    for cfg in candidates:
-        # Apply safety guards
-        safe_cfg = apply_safety_guards(cfg.copy(), context)
 
-        # Predict duration
-        pred = predict_duration(context, safe_cfg)
-        predictions.append((safe_cfg, pred))
+def choose(
+    context: dict[str, Any], candidates: list[dict[str, Any]], preds: list[float]
+) -> tuple[dict[str, Any], str, float]:
+    """Pick the candidate with the lowest predicted duration"""
+    best_cfg = None
+    best_pred = float("inf")
 
+    for cfg, pred in zip(candidates, preds):
         if pred < best_pred:
             best_pred = pred
-            best_cfg = safe_cfg
+            best_cfg = cfg
 
     # Fallback if no candidates
     if best_cfg is None:
@@ -159,12 +161,49 @@ def suggest(
     rationale = (
         f"Selected config with predicted duration={best_pred:.1f}s "
         f"(current baseline: {context.get('duration_s', 'unknown')}s). "
-        f"Evaluated {len(predictions)} candidates. "
+        f"Evaluated {len(preds)} candidates. "
         f"Safety: mem >= {context.get('max_rss_gb', 0):.1f}GB * {settings.safe_multiplier}."
     )
 
     # Compute confidence based on prediction variance
-    pred_values = [p[1] for p in predictions]
-    confidence = 0.7 if len(pred_values) > 5 else 0.5
+    confidence = 0.7 if len(preds) > 5 else 0.5
 
     return best_cfg, rationale, confidence
+
+
+def suggest(
+    context: dict[str, Any],
+    constraints: dict[str, Any],
+    stats: dict[str, Any] | None = None,
+) -> tuple[dict[str, Any], str, float]:
+    """
+    Generate optimization suggestions
+
+    `stats` is the pipeline's server-side rollup (see ml.rollups); its values
+    fill in whatever the caller left out of `context`.
+
+    Returns: (suggestions, rationale, confidence)
+    """
+    return suggest_many([(context, constraints, stats)])[0]
+
+
+def suggest_many(
+    requests: list[tuple[dict[str, Any], dict[str, Any], dict[str, Any] | None]],
+) -> list[tuple[dict[str, Any], str, float]]:
+    """
+    Generate suggestions for many (context, constraints, stats) requests,
+    scoring every candidate of every request in a single model pass.
+    """
+    plans = [
+        plan_candidates(context, constraints or {}, stats)
+        for context, constraints, stats in requests
+    ]
+    rows = [(context, cfg) for context, candidates in plans for cfg in candidates]
+    preds = predict_durations(rows)
+
+    results = []
+    offset = 0
+    for context, candidates in plans:
+        results.append(choose(context, candidates, preds[offset : offset + len(candidates)]))
+        offset += len(candidates)
+    return results
@@ -0,0 +1,247 @@
+"""Online build duration regression detection
+
+Every successful completed run updates, in O(1), one detector per pipeline
+for the run's duration_s and one per stage for that stage's summed step
+durations. A detector keeps an EWMA baseline mean and variance and a
+one-sided CUSUM of standardized slowdowns. The baseline is frozen while the
+CUSUM is positive, so a gradual drift cannot be absorbed before it is
+flagged. When the CUSUM crosses the threshold a Regression is raised, naming
+the range from the last commit built at the baseline to the commit that
+tripped it. The detector then re-baselines at the new level. State lives in
+Redis, one key per pipeline updated with a check-and-set, so every worker
+feeds the same detectors. While Redis is unavailable, or with
+REGRESSION_STATE=memory, it lives in the worker. History is never rescanned.
+"""
+
+import json
+import logging
+import math
+from collections import defaultdict
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+from ..config import settings
+from ..middleware.metrics import build_regressions_total
+from ..storage import redis as redis_store
+
+logger = logging.getLogger(__name__)
+
+REGRESSION_CHANNEL = "im:regressions"
+RUN_SERIES = ""  # Series key of the whole run's duration; stages use their name
+
+
+@dataclass
+class DetectorConfig:
+    """Tuning shared by every series"""
+
+    alpha: float = 0.1  # EWMA weight of each new run
+    warmup_runs: int = 10  # Runs observed before alarms are possible
+    slack: float = 0.5  # CUSUM allowance k, in standard deviations
+    threshold: float = 5.0  # CUSUM decision interval h
+    min_relative_sigma: float = 0.05  # Floor on the standard deviation, relative to the mean
+    min_sigma_s: float = 5.0  # Absolute floor, so seconds-long stages do not alarm on noise
+
+
+@dataclass
+class SeriesState:
+    """EWMA baseline and CUSUM of one duration series"""
+
+    n: int = 0
+    mean: float = 0.0
+    var: float = 0.0
+    cusum: float = 0.0
+    good_commit: str | None = None  # Last commit observed at the baseline
+    first_slow_commit: str | None = None  # Commit that started the current excursion
+    slow_runs: int = 0
+    slow_sum: float = 0.0
+
+    def _absorb(self, value: float, weight: float) -> None:
+        diff = value - self.mean
+        increment = weight * diff
+        self.mean += increment
+        self.var = (1 - weight) * (self.var + diff * increment)
+
+    def update(
+        self, value: float, commit: str | None, config: DetectorConfig
+    ) -> dict[str, Any] | None:
+        """Fold one duration in; returns the regression details when it trips"""
+        self.n += 1
+        if self.n <= config.warmup_runs:
+            # Plain running mean until 1/n drops below alpha
+            self._absorb(value, max(config.alpha, 1 / self.n))
+            self.good_commit = commit
+            return None
+
+        sigma = max(math.sqrt(self.var), config.min_relative_sigma * self.mean, config.min_sigma_s)
+        started = self.cusum == 0
+        self.cusum = max(0.0, self.cusum + (value - self.mean) / sigma - config.slack)
+        if self.cusum == 0:
+            self._absorb(value, config.alpha)
+            self.good_commit = commit
+            self.first_slow_commit = None
+            self.slow_runs, self.slow_sum = 0, 0.0
+            return None
+
+        if started:
+            self.first_slow_commit = commit
+        self.slow_runs += 1
+        self.slow_sum += value
+        if self.cusum < config.threshold:
+            return None
+
+        observed = self.slow_sum / self.slow_runs
+        details = {
+            "baseline_s": self.mean,
+            "observed_s": observed,
+            "ratio": observed / self.mean if self.mean else None,
+            "runs": self.slow_runs,
+            "commit_range": {"from": self.good_commit, "to": commit},
+            "first_slow_commit": self.first_slow_commit,
+        }
+        # Re-baseline at the new level
+        self.mean = observed
+        self.cusum = 0.0
+        self.good_commit = commit
+        self.first_slow_commit = None
+        self.slow_runs, self.slow_sum = 0, 0.0
+        return details
+
+
+@dataclass
+class Regression:
+    """A pipeline, or one of its stages, that got significantly slower"""
+
+    pipeline: str
+    stage: str | None  # None for the whole run
+    run_id: str | None  # Run that tripped the detector
+    baseline_s: float
+    observed_s: float  # Mean duration since the slowdown started
+    ratio: float | None
+    runs: int  # Runs since the slowdown started
+    commit_range: dict[str, str | None] = field(default_factory=dict)
+    first_slow_commit: str | None = None
+
+
+def stage_durations(steps: Iterable[tuple[str | None, float | None]]) -> dict[str, float]:
+    """Summed step durations per stage from (stage, duration_s) pairs"""
+    totals: dict[str, float] = defaultdict(float)
+    for stage, duration_s in steps:
+        if stage and duration_s is not None:
+            totals[stage] += duration_s
+    return dict(totals)
+
+
+class RegressionDetector:
+    """Per-pipeline duration detectors with their state in Redis, or in memory"""
+
+    def __init__(
+        self,
+        config: DetectorConfig | None = None,
+        use_redis: bool = True,
+        state_ttl_s: int | None = None,
+        enabled: bool = True,
+    ) -> None:
+        self.config = config or DetectorConfig()
+        self.use_redis = use_redis
+        self.state_ttl_s = state_ttl_s
+        self.enabled = enabled
+        self.local: dict[int, dict[str, Any]] = {}
+
+    def _apply(
+        self, state: dict[str, Any] | None, series: dict[str, float], commit: str | None
+    ) -> tuple[dict[str, Any], dict[str, dict[str, Any]]]:
+        state = dict(state or {})
+        tripped = {}
+        for key, value in series.items():
+            detector = SeriesState(**state[key]) if key in state else SeriesState()
+            details = detector.update(value, commit, self.config)
+            if details is not None:
+                tripped[key] = details
+            state[key] = asdict(detector)
+        return state, tripped
+
+    async def _update(
+        self, pipeline_id: int, series: dict[str, float], commit: str | None
+    ) -> dict[str, dict[str, Any]]:
+        if self.use_redis:
+            tripped: dict[str, dict[str, Any]] = {}
+
+            def update(state: dict[str, Any] | None) -> dict[str, Any]:
+                # May run again if another worker wrote first; the last call wins
+                nonlocal tripped
+                new_state, tripped = self._apply(state, series, commit)
+                return new_state
+
+            try:
+                await redis_store.aupdate_regression_state(pipeline_id, update, self.state_ttl_s)
+                return tripped
+            except Exception as e:
+                logger.warning("Regression state unavailable in Redis, using memory: %s", e)
+
+        self.local[pipeline_id], tripped = self._apply(self.local.get(pipeline_id), series, commit)
+        return tripped
+
+    async def observe_run(
+        self,
+        pipeline_id: int,
+        pipeline: str,
+        *,
+        run_id: str | None,
+        status: str,
+        duration_s: float | None,
+        commit: str | None,
+        stages: dict[str, float] | None = None,
+    ) -> list[Regression]:
+        """Feed one completed run to its pipeline's detectors; failed runs are skipped"""
+        if not self.enabled or status != "success":
+            return []
+        series = {stage: d for stage, d in (stages or {}).items() if stage != RUN_SERIES}
+        if duration_s is not None:
+            series[RUN_SERIES] = duration_s
+        if not series:
+            return []
+
+        tripped = await self._update(pipeline_id, series, commit)
+        regressions = [
+            Regression(pipeline=pipeline, stage=key or None, run_id=run_id, **details)
+            for key, details in tripped.items()
+        ]
+        for regression in regressions:
+            await self._raise(regression)
+        return regressions
+
+    async def _raise(self, regression: Regression) -> None:
+        build_regressions_total.labels(
+            pipeline=regression.pipeline, stage=regression.stage or ""
+        ).inc()
+        logger.warning(
+            "Build regression in %s%s: %.1fs -> %.1fs over %d runs (commits %s..%s)",
+            regression.pipeline,
+            f" stage {regression.stage}" if regression.stage else "",
+            regression.baseline_s,
+            regression.observed_s,
+            regression.runs,
+            regression.commit_range.get("from"),
+            regression.commit_range.get("to"),
+        )
+        if self.use_redis:
+            try:
+                await redis_store.apublish(REGRESSION_CHANNEL, json.dumps(asdict(regression)))
+            except Exception as e:
+                logger.warning("Could not publish regression event: %s", e)
+
+
+detector = RegressionDetector(
+    config=DetectorConfig(
+        alpha=settings.regression_alpha,
+        warmup_runs=settings.regression_warmup_runs,
+        slack=settings.regression_slack,
+        threshold=settings.regression_threshold,
+        min_relative_sigma=settings.regression_min_relative_sigma,
+        min_sigma_s=settings.regression_min_sigma_s,
+    ),
+    use_redis=settings.regression_state == "redis",
+    state_ttl_s=settings.regression_state_ttl_s,
+    enabled=settings.regression_detection_enabled,
+)
@@ -0,0 +1,133 @@
+"""Per-pipeline rollup statistics"""
+
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models.orm import PipelineStats, Run, Step
+from ..storage.postgres import lock_or_create
+from .sketch import DDSketch
+
+
+def record_completed_run(
+    db: Session,
+    pipeline_id: int,
+    *,
+    status: str,
+    duration_s: float | None,
+    max_rss_bytes: int | None = None,
+    step_durations: list[float] | None = None,
+    cache_hits: int = 0,
+    cache_misses: int = 0,
+    resources: dict[str, Any] | None = None,
+) -> None:
+    """
+    Fold one completed run into its pipeline's rollup.
+
+    O(1) in history size: the row is locked, its sketches are merged with
+    the new observations and the derived percentiles are rewritten. The
+    caller owns the transaction.
+    """
+    stats = lock_or_create(db, PipelineStats, pipeline_id=pipeline_id)
+    success = status == "success"
+
+    stats.runs_total = (stats.runs_total or 0) + 1
+    if success:
+        stats.runs_success = (stats.runs_success or 0) + 1
+
+    if success and duration_s is not None:
+        durations = DDSketch.from_dict(stats.duration_sketch)
+        durations.add(duration_s)
+        stats.duration_sketch = durations.to_dict()
+        stats.duration_p50_s = durations.quantile(0.5)
+        stats.duration_p95_s = durations.quantile(0.95)
+
+    if max_rss_bytes:
+        rss = DDSketch.from_dict(stats.rss_sketch)
+        rss.add(max_rss_bytes)
+        stats.rss_sketch = rss.to_dict()
+        rss_p95 = rss.quantile(0.95)
+        stats.rss_p95_bytes = int(rss_p95) if rss_p95 is not None else None
+
+    stats.cache_hits = (stats.cache_hits or 0) + (cache_hits or 0)
+    stats.cache_misses = (stats.cache_misses or 0) + (cache_misses or 0)
+
+    if step_durations:
+        stats.step_count = (stats.step_count or 0) + len(step_durations)
+        stats.step_duration_sum_s = (stats.step_duration_sum_s or 0.0) + sum(step_durations)
+
+    if success and resources:
+        stats.last_success = {k: v for k, v in resources.items() if v is not None}
+
+    db.flush()
+
+
+def step_duration_s(step: Step) -> float | None:
+    """A step's duration: as reported, else from its start and end"""
+    if step.duration_s is not None:
+        return float(step.duration_s)
+    if step.start_ts and step.end_ts:
+        return (step.end_ts - step.start_ts).total_seconds()
+    return None
+
+
+def record_finished_run(db: Session, run: Run) -> None:
+    """Fold a finished run into its pipeline's rollup (only this run's steps are read)"""
+    steps = db.query(Step).filter(Step.run_id == run.id).all()
+    step_durations = [d for d in map(step_duration_s, steps) if d is not None]
+    duration_s = float(run.duration_s) if run.duration_s is not None else None
+
+    record_completed_run(
+        db,
+        int(run.pipeline_id),
+        status=str(run.status),
+        duration_s=duration_s,
+        max_rss_bytes=max((int(s.rss_max_bytes or 0) for s in steps), default=0),
+        step_durations=step_durations,
+        cache_hits=sum(int(s.cache_hits or 0) for s in steps),
+        cache_misses=sum(int(s.cache_misses or 0) for s in steps),
+        resources={
+            "concurrency": run.concurrency,
+            "cpu_req": run.cpu_req,
+            "mem_req_gb": run.mem_req_gb,
+        },
+    )
+
+
+def stats_context(stats: PipelineStats | None) -> dict[str, Any]:
+    """Express a rollup row as optimizer context keys"""
+    if stats is None:
+        return {}
+
+    context: dict[str, Any] = {"num_runs": stats.runs_total or 0}
+    if stats.duration_p50_s is not None:
+        context["duration_p50_s"] = stats.duration_p50_s
+        context["duration_p95_s"] = stats.duration_p95_s
+    if stats.rss_p95_bytes:
+        context["rss_p95_bytes"] = stats.rss_p95_bytes
+        context["max_rss_gb"] = stats.rss_p95_bytes / (1024**3)
+    total_cache = (stats.cache_hits or 0) + (stats.cache_misses or 0)
+    if total_cache:
+        context["cache_hit_ratio"] = (stats.cache_hits or 0) / total_cache
+    if stats.step_count:
+        context["avg_step_duration_s"] = (stats.step_duration_sum_s or 0.0) / stats.step_count
+    if stats.last_success:
+        context["last_success"] = stats.last_success
+    return context
+
+
+def get_pipeline_stats(db: Session, pipeline_id: int) -> dict[str, Any]:
+    """Get rollup statistics for a pipeline as optimizer context"""
+    return stats_context(db.get(PipelineStats, pipeline_id))
+
+
+def get_many_pipeline_stats(db: Session, pipeline_ids: list[int]) -> dict[int, dict[str, Any]]:
+    """Rollup context for many pipelines in one query; pipelines without a rollup are omitted"""
+    if not pipeline_ids:
+        return {}
+    rows = db.scalars(
+        select(PipelineStats).where(PipelineStats.pipeline_id.in_(set(pipeline_ids)))
+    )
+    stats: dict[int, dict[str, Any]] = {int(row.pipeline_id): stats_context(row) for row in rows}
+    return stats
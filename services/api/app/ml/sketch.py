@@ -0,0 +1,119 @@
+"""Mergeable quantile sketches"""
+
+import math
+from typing import Any
+
+
+class DDSketch:
+    """
+    Relative-error quantile sketch (DDSketch).
+
+    Values are counted in logarithmic buckets, so any quantile is returned
+    within `relative_accuracy` of the true value. Sketches with the same
+    accuracy merge exactly by adding bucket counts, which lets rollups be
+    updated one run at a time and combined across partitions.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048) -> None:
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, key: int) -> float:
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Add a non-negative value"""
+        if value <= 0:
+            self.zero_count += count
+        else:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + count
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def _collapse(self) -> None:
+        """Fold the lowest buckets together to stay within max_bins"""
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        folded = sum(self.bins.pop(k) for k in keys[:excess])
+        target = keys[excess]
+        self.bins[target] += folded
+
+    def merge(self, other: "DDSketch") -> None:
+        """Merge another sketch with the same accuracy into this one"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float | None:
+        """Return the approximate q-quantile, or None if empty"""
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                return min(max(self._value(key), self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float | None:
+        return self.sum / self.count if self.count else None
+
+    def to_dict(self) -> dict[str, Any]:
+        """Serialize to a JSON-compatible dict"""
+        return {
+            "alpha": self.relative_accuracy,
+            "bins": {str(k): v for k, v in self.bins.items()},
+            "zero": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any] | None, relative_accuracy: float = 0.01) -> "DDSketch":
+        """Deserialize a sketch produced by to_dict (None gives an empty sketch)"""
+        if not data:
+            return cls(relative_accuracy)
+        sketch = cls(data.get("alpha", relative_accuracy))
+        sketch.bins = {int(k): v for k, v in data.get("bins", {}).items()}
+        sketch.zero_count = data.get("zero", 0)
+        sketch.count = data.get("count", 0)
+        sketch.sum = data.get("sum", 0.0)
+        if sketch.count:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
@@ -8,8 +8,8 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
 from sklearn.model_selection import train_test_split
 
-from ..models.orm import Model, Pipeline, Run
-from ..storage.postgres import SessionLocal
+from ..models.orm import Model, Run
+from ..storage.postgres import ReadSessionLocal, SessionLocal, get_pipeline_id
 from .features import build_feature_matrix
 from .model_store import save_model
 from ..storage.redis import set_active_model_version
@@ -18,16 +18,16 @@ from ..storage.redis import set_active_model_version
 def prepare_data(
     pipeline_name: str | None = None, limit: int = 500
 ) -> tuple[pd.DataFrame, pd.Series]:
-    """Prepare training data"""
-    session = SessionLocal()
+    """Prepare training data (reads from the replica when available)"""
+    session = ReadSessionLocal()
 
     try:
         query = session.query(Run).filter(Run.status == "success")
 
         if pipeline_name:
-            pipeline = session.query(Pipeline).filter(Pipeline.name == pipeline_name).first()
-            if pipeline:
-                query = query.filter(Run.pipeline_id == pipeline.id)
+            pipeline_id = get_pipeline_id(session, pipeline_name)
+            if pipeline_id is not None:
+                query = query.filter(Run.pipeline_id == pipeline_id)
 
         runs = query.order_by(Run.started_at.desc()).limit(limit).all()
 
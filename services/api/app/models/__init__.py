@@ -1,6 +1,16 @@
 """Data models"""
 
-from .orm import Base, Pipeline, Run, Step, Feature, Suggestion, Model
+from .orm import (
+    Base,
+    Pipeline,
+    Run,
+    Step,
+    Feature,
+    Suggestion,
+    Model,
+    PipelineStats,
+    PipelinePeriodStats,
+)
 from .schemas import (
     BuildStartReq,
     BuildStepReq,
@@ -19,6 +29,8 @@ __all__ = [
     "Feature",
     "Suggestion",
     "Model",
+    "PipelineStats",
+    "PipelinePeriodStats",
     "BuildStartReq",
     "BuildStepReq",
     "BuildCompleteReq",
@@ -12,6 +12,7 @@ from sqlalchemy import (
     ForeignKey,
     JSON,
     Index,
+    LargeBinary,
 )
 from sqlalchemy.orm import relationship, declarative_base
 
@@ -30,6 +31,7 @@ class Pipeline(Base):
 
     runs = relationship("Run", back_populates="pipeline")
     suggestions = relationship("Suggestion", back_populates="pipeline")
+    stats = relationship("PipelineStats", back_populates="pipeline", uselist=False)
 
 
 class Run(Base):
@@ -62,7 +64,10 @@ class Run(Base):
     features = relationship("Feature", back_populates="run")
     suggestions = relationship("Suggestion", back_populates="run")
 
-    __table_args__ = (Index("idx_pipeline_started", "pipeline_id", "started_at"),)
+    __table_args__ = (
+        Index("idx_pipeline_started", "pipeline_id", "started_at"),
+        Index("idx_runs_started", "started_at"),
+    )
 
 
 class Step(Base):
@@ -89,7 +94,40 @@ class Step(Base):
 
     run = relationship("Run", back_populates="steps")
 
-    __table_args__ = (Index("idx_run_stage_step", "run_id", "stage", "step"),)
+    __table_args__ = (
+        Index("idx_run_stage_step", "run_id", "stage", "step"),
+        # Step events are merged into one row per span
+        Index("uq_steps_run_span", "run_id", "span_id", unique=True),
+    )
+
+
+class StepSeriesBlock(Base):
+    """Block of one step's resource samples, delta-encoded (see storage.series)"""
+
+    __tablename__ = "step_series"
+
+    # No foreign key: steps may be partitioned, so its id alone is not a key
+    step_id = Column(Integer, primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    start_ms = Column(BigInteger, nullable=False)  # First sample, epoch milliseconds
+    end_ms = Column(BigInteger, nullable=False)  # Last sample
+    count = Column(Integer, nullable=False)
+    summary = Column(JSON)  # metric -> [min, max] over the block
+    data = Column(LargeBinary, nullable=False)
+
+
+class NodeSeriesBlock(Base):
+    """Block of one build node's agent-wide resource samples (see storage.series)"""
+
+    __tablename__ = "node_series"
+
+    node = Column(String, primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    start_ms = Column(BigInteger, nullable=False)
+    end_ms = Column(BigInteger, nullable=False)
+    count = Column(Integer, nullable=False)
+    summary = Column(JSON)
+    data = Column(LargeBinary, nullable=False)
 
 
 class Feature(Base):
@@ -129,6 +167,45 @@ class Suggestion(Base):
     run = relationship("Run", back_populates="suggestions")
 
 
+class PipelineStats(Base):
+    """Per-pipeline rollup statistics, updated incrementally on each completed run"""
+
+    __tablename__ = "pipeline_stats"
+
+    pipeline_id = Column(Integer, ForeignKey("pipelines.id"), primary_key=True)
+    runs_total = Column(Integer, default=0)
+    runs_success = Column(Integer, default=0)
+    duration_p50_s = Column(Float)
+    duration_p95_s = Column(Float)
+    rss_p95_bytes = Column(BigInteger)
+    cache_hits = Column(BigInteger, default=0)
+    cache_misses = Column(BigInteger, default=0)
+    step_count = Column(BigInteger, default=0)
+    step_duration_sum_s = Column(Float, default=0.0)
+    duration_sketch = Column(JSON)  # DDSketch of successful run durations
+    rss_sketch = Column(JSON)  # DDSketch of per-run peak RSS
+    last_success = Column(JSON)  # Resources of the latest successful run
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    pipeline = relationship("Pipeline", back_populates="stats")
+
+
+class PipelinePeriodStats(Base):
+    """Monthly summaries of runs removed by the retention policy"""
+
+    __tablename__ = "pipeline_period_stats"
+
+    pipeline_id = Column(Integer, ForeignKey("pipelines.id"), primary_key=True)
+    period_start = Column(DateTime, primary_key=True)  # First day of the month
+    runs_total = Column(Integer, default=0)
+    runs_success = Column(Integer, default=0)
+    duration_sum_s = Column(Float, default=0.0)
+    step_count = Column(BigInteger, default=0)
+    duration_sketch = Column(JSON)  # DDSketch of successful run durations
+    rss_sketch = Column(JSON)  # DDSketch of per-run peak RSS
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class Model(Base):
     """ML model metadata"""
 
@@ -3,7 +3,7 @@
 from datetime import datetime
 from typing import Any
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 class BuildStartReq(BaseModel):
@@ -32,6 +32,20 @@ class BuildStepReq(BaseModel):
     counters: dict[str, Any] = Field(default_factory=dict)
 
 
+class BuildStepBatchReq(BaseModel):
+    """Step start/stop events in any order, merged per span"""
+
+    events: list[BuildStepReq] = Field(min_length=1, max_length=1000)
+
+
+class BuildStepBatchResp(BaseModel):
+    """Step event batch response"""
+
+    ok: bool
+    steps: int  # spans written
+    unknown_runs: list[str] = Field(default_factory=list)  # not started yet; retry later
+
+
 class BuildCompleteReq(BaseModel):
     """Build completion request"""
 
@@ -59,6 +73,18 @@ class OptimizeResp(BaseModel):
     confidence: float
 
 
+class OptimizeBatchReq(BaseModel):
+    """Batch optimization request, e.g. one item per matrix cell"""
+
+    items: list[OptimizeReq] = Field(min_length=1, max_length=500)
+
+
+class OptimizeBatchResp(BaseModel):
+    """Batch optimization response, in request order"""
+
+    results: list[OptimizeResp]
+
+
 class FeatureResp(BaseModel):
     """Feature vector response"""
 
@@ -68,6 +94,14 @@ class FeatureResp(BaseModel):
     created_at: datetime
 
 
+class DependencyHealth(BaseModel):
+    """Last probe of one dependency"""
+
+    status: str  # "up" or "down"
+    latency_ms: float
+    error: str | None = None
+
+
 class HealthResp(BaseModel):
     """Health check response"""
 
@@ -75,6 +109,8 @@ class HealthResp(BaseModel):
     version: str
     timestamp: datetime
     database: str | None = None
+    checked_age_s: float | None = None  # Seconds since dependencies were last probed
+    dependencies: dict[str, DependencyHealth] = Field(default_factory=dict)
 
 
 class RunStepReq(BaseModel):
@@ -91,6 +127,49 @@ class RunStepReq(BaseModel):
     exit_code: int
 
 
+class RunStepColumns(BaseModel):
+    """Run steps as parallel arrays, one entry per step; timestamps in epoch seconds"""
+
+    name: list[str]
+    start_ts: list[float]
+    end_ts: list[float]
+    duration_s: list[float]
+    cpu_usage_pct: list[float]
+    rss_max_bytes: list[int]
+    io_r_bytes: list[int]
+    io_w_bytes: list[int]
+    exit_code: list[int]
+
+    @model_validator(mode="after")
+    def _same_length(self) -> "RunStepColumns":
+        lengths = {len(getattr(self, field)) for field in type(self).model_fields}
+        if len(lengths) > 1:
+            raise ValueError("step columns must all have the same length")
+        return self
+
+    def __len__(self) -> int:
+        return len(self.name)
+
+    @classmethod
+    def from_steps(cls, steps: list[RunStepReq]) -> "RunStepColumns":
+        """Transpose per-step objects, parsing their ISO timestamps"""
+
+        def epoch(ts: str) -> float:
+            return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+
+        return cls.model_construct(
+            name=[s.name for s in steps],
+            start_ts=[epoch(s.start_time) for s in steps],
+            end_ts=[epoch(s.end_time) for s in steps],
+            duration_s=[s.duration_s for s in steps],
+            cpu_usage_pct=[s.cpu_usage_pct for s in steps],
+            rss_max_bytes=[s.rss_max_bytes for s in steps],
+            io_r_bytes=[s.io_r_bytes for s in steps],
+            io_w_bytes=[s.io_w_bytes for s in steps],
+            exit_code=[s.exit_code for s in steps],
+        )
+
+
 class RunIngestReq(BaseModel):
     """Complete run ingestion request"""
 
@@ -106,7 +185,21 @@ class RunIngestReq(BaseModel):
     concurrency: int
     cpu_req: int
     mem_req_gb: int
-    steps: list[RunStepReq]
+    steps: list[RunStepReq] = Field(default_factory=list)
+    # Columnar alternative to steps, much cheaper to validate for large runs
+    step_columns: RunStepColumns | None = None
+
+    @model_validator(mode="after")
+    def _one_step_format(self) -> "RunIngestReq":
+        if self.steps and self.step_columns is not None:
+            raise ValueError("send either steps or step_columns, not both")
+        return self
+
+    def columns(self) -> RunStepColumns:
+        """Steps in columnar form, whichever format they were sent in"""
+        if self.step_columns is not None:
+            return self.step_columns
+        return RunStepColumns.from_steps(self.steps)
 
 
 class RunIngestResp(BaseModel):
@@ -114,3 +207,14 @@ class RunIngestResp(BaseModel):
 
     status: str
     run_id: int
+
+
+class StepSeriesResp(BaseModel):
+    """A step's resource time series at a requested resolution"""
+
+    step_id: int
+    metric: str
+    method: str  # "lttb" or "minmax"
+    samples: int  # Raw samples in the range
+    blocks_decoded: int  # 0 when answered from block summaries
+    points: list[list[int | float]]  # [ts_ms, value] (lttb) or [ts_ms, min, max] (minmax)
@@ -1,30 +1,89 @@
 """Build tracking endpoints"""
 
-from datetime import datetime
+from datetime import UTC, datetime
+from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from ..deps import get_db
-from ..models.orm import Pipeline, Run, Step
-from ..models.schemas import BuildStartReq, BuildStepReq, BuildCompleteReq
+from ..ml.regressions import detector, stage_durations
+from ..ml.rollups import record_finished_run, step_duration_s
+from ..models.orm import Run, Step
+from ..models.schemas import (
+    BuildCompleteReq,
+    BuildStartReq,
+    BuildStepBatchReq,
+    BuildStepBatchResp,
+    BuildStepReq,
+)
+from ..storage.postgres import STEP_COUNTERS, get_or_create_pipeline_id, upsert_steps
 
 router = APIRouter()
 
+MERGED_COLUMNS = ("run_id", "span_id", "stage", "step", "start_ts", "end_ts", *STEP_COUNTERS)
+
+
+def _utc(ts: datetime) -> datetime:
+    # Steps store naive UTC
+    if ts.tzinfo is None:
+        return ts
+    return ts.astimezone(UTC).replace(tzinfo=None)
+
+
+def merge_step_events(
+    events: list[BuildStepReq], run_ids: dict[str, int]
+) -> list[dict[str, Any]]:
+    """
+    One row per (run, span_id). Start events give start_ts, stop events end_ts
+    and counters; a column no event in the batch set is None.
+    """
+    rows: dict[tuple[int, str], dict[str, Any]] = {}
+    for event in events:
+        key = (run_ids[event.run_id], event.span_id)
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = dict.fromkeys(MERGED_COLUMNS)
+            row.update(run_id=key[0], span_id=key[1])
+        row["stage"] = event.stage
+        row["step"] = event.step
+        ts = _utc(event.timestamp)
+        if event.event == "start":
+            row["start_ts"] = min(ts, row["start_ts"] or ts)
+        elif event.event == "stop":
+            row["end_ts"] = max(ts, row["end_ts"] or ts)
+            for counter in STEP_COUNTERS:
+                row[counter] = event.counters.get(counter)
+    return list(rows.values())
+
+
+def upsert_step_events(db: Session, events: list[BuildStepReq]) -> tuple[int, list[str]]:
+    """
+    Merge step events into the steps table by span_id, in one upsert.
+    Replaying an event, or receiving a stop before its start, gives the same
+    row. Returns the number of spans written and the run ids not yet started,
+    whose events are skipped.
+    """
+    wanted = {event.run_id for event in events}
+    run_ids: dict[str, int] = dict(
+        db.execute(select(Run.run_id, Run.id).where(Run.run_id.in_(wanted))).all()
+    )
+    unknown_runs = sorted(wanted - run_ids.keys())
+    rows = merge_step_events([e for e in events if e.run_id in run_ids], run_ids)
+    upsert_steps(db, rows)
+    return len(rows), unknown_runs
+
 
 @router.post("/start")
 async def build_start(req: BuildStartReq, db: Session = Depends(get_db)) -> dict[str, bool]:
     """Record build start"""
     # Get or create pipeline
-    pipeline = db.query(Pipeline).filter(Pipeline.name == req.pipeline).first()
-    if not pipeline:
-        pipeline = Pipeline(name=req.pipeline, repo=req.git or "unknown")
-        db.add(pipeline)
-        db.flush()
+    pipeline_id = get_or_create_pipeline_id(db, req.pipeline, repo=req.git or "unknown")
 
     # Create run record
     run = Run(
-        pipeline_id=pipeline.id,
+        pipeline_id=pipeline_id,
         run_id=req.run_id,
         status="running",
         image=req.image,
@@ -45,53 +104,31 @@ async def build_start(req: BuildStartReq, db: Session = Depends(get_db)) -> dict
 @router.post("/step")
 async def build_step(req: BuildStepReq, db: Session = Depends(get_db)) -> dict[str, bool]:
     """Record build step event"""
-    # Find or create step
-    step = (
-        db.query(Step)
-        .filter(
-            Step.run_id == req.run_id,
-            Step.stage == req.stage,
-            Step.step == req.step,
-        )
-        .first()
-    )
+    _, unknown_runs = upsert_step_events(db, [req])
+    if unknown_runs:
+        raise HTTPException(status_code=404, detail="Run not found")
+    db.commit()
+    return {"ok": True}
 
-    if req.event == "start":
-        if not step:
-            step = Step(
-                run_id=req.run_id,
-                stage=req.stage,
-                step=req.step,
-                span_id=req.span_id,
-                start_ts=req.timestamp,
-            )
-            db.add(step)
-        else:
-            step.start_ts = req.timestamp
-            step.span_id = req.span_id
-
-    elif req.event == "stop":
-        if not step:
-            raise HTTPException(status_code=404, detail="Step not found")
-
-        step.end_ts = req.timestamp
-        step.cpu_time_s = req.counters.get("cpu_time_s")
-        step.rss_max_bytes = req.counters.get("rss_max_bytes")
-        step.io_r_bytes = req.counters.get("io_r_bytes")
-        step.io_w_bytes = req.counters.get("io_w_bytes")
-        step.cache_hits = req.counters.get("cache_hits", 0)
-        step.cache_misses = req.counters.get("cache_misses", 0)
 
+@router.post("/steps:batch")
+async def build_steps_batch(
+    req: BuildStepBatchReq, db: Session = Depends(get_db)
+) -> BuildStepBatchResp:
+    """Record step events in bulk; starts and stops may arrive in any order"""
+    steps, unknown_runs = upsert_step_events(db, req.events)
     db.commit()
-    return {"ok": True}
+    return BuildStepBatchResp(ok=True, steps=steps, unknown_runs=unknown_runs)
 
 
 @router.post("/complete")
 async def build_complete(req: BuildCompleteReq, db: Session = Depends(get_db)) -> dict[str, bool]:
     """Record build completion"""
-    run = db.query(Run).filter(Run.run_id == req.run_id).first()
+    # Locked, so concurrent retries see each other's status
+    run = db.query(Run).filter(Run.run_id == req.run_id).with_for_update().first()
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
+    was_running = run.status == "running"
 
     run.status = req.status
     run.duration_s = req.duration_s
@@ -100,8 +137,31 @@ async def build_complete(req: BuildCompleteReq, db: Session = Depends(get_db)) -
     # Calculate artifact size
     run.artifact_bytes = sum(a.get("size", 0) for a in req.artifacts)
 
+    # Fold into the pipeline rollup (only this run's steps are read), once:
+    # a retried completion must not count the run again
+    if was_running:
+        record_finished_run(db, run)
+        stages = stage_durations(
+            (None if s.stage is None else str(s.stage), step_duration_s(s))
+            for s in db.query(Step).filter(Step.run_id == run.id)
+        )
+        pipeline_id, pipeline = int(run.pipeline_id), str(run.pipeline.name)
+        commit = None if run.commit is None else str(run.commit)
+
     db.commit()
 
+    # Regression detection once the run is durable, and once per run
+    if was_running:
+        await detector.observe_run(
+            pipeline_id,
+            pipeline,
+            run_id=req.run_id,
+            status=req.status,
+            duration_s=req.duration_s,
+            commit=commit,
+            stages=stages,
+        )
+
     # Trigger feature computation and model training (async in production)
     # TODO: Add to task queue
 
@@ -0,0 +1,238 @@
+"""Streaming export endpoints"""
+
+import csv
+import io
+import json
+from collections.abc import Callable, Iterator
+from datetime import datetime
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import DateTime, Float, Integer, Select, select, tuple_
+from sqlalchemy.orm import Session
+
+from ..deps import get_read_db, verify_api_key
+from ..models.orm import Run, Step
+from ..storage.postgres import ReadSessionLocal, get_pipeline_id
+
+router = APIRouter()
+
+# Keyset columns lead each export, in idx_pipeline_started order with ids as tie-breakers
+RUN_KEY = [Run.pipeline_id, Run.started_at, Run.id]
+RUN_COLUMNS = [
+    *RUN_KEY,
+    Run.run_id,
+    Run.build_number,
+    Run.status,
+    Run.duration_s,
+    Run.finished_at,
+    Run.image,
+    Run.node,
+    Run.tool,
+    Run.cpu_req,
+    Run.mem_req_gb,
+    Run.concurrency,
+    Run.artifact_bytes,
+    Run.cost_cents,
+    Run.branch,
+    Run.commit,
+]
+
+STEP_KEY = [Run.pipeline_id, Run.started_at, Step.run_id, Step.id]
+STEP_COLUMNS = [
+    Run.pipeline_id,
+    Run.started_at.label("run_started_at"),
+    Step.run_id,
+    Step.id,
+    Step.name,
+    Step.stage,
+    Step.step,
+    Step.span_id,
+    Step.start_ts,
+    Step.end_ts,
+    Step.duration_s,
+    Step.cpu_time_s,
+    Step.rss_max_bytes,
+    Step.io_r_bytes,
+    Step.io_w_bytes,
+    Step.cache_hits,
+    Step.cache_misses,
+    Step.exit_code,
+]
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+Page = list[tuple]
+
+
+def _keyset_pages(stmt: Select, key: list[Any], page_size: int) -> Iterator[Page]:
+    """
+    Yield pages of rows in key order.
+
+    Each page is a fresh `WHERE key > last ORDER BY key LIMIT n` query read
+    through a server-side cursor, so memory stays constant and no OFFSET
+    scan is ever issued. The transaction is released between pages.
+    """
+    db = ReadSessionLocal()
+    try:
+        last: tuple | None = None
+        while True:
+            page_stmt = stmt.order_by(*key).limit(page_size)
+            if last is not None:
+                page_stmt = page_stmt.where(tuple_(*key) > tuple_(*last))
+            result = db.execute(
+                page_stmt.execution_options(stream_results=True, yield_per=1000)
+            )
+            rows = [tuple(row) for row in result]
+            db.rollback()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < page_size:
+                return
+            last = rows[-1][: len(key)]
+    finally:
+        db.close()
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _encode_csv(names: list[str], columns: list[Any], pages: Iterator[Page]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(names)
+    for rows in pages:
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+def _encode_ndjson(
+    names: list[str], columns: list[Any], pages: Iterator[Page]
+) -> Iterator[bytes]:
+    for rows in pages:
+        yield "".join(
+            json.dumps(dict(zip(names, row)), default=_json_default) + "\n" for row in rows
+        ).encode()
+
+
+def _arrow_type(column: Any) -> Any:
+    import pyarrow as pa
+
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+def _encode_arrow(names: list[str], columns: list[Any], pages: Iterator[Page]) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    schema = pa.schema([(name, _arrow_type(col)) for name, col in zip(names, columns)])
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+    for rows in pages:
+        arrays = [
+            pa.array([row[i] for row in rows], type=field.type)
+            for i, field in enumerate(schema)
+        ]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    writer.close()
+    yield sink.getvalue()
+
+
+ENCODERS: dict[str, Callable[[list[str], list[Any], Iterator[Page]], Iterator[bytes]]] = {
+    "csv": _encode_csv,
+    "ndjson": _encode_ndjson,
+    "arrow": _encode_arrow,
+}
+
+
+def _export(
+    kind: str,
+    stmt: Select,
+    columns: list[Any],
+    key: list[Any],
+    fmt: str,
+    page_size: int,
+) -> StreamingResponse:
+    if fmt == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=400, detail="Arrow export requires pyarrow")
+
+    names = [col.key for col in columns]
+    pages = _keyset_pages(stmt, key, page_size)
+    return StreamingResponse(
+        ENCODERS[fmt](names, columns, pages),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{fmt}"'},
+    )
+
+
+def _filter_runs(
+    stmt: Select,
+    db: Session,
+    pipeline: str | None,
+    since: datetime | None,
+    until: datetime | None,
+) -> Select:
+    stmt = stmt.where(Run.started_at.isnot(None))
+    if pipeline:
+        pipeline_id = get_pipeline_id(db, pipeline)
+        if pipeline_id is None:
+            raise HTTPException(status_code=404, detail="Pipeline not found")
+        stmt = stmt.where(Run.pipeline_id == pipeline_id)
+    if since:
+        stmt = stmt.where(Run.started_at >= since)
+    if until:
+        stmt = stmt.where(Run.started_at < until)
+    return stmt
+
+
+@router.get("/runs", dependencies=[Depends(verify_api_key)])
+def export_runs(
+    format: str = Query("ndjson", pattern="^(csv|ndjson|arrow)$"),
+    pipeline: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    page_size: int = Query(5000, ge=1, le=50000),
+    db: Session = Depends(get_read_db),
+) -> StreamingResponse:
+    """Stream runs ordered by (pipeline_id, started_at)"""
+    stmt = _filter_runs(select(*RUN_COLUMNS), db, pipeline, since, until)
+    return _export("runs", stmt, RUN_COLUMNS, RUN_KEY, format, page_size)
+
+
+@router.get("/steps", dependencies=[Depends(verify_api_key)])
+def export_steps(
+    format: str = Query("ndjson", pattern="^(csv|ndjson|arrow)$"),
+    pipeline: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    page_size: int = Query(5000, ge=1, le=50000),
+    db: Session = Depends(get_read_db),
+) -> StreamingResponse:
+    """Stream steps ordered by their run's (pipeline_id, started_at)"""
+    stmt = select(*STEP_COLUMNS).join(Run, Step.run_id == Run.id)
+    stmt = _filter_runs(stmt, db, pipeline, since, until)
+    return _export("steps", stmt, STEP_COLUMNS, STEP_KEY, format, page_size)
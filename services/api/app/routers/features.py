@@ -1,37 +1,56 @@
 """Feature endpoints"""
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 
-from ..deps import get_db
+from ..deps import get_read_db
+from ..middleware.conditional import CACHE_CONTROL, etag_matches, make_etag, not_modified
 from ..models.orm import Feature
 from ..models.schemas import FeatureResp
-from ..storage.redis import get_cached_features
+from ..storage import feature_cache
 
 router = APIRouter()
 
 
 @router.get("/{run_id}", response_model=FeatureResp)
-async def get_features(run_id: str, db: Session = Depends(get_db)) -> FeatureResp:
+async def get_features(
+    run_id: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+) -> FeatureResp | Response:
     """Get feature vector for a run"""
-    # Try cache first
-    cached = get_cached_features(run_id)
-    if cached:
-        return FeatureResp(
-            run_id=run_id,
-            vector=cached["vector"],
-            label=cached.get("label"),
-            created_at=cached["created_at"],
+    # Try cache first (in-process LRU, then Redis)
+    hit, cached = await feature_cache.aget(run_id)
+    if hit and cached is None:
+        raise HTTPException(status_code=404, detail="Features not found")
+
+    if cached is None:
+        # Query database
+        feature = db.query(Feature).filter(Feature.run_id == run_id).first()
+        if not feature:
+            await feature_cache.aput_missing(run_id)
+            raise HTTPException(status_code=404, detail="Features not found")
+
+        cached = await feature_cache.aput(
+            run_id,
+            {
+                "vector": feature.vector,
+                "label": feature.label,
+                "created_at": feature.created_at.isoformat(),
+            },
         )
 
-    # Query database
-    feature = db.query(Feature).filter(Feature.run_id == run_id).first()
-    if not feature:
-        raise HTTPException(status_code=404, detail="Features not found")
+    # Entries cached before ETags existed are hashed on the fly
+    etag = cached.get("etag") or make_etag(cached)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
 
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
     return FeatureResp(
-        run_id=feature.run_id,
-        vector=feature.vector,
-        label=feature.label,
-        created_at=feature.created_at,
+        run_id=run_id,
+        vector=cached["vector"],
+        label=cached.get("label"),
+        created_at=cached["created_at"],
     )
@@ -1,63 +1,79 @@
-"""Health check endpoints"""
+"""Health check endpoints
+
+Both probes answer from the results of the background HealthProber, so a
+probe never waits on the database or Redis behind real traffic.
+"""
 
 from datetime import datetime
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Response
 
 from ..config import settings
-from ..deps import get_db
-from ..models.schemas import HealthResp
-from ..storage.redis import redis_client
+from ..ml import inference
+from ..models.schemas import DependencyHealth, HealthResp
+from ..storage.health import prober
 
 router = APIRouter()
 
 
+def _dependencies() -> dict[str, DependencyHealth]:
+    return {
+        name: DependencyHealth(
+            status="up" if result.ok else "down",
+            latency_ms=result.latency_ms,
+            error=result.error,
+        )
+        for name, result in prober.results.items()
+    }
+
+
+def _age() -> float | None:
+    age = prober.age_s
+    return None if age is None else round(age, 3)
+
+
 @router.get("/healthz", response_model=HealthResp)
-async def healthz(db: Session = Depends(get_db)) -> HealthResp:
+async def healthz() -> HealthResp:
     """Health check - liveness probe"""
-    # Check database
-    db_status = "connected"
-    try:
-        from sqlalchemy import text
-        db.execute(text("SELECT 1"))
-    except Exception:
-        db_status = "error"
-
+    results = await prober.current()
+    database = results.get("database")
     return HealthResp(
         status="ok",
         version=settings.api_version,
         timestamp=datetime.utcnow(),
-        database=db_status,
+        database=None if database is None else "connected" if database.ok else "error",
+        checked_age_s=_age(),
+        dependencies=_dependencies(),
     )
 
 
 @router.get("/readyz", response_model=HealthResp)
-async def readyz(db: Session = Depends(get_db)) -> HealthResp:
-    """Readiness check - includes dependencies"""
-    # Check database
-    try:
-        from sqlalchemy import text
-        db.execute(text("SELECT 1"))
-    except Exception as e:
-        return HealthResp(
-            status=f"error: database unavailable - {e}",
-            version=settings.api_version,
-            timestamp=datetime.utcnow(),
-        )
-
-    # Check Redis
-    try:
-        redis_client.ping()
-    except Exception as e:
-        return HealthResp(
-            status=f"error: redis unavailable - {e}",
-            version=settings.api_version,
-            timestamp=datetime.utcnow(),
-        )
+async def readyz(response: Response) -> HealthResp:
+    """Readiness check - includes dependencies and model warm-up"""
+    results = await prober.current()
+    status = "ready"
+    if inference.pool.warming_up():
+        status = "error: model warming up"
+    elif prober.stale:
+        status = f"error: health checks stale - last run {_age()}s ago"
+    else:
+        for name in sorted(prober.required):
+            result = results.get(name)
+            if result is None or not result.ok:
+                error = result.error if result else "not checked"
+                status = f"error: {name} unavailable - {error}"
+                break
+        else:
+            # Optional dependencies down: still serving, without them
+            if prober.degraded:
+                status = f"degraded: {', '.join(prober.degraded)} unavailable"
 
+    if status.startswith("error"):
+        response.status_code = 503
     return HealthResp(
-        status="ready",
+        status=status,
         version=settings.api_version,
         timestamp=datetime.utcnow(),
+        checked_age_s=_age(),
+        dependencies=_dependencies(),
     )
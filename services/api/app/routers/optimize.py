@@ -1,31 +1,60 @@
 """Optimization endpoint"""
 
-from fastapi import APIRouter, Depends
+import logging
+
+import redis
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 from ..deps import get_db, verify_api_key
-from ..ml.optimizer import suggest
-from ..models.schemas import OptimizeReq, OptimizeResp
-from ..models.orm import Suggestion, Pipeline
-from ..storage.redis import cache_suggestion
+from ..ml.inference import InferenceUnavailableError, pool, suggest_batcher
+from ..ml.optimizer import suggest_many
+from ..ml.rollups import get_many_pipeline_stats, get_pipeline_stats
+from ..models.schemas import OptimizeBatchReq, OptimizeBatchResp, OptimizeReq, OptimizeResp
+from ..models.orm import Suggestion
+from ..storage.postgres import get_pipeline_id
+from ..storage.redis import acache_suggestion, acache_suggestions
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def _busy(e: InferenceUnavailableError) -> HTTPException:
+    """503 with Retry-After for a saturated or slow inference pool"""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
 @router.post("/optimize", response_model=OptimizeResp, dependencies=[Depends(verify_api_key)])
 async def optimize(req: OptimizeReq, db: Session = Depends(get_db)) -> OptimizeResp:
     """Get optimization suggestions"""
-    # Call ML optimizer
-    suggestions, rationale, confidence = suggest(req.context, req.constraints or {})
+    pipeline_id = get_pipeline_id(db, req.pipeline)
+
+    # Server-side rollup fills in context the caller did not send
+    stats = get_pipeline_stats(db, pipeline_id) if pipeline_id is not None else None
 
-    # Cache suggestion
-    cache_suggestion(req.pipeline, suggestions)
+    # End the read transaction so the connection is not held while waiting on inference
+    db.commit()
+
+    # Call ML optimizer (off the event loop, batched with concurrent requests)
+    try:
+        suggestions, rationale, confidence = await suggest_batcher.submit(
+            (req.context, req.constraints or {}, stats)
+        )
+    except InferenceUnavailableError as e:
+        raise _busy(e)
+
+    # Cache suggestion (best effort: the response never waits on a degraded Redis)
+    try:
+        await acache_suggestion(req.pipeline, suggestions)
+    except redis.RedisError as e:
+        logger.warning("Suggestion cache write failed: %s", e)
 
     # Store in database
-    pipeline = db.query(Pipeline).filter(Pipeline.name == req.pipeline).first()
-    if pipeline:
+    if pipeline_id is not None:
         suggestion_record = Suggestion(
-            pipeline_id=pipeline.id,
+            pipeline_id=pipeline_id,
             run_id=req.run_id,
             payload={
                 "suggestions": suggestions,
@@ -43,3 +72,64 @@ async def optimize(req: OptimizeReq, db: Session = Depends(get_db)) -> OptimizeR
         rationale=rationale,
         confidence=confidence,
     )
+
+
+@router.post(
+    "/optimize/batch",
+    response_model=OptimizeBatchResp,
+    dependencies=[Depends(verify_api_key)],
+)
+async def optimize_batch(req: OptimizeBatchReq, db: Session = Depends(get_db)) -> OptimizeBatchResp:
+    """
+    Get optimization suggestions for many items (e.g. the cells of a build
+    matrix) with one rollup query, one model pass and one insert
+    """
+    pipeline_ids = {item.pipeline: get_pipeline_id(db, item.pipeline) for item in req.items}
+    stats = get_many_pipeline_stats(db, [p for p in pipeline_ids.values() if p is not None])
+    pipeline_stats = {name: stats.get(p) for name, p in pipeline_ids.items() if p is not None}
+    db.commit()
+
+    try:
+        results = await pool.run(
+            suggest_many,
+            [
+                (item.context, item.constraints or {}, pipeline_stats.get(item.pipeline))
+                for item in req.items
+            ],
+        )
+    except InferenceUnavailableError as e:
+        raise _busy(e)
+
+    # Last suggestion per pipeline, as if the items had been sent one by one
+    try:
+        await acache_suggestions(
+            {item.pipeline: suggestions for item, (suggestions, _, _) in zip(req.items, results)}
+        )
+    except redis.RedisError as e:
+        logger.warning("Suggestion cache write failed: %s", e)
+
+    rows = [
+        {
+            "pipeline_id": pipeline_ids[item.pipeline],
+            "run_id": item.run_id,
+            "payload": {
+                "suggestions": suggestions,
+                "rationale": rationale,
+                "confidence": confidence,
+                "context": item.context,
+            },
+            "applied": False,
+        }
+        for item, (suggestions, rationale, confidence) in zip(req.items, results)
+        if pipeline_ids[item.pipeline] is not None
+    ]
+    if rows:
+        db.execute(insert(Suggestion), rows)
+        db.commit()
+
+    return OptimizeBatchResp(
+        results=[
+            OptimizeResp(suggestions=suggestions, rationale=rationale, confidence=confidence)
+            for suggestions, rationale, confidence in results
+        ]
+    )
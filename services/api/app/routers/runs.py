@@ -1,31 +1,65 @@
 """Run ingestion endpoints"""
 
 from datetime import datetime
+from typing import Any
 
 from fastapi import APIRouter, Depends, status
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 from ..deps import get_db, verify_api_key
-from ..models.orm import Pipeline, Run, Step, Feature
-from ..models.schemas import RunIngestReq, RunIngestResp
+from ..models.orm import Run, Step, Feature
+from ..models.schemas import RunIngestReq, RunIngestResp, RunStepColumns
 from ..ml.features import extract_features
+from ..ml.regressions import detector, stage_durations
+from ..ml.rollups import record_completed_run
+from ..routing import FastJSONRoute
+from ..storage import feature_cache
+from ..storage.postgres import get_or_create_pipeline_id
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+# Step column -> RunStepColumns field; cpu_time_s has always held cpu_usage_pct
+STEP_COLUMNS = {
+    "name": "name",
+    "start_ts": "start_ts",
+    "end_ts": "end_ts",
+    "duration_s": "duration_s",
+    "cpu_time_s": "cpu_usage_pct",
+    "rss_max_bytes": "rss_max_bytes",
+    "io_r_bytes": "io_r_bytes",
+    "io_w_bytes": "io_w_bytes",
+    "exit_code": "exit_code",
+}
+
+
+def _datetimes(epochs: list[float]) -> list[datetime]:
+    # Whole column at once: epoch seconds -> naive UTC datetimes
+    import numpy as np
+
+    micros = np.rint(np.asarray(epochs, dtype=np.float64) * 1e6).astype(np.int64)
+    values: list[datetime] = micros.astype("datetime64[us]").tolist()
+    return values
+
+
+def step_rows(run_pk: int, steps: RunStepColumns) -> list[dict[str, Any]]:
+    """INSERT parameters for a run's steps, converted column by column"""
+    columns = {column: getattr(steps, field) for column, field in STEP_COLUMNS.items()}
+    columns["start_ts"] = _datetimes(steps.start_ts)
+    columns["end_ts"] = _datetimes(steps.end_ts)
+    keys = ["run_id", *columns]
+    return [dict(zip(keys, row)) for row in zip([run_pk] * len(steps), *columns.values())]
 
 
 @router.post("/runs", status_code=status.HTTP_201_CREATED, dependencies=[Depends(verify_api_key)])
 async def ingest_run(req: RunIngestReq, db: Session = Depends(get_db)) -> RunIngestResp:
     """Ingest a complete run with all steps"""
     # Get or create pipeline
-    pipeline = db.query(Pipeline).filter(Pipeline.name == req.pipeline).first()
-    if not pipeline:
-        pipeline = Pipeline(name=req.pipeline, repo="unknown")
-        db.add(pipeline)
-        db.flush()
+    pipeline_id = get_or_create_pipeline_id(db, req.pipeline)
 
     # Create run record
     run = Run(
-        pipeline_id=pipeline.id,
+        pipeline_id=pipeline_id,
         build_number=req.build_number,
         status=req.status,
         duration_s=req.duration_s,
@@ -40,27 +74,18 @@ async def ingest_run(req: RunIngestReq, db: Session = Depends(get_db)) -> RunIng
     )
     db.add(run)
     db.flush()
+    run_pk = int(run.id)
 
-    # Create step records
-    for step_data in req.steps:
-        step = Step(
-            run_id=run.id,
-            name=step_data.name,
-            start_ts=datetime.fromisoformat(step_data.start_time.replace('Z', '+00:00')),
-            end_ts=datetime.fromisoformat(step_data.end_time.replace('Z', '+00:00')),
-            duration_s=step_data.duration_s,
-            cpu_time_s=step_data.cpu_usage_pct,
-            rss_max_bytes=step_data.rss_max_bytes,
-            io_r_bytes=step_data.io_r_bytes,
-            io_w_bytes=step_data.io_w_bytes,
-            exit_code=step_data.exit_code,
-        )
-        db.add(step)
+    # Create step records in one executemany
+    steps = req.columns()
+    if len(steps):
+        db.execute(insert(Step), step_rows(run_pk, steps))
 
     # Extract and store features
-    features = extract_features(run, req.steps)
+    features = extract_features(run, steps)
+    feature_created_at = datetime.utcnow()
     feature_record = Feature(
-        run_id=run.id,
+        run_id=run_pk,
         tool=req.tool,
         max_rss_gb=features.get("max_rss_gb", 0),
         total_io_gb=features.get("total_io_gb", 0),
@@ -68,9 +93,43 @@ async def ingest_run(req: RunIngestReq, db: Session = Depends(get_db)) -> RunIng
         avg_step_duration_s=features.get("avg_step_duration_s", 0),
         max_step_duration_s=features.get("max_step_duration_s", 0),
         total_cpu_s=features.get("total_cpu_s", 0),
+        vector=features,
+        created_at=feature_created_at,
     )
     db.add(feature_record)
 
+    # Fold into the pipeline rollup
+    record_completed_run(
+        db,
+        pipeline_id,
+        status=req.status,
+        duration_s=req.duration_s,
+        max_rss_bytes=max(steps.rss_max_bytes, default=0),
+        step_durations=steps.duration_s,
+        resources={
+            "concurrency": req.concurrency,
+            "cpu_req": req.cpu_req,
+            "mem_req_gb": req.mem_req_gb,
+        },
+    )
+
     db.commit()
 
-    return RunIngestResp(status="ingested", run_id=run.id)
+    await detector.observe_run(
+        pipeline_id,
+        req.pipeline,
+        run_id=str(run_pk),
+        status=req.status,
+        duration_s=req.duration_s,
+        commit=req.git_sha,
+        stages=stage_durations(zip(steps.name, steps.duration_s)),
+    )
+
+    # Write-through so the first feature lookup is a cache hit on every worker
+    await feature_cache.aput(
+        str(run_pk),
+        {"vector": features, "label": None, "created_at": feature_created_at.isoformat()},
+        broadcast=True,
+    )
+
+    return RunIngestResp(status="ingested", run_id=run_pk)
@@ -0,0 +1,39 @@
+"""Step endpoints"""
+
+from datetime import UTC, datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..deps import get_read_db
+from ..models.orm import Step
+from ..models.schemas import StepSeriesResp
+from ..storage.series import SERIES_METRICS, read_series
+
+router = APIRouter()
+
+
+def _epoch_ms(value: datetime | None) -> int | None:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return int(value.timestamp() * 1000)
+
+
+@router.get("/{step_id}/series", response_model=StepSeriesResp)
+def get_step_series(
+    step_id: int,
+    metric: str = Query("rss_bytes", pattern=f"^({'|'.join(SERIES_METRICS)})$"),
+    points: int = Query(500, ge=3, le=10000),
+    method: str = Query("lttb", pattern="^(lttb|minmax)$"),
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: Session = Depends(get_read_db),
+) -> StepSeriesResp:
+    """Scraped samples of a step, downsampled to about `points` points"""
+    if db.scalar(select(Step.id).where(Step.id == step_id)) is None:
+        raise HTTPException(status_code=404, detail="Step not found")
+    series = read_series(db, step_id, metric, points, _epoch_ms(start), _epoch_ms(end), method)
+    return StepSeriesResp(step_id=step_id, metric=metric, **series)
@@ -0,0 +1,364 @@
+"""OTLP/HTTP JSON trace receiver
+
+Build tooling that already emits OpenTelemetry traces can point an OTLP/HTTP
+exporter (or a collector's otlphttp exporter, with encoding: json) at this
+API instead of calling /builds/* per step. A trace is one run: its root span
+becomes the Run row and every other span a Step, with fields taken from span
+attributes, falling back to resource attributes. The run id is resolved once
+per trace, so every span of a trace lands in the same run: the root span's
+cicd.pipeline.run.id, else any span's, else the trace id. Child spans usually
+finish, and are exported, before their root, so a run seen only through its
+steps is created as "running" and completed when the root span arrives. If
+those steps carried no run id, the run was created under the trace id and is
+renamed when the root brings one. Steps are merged by span id, so
+re-exported spans are harmless.
+"""
+
+import gzip
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..deps import get_db, verify_api_key
+from ..ml.rollups import record_finished_run
+from ..models.orm import Run
+from ..routing import loads
+from ..storage.postgres import dialect_insert, get_or_create_pipeline_id, upsert_steps
+
+router = APIRouter()
+
+# Run column -> attribute keys tried in order
+RUN_ATTRIBUTES = {
+    "branch": ("vcs.ref.head.name", "vcs.repository.ref.name"),
+    "commit": ("vcs.ref.head.revision", "vcs.repository.ref.revision"),
+    "git": ("vcs.repository.url.full",),
+    "image": ("container.image.name",),
+    "node": ("k8s.node.name", "host.name"),
+    "tool": ("inframind.tool",),
+    "build_number": ("cicd.pipeline.run.number", "inframind.build_number"),
+    "cpu_req": ("inframind.cpu_req",),
+    "mem_req_gb": ("inframind.mem_req_gb",),
+    "concurrency": ("inframind.concurrency",),
+}
+
+# Step column -> attribute keys tried in order
+STEP_ATTRIBUTES = {
+    "stage": ("cicd.pipeline.task.name", "inframind.stage"),
+    "cpu_time_s": ("inframind.cpu_time_s", "process.cpu.time"),
+    "rss_max_bytes": ("inframind.rss_max_bytes",),
+    "io_r_bytes": ("inframind.io_r_bytes",),
+    "io_w_bytes": ("inframind.io_w_bytes",),
+    "cache_hits": ("inframind.cache_hits",),
+    "cache_misses": ("inframind.cache_misses",),
+    "exit_code": ("process.exit.code",),
+}
+
+RUN_ID_ATTRIBUTE = "cicd.pipeline.run.id"
+PIPELINE_ATTRIBUTES = ("cicd.pipeline.name", "service.name")
+
+# cicd.pipeline.result -> run status
+RESULT_STATUS = {
+    "success": "success",
+    "failure": "failure",
+    "error": "failure",
+    "timeout": "failure",
+    "cancellation": "aborted",
+    "skip": "aborted",
+}
+STATUS_CODE_ERROR = 2
+
+STEP_COLUMNS = (
+    "run_id",
+    "span_id",
+    "name",
+    "step",
+    "start_ts",
+    "end_ts",
+    "duration_s",
+    *STEP_ATTRIBUTES,
+)
+
+
+@dataclass(slots=True)
+class SpanRecord:
+    """The parts of an OTLP span the mapping uses"""
+
+    trace_id: str
+    span_id: str
+    parent_span_id: str
+    name: str
+    start_ns: int
+    end_ns: int
+    status_code: int
+    attributes: dict[str, Any]  # span attributes over resource attributes
+
+
+def _value(value: dict[str, Any]) -> Any:
+    # OTLP AnyValue; 64-bit integers are JSON strings
+    if "stringValue" in value:
+        return value["stringValue"]
+    if "intValue" in value:
+        return int(value["intValue"])
+    if "doubleValue" in value:
+        return float(value["doubleValue"])
+    if "boolValue" in value:
+        return bool(value["boolValue"])
+    if "arrayValue" in value:
+        return [_value(v) for v in value["arrayValue"].get("values", [])]
+    return None
+
+
+def _attributes(items: list[dict[str, Any]] | None) -> dict[str, Any]:
+    return {item["key"]: _value(item.get("value") or {}) for item in items or ()}
+
+
+def decode_spans(payload: dict[str, Any]) -> tuple[list[SpanRecord], int]:
+    """Flatten an ExportTraceServiceRequest into spans; also returns the number rejected"""
+    spans = []
+    rejected = 0
+    for resource_spans in payload.get("resourceSpans") or ():
+        resource = _attributes((resource_spans.get("resource") or {}).get("attributes"))
+        for scope_spans in resource_spans.get("scopeSpans") or ():
+            for span in scope_spans.get("spans") or ():
+                try:
+                    spans.append(
+                        SpanRecord(
+                            trace_id=span["traceId"],
+                            span_id=span["spanId"],
+                            parent_span_id=span.get("parentSpanId") or "",
+                            name=span.get("name", ""),
+                            start_ns=int(span["startTimeUnixNano"]),
+                            end_ns=int(span["endTimeUnixNano"]),
+                            status_code=int((span.get("status") or {}).get("code") or 0),
+                            attributes={**resource, **_attributes(span.get("attributes"))},
+                        )
+                    )
+                except (KeyError, TypeError, ValueError):
+                    rejected += 1
+    return spans, rejected
+
+
+def _datetimes(nanos: list[int]) -> list[datetime]:
+    # Whole batch at once: unix nanoseconds -> naive UTC datetimes
+    import numpy as np
+
+    micros = np.asarray(nanos, dtype=np.int64) // 1000
+    datetimes: list[datetime] = micros.astype("datetime64[us]").tolist()
+    return datetimes
+
+
+def _pick(attributes: dict[str, Any], keys: tuple[str, ...]) -> Any:
+    for key in keys:
+        value = attributes.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def run_keys(spans: list[SpanRecord]) -> dict[str, str]:
+    """
+    External run id per trace id: the root span's run id attribute, else the
+    first one any span carries, else the trace id
+    """
+    keys: dict[str, str] = {}
+    from_root: set[str] = set()
+    for span in spans:
+        value = span.attributes.get(RUN_ID_ATTRIBUTE)
+        if not value or span.trace_id in from_root:
+            continue
+        if not span.parent_span_id:
+            keys[span.trace_id] = str(value)
+            from_root.add(span.trace_id)
+        else:
+            keys.setdefault(span.trace_id, str(value))
+    for span in spans:
+        keys.setdefault(span.trace_id, span.trace_id)
+    return keys
+
+
+def map_spans(
+    spans: list[SpanRecord], run_ids: dict[str, str] | None = None
+) -> tuple[dict[str, dict], dict[str, dict], list[dict]]:
+    """
+    Root span rows per run id, placeholder rows for runs seen only through
+    their steps, and step rows keyed by run id instead of the run's primary key
+    """
+    run_ids = run_keys(spans) if run_ids is None else run_ids
+    starts = _datetimes([s.start_ns for s in spans])
+    ends = _datetimes([s.end_ns for s in spans])
+    roots: dict[str, dict] = {}
+    placeholders: dict[str, dict] = {}
+    steps = []
+    for span, start, end in zip(spans, starts, ends):
+        key = run_ids[span.trace_id]
+        attributes = span.attributes
+        pipeline = str(_pick(attributes, PIPELINE_ATTRIBUTES) or "unknown")
+        duration_s = max(0, span.end_ns - span.start_ns) / 1e9
+        if not span.parent_span_id:
+            result = attributes.get("cicd.pipeline.result")
+            if result in RESULT_STATUS:
+                status = RESULT_STATUS[result]
+            else:
+                status = "failure" if span.status_code == STATUS_CODE_ERROR else "success"
+            roots[key] = {
+                "run_id": key,
+                "pipeline": pipeline,
+                "status": status,
+                "started_at": start,
+                "finished_at": end,
+                "duration_s": duration_s,
+                **{column: _pick(attributes, keys) for column, keys in RUN_ATTRIBUTES.items()},
+            }
+            continue
+
+        placeholder = placeholders.setdefault(
+            key, {"run_id": key, "pipeline": pipeline, "status": "running", "started_at": start}
+        )
+        placeholder["started_at"] = min(placeholder["started_at"], start)
+        row = dict.fromkeys(STEP_COLUMNS)
+        row.update(
+            run_id=key,
+            span_id=span.span_id,
+            name=span.name,
+            step=span.name,
+            start_ts=start,
+            end_ts=end,
+            duration_s=duration_s,
+        )
+        for column, keys in STEP_ATTRIBUTES.items():
+            row[column] = _pick(attributes, keys)
+        row["stage"] = row["stage"] or span.name
+        steps.append(row)
+
+    for key in roots:
+        placeholders.pop(key, None)
+    return roots, placeholders, steps
+
+
+def _with_pipeline_ids(db: Session, rows: dict[str, dict]) -> list[dict]:
+    pipeline_ids: dict[str, int] = {}
+    out = []
+    for row in rows.values():
+        name = row.pop("pipeline")
+        if name not in pipeline_ids:
+            pipeline_ids[name] = get_or_create_pipeline_id(db, name)
+        out.append({**row, "pipeline_id": pipeline_ids[name]})
+    return out
+
+
+def _upsert_runs(db: Session, roots: list[dict], placeholders: list[dict]) -> None:
+    insert = dialect_insert(db, Run)
+    if insert is None:
+        existing = {
+            run.run_id: run
+            for run in db.scalars(
+                select(Run).where(Run.run_id.in_([r["run_id"] for r in roots + placeholders]))
+            )
+        }
+        for row in placeholders:
+            if row["run_id"] not in existing:
+                existing[row["run_id"]] = Run(**row)
+                db.add(existing[row["run_id"]])
+        for row in roots:
+            run = existing.get(row["run_id"])
+            if run is None:
+                db.add(Run(**row))
+                continue
+            for column, value in row.items():
+                if value is not None:
+                    setattr(run, column, value)
+        db.flush()
+        return
+
+    if placeholders:
+        db.execute(insert.on_conflict_do_nothing(index_elements=["run_id"]), placeholders)
+    if roots:
+        table = Run.__table__
+        merged = {
+            column: func.coalesce(insert.excluded[column], table.c[column])
+            for column in roots[0]
+            if column != "run_id"
+        }
+        db.execute(insert.on_conflict_do_update(index_elements=["run_id"], set_=merged), roots)
+
+
+def _adopt_trace_runs(db: Session, keys: dict[str, str]) -> None:
+    """Rename runs created under a trace id before its run id was known"""
+    renames = {trace_id: key for trace_id, key in keys.items() if key != trace_id}
+    if not renames:
+        return
+    taken: set[str] = set(db.scalars(select(Run.run_id).where(Run.run_id.in_(list(renames.values())))))
+    for run in db.scalars(select(Run).where(Run.run_id.in_(list(renames)))):
+        if renames[run.run_id] not in taken:
+            run.run_id = renames[run.run_id]
+    db.flush()
+
+
+def ingest_spans(db: Session, spans: list[SpanRecord]) -> dict[str, int]:
+    """Write spans as runs and steps with one statement per table; the caller commits"""
+    keys = run_keys(spans)
+    _adopt_trace_runs(db, keys)
+    roots, placeholders, steps = map_spans(spans, keys)
+    # Runs that were already complete are not folded into the rollup again
+    finished: set[str] = set(
+        db.scalars(
+            select(Run.run_id).where(Run.run_id.in_(list(roots)), Run.status != "running")
+        )
+    )
+    _upsert_runs(db, _with_pipeline_ids(db, roots), _with_pipeline_ids(db, placeholders))
+
+    run_ids = dict(
+        db.execute(
+            select(Run.run_id, Run.id).where(Run.run_id.in_({row["run_id"] for row in steps}))
+        ).all()
+    )
+    for row in steps:
+        row["run_id"] = run_ids[row["run_id"]]
+    upsert_steps(db, steps)
+
+    completed = [key for key in roots if key not in finished]
+    if completed:
+        for run in db.scalars(select(Run).where(Run.run_id.in_(completed))):
+            record_finished_run(db, run)
+    return {"runs": len(roots), "steps": len(steps)}
+
+
+@router.post("/v1/traces", dependencies=[Depends(verify_api_key)])
+async def receive_traces(request: Request, db: Session = Depends(get_db)) -> dict[str, Any]:
+    """OTLP/HTTP trace export, JSON encoding"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type != "application/json":
+        raise HTTPException(
+            status_code=415, detail="Only OTLP/JSON is supported; set encoding: json"
+        )
+    body = await request.body()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        try:
+            body = gzip.decompress(body)
+        except (OSError, EOFError):
+            raise HTTPException(status_code=400, detail="Invalid gzip body") from None
+    try:
+        payload = loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body") from None
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Expected an ExportTraceServiceRequest")
+
+    spans, rejected = decode_spans(payload)
+    if spans:
+        ingest_spans(db, spans)
+        db.commit()
+
+    # ExportTraceServiceResponse
+    if rejected:
+        return {
+            "partialSuccess": {
+                "rejectedSpans": str(rejected),
+                "errorMessage": f"{rejected} spans missing ids or timestamps",
+            }
+        }
+    return {}
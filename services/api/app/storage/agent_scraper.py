@@ -0,0 +1,425 @@
+"""Step telemetry scraped from the node agents' Prometheus endpoints
+
+The C++ agent on every build node exposes CPU, memory, I/O and cache metrics
+on :9102. The scraper polls the agents of every node with an active step,
+concurrently, and folds the samples into those steps: memory is kept as a
+peak, counters as totals accumulated from their increase since the step was
+first seen (surviving agent restarts). The step label registry is the steps
+table itself: a step is active from its start event until its stop, on the
+node its run was registered on. Samples carrying a span_id label, or a step
+label naming an active step on the node, are attributed to that step. The
+agent exports no such labels yet: its samples are node-wide and kept as the
+node's own series, and they are only attributed to a step while it is the
+only active step on its node (memory is then an upper bound, since it
+includes everything else the node runs). A step sharing its node gets
+nothing until it runs alone again, and its counters restart from a fresh
+baseline then. Values only ever grow, so a scraper restart cannot lower
+them, and neither can a stop event's counters. Every scrape also appends a sample per step to its time series
+(see series). The scraper starts in every worker, but only the one holding
+a Redis lease scrapes; the others stand by to take over when it lapses.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import re
+import socket
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+import redis
+from sqlalchemy import bindparam, select, update
+
+from ..config import settings
+from ..middleware.metrics import agent_scrapes_total
+from ..models.orm import Run, Step
+from .postgres import SessionLocal
+from .redis import aacquire_lease
+from .series import SeriesWriter, node_writer
+from .series import writer as series_writer
+
+logger = logging.getLogger(__name__)
+
+# Step column -> agent metrics whose values are summed
+PEAK_METRICS = {"rss_max_bytes": ("im_mem_used_bytes",)}
+TOTAL_METRICS = {
+    "cpu_time_s": ("im_cpu_user_seconds_total", "im_cpu_system_seconds_total"),
+    "io_r_bytes": ("im_io_read_bytes_total",),
+    "io_w_bytes": ("im_io_write_bytes_total",),
+    "cache_hits": ("im_cache_hits_total",),
+    "cache_misses": ("im_cache_misses_total",),
+}
+INTEGER_COLUMNS = frozenset(
+    {"rss_max_bytes", "io_r_bytes", "io_w_bytes", "cache_hits", "cache_misses"}
+)
+# Series metric -> (column, scale); memory is the current value, counters the step's total
+SERIES_SOURCES = {
+    "rss_bytes": ("rss_max_bytes", 1),
+    "cpu_ms": ("cpu_time_s", 1000),
+    "io_r_bytes": ("io_r_bytes", 1),
+    "io_w_bytes": ("io_w_bytes", 1),
+}
+WANTED_METRICS = frozenset(
+    name for names in (*PEAK_METRICS.values(), *TOTAL_METRICS.values()) for name in names
+)
+
+_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+LEASE_NAME = "agent-scraper"
+
+# (metric name, span_id label, step label) -> value summed over other labels
+Samples = dict[tuple[str, str | None, str | None], float]
+
+
+def parse_metrics(text: str, wanted: frozenset[str] = WANTED_METRICS) -> Samples:
+    """
+    Parse Prometheus text exposition, keeping only wanted metrics. Labels are
+    only parsed for wanted lines that have them.
+    """
+    samples: Samples = defaultdict(float)
+    for line in text.splitlines():
+        if not line or line[0] == "#":
+            continue
+        brace = line.find("{")
+        space = line.find(" ")
+        if brace != -1 and (space == -1 or brace < space):
+            name = line[:brace]
+            if name not in wanted:
+                continue
+            close = line.rfind("}")
+            labels = dict(_LABEL.findall(line[brace + 1 : close]))
+            rest = line[close + 1 :]
+            span_id = labels.get("span_id")
+            step = None if span_id else labels.get("step")
+        else:
+            name = line[:space]
+            if name not in wanted:
+                continue
+            rest = line[space:]
+            span_id = step = None
+        try:
+            value = float(rest.split()[0])
+        except (IndexError, ValueError):
+            continue
+        if not math.isnan(value):
+            samples[(name, span_id, step)] += value
+    return samples
+
+
+@dataclass
+class ActiveStep:
+    """A step between its start and stop events, with what is stored for it"""
+
+    id: int
+    span_id: str | None
+    step: str | None
+    node: str
+    stored: dict[str, float | None]
+
+
+@dataclass
+class StepTotals:
+    """Peaks and counter totals accumulated for one step"""
+
+    peaks: dict[str, float] = field(default_factory=dict)
+    totals: dict[str, float] = field(default_factory=dict)
+    last: dict[str, float] = field(default_factory=dict)
+    source: str | None = None  # Samples the last values came from
+
+    def sample(self, values: dict[str, float]) -> dict[str, int]:
+        """Series sample after observing values"""
+        sample = {}
+        for metric, (column, scale) in SERIES_SOURCES.items():
+            value = values.get(column) if column in PEAK_METRICS else self.totals.get(column)
+            if value is not None:
+                sample[metric] = round(value * scale)
+        return sample
+
+    def observe(self, values: dict[str, float]) -> None:
+        for column, value in values.items():
+            if column in PEAK_METRICS:
+                self.peaks[column] = max(value, self.peaks.get(column, value))
+                continue
+            last = self.last.get(column)
+            self.last[column] = value
+            if last is None:
+                # First sample: what happened before it is unknown
+                self.totals.setdefault(column, 0.0)
+            elif value >= last:
+                self.totals[column] += value - last
+            else:
+                # Counter reset (agent restart): everything since counts
+                self.totals[column] += value
+
+
+def _values(samples: Samples, span_id: str | None, step: str | None) -> dict[str, float]:
+    values = {}
+    for column, names in (*PEAK_METRICS.items(), *TOTAL_METRICS.items()):
+        found = [samples[(n, span_id, step)] for n in names if (n, span_id, step) in samples]
+        if found:
+            values[column] = sum(found)
+    return values
+
+
+def _step_values(
+    samples: Samples, step: ActiveStep, alone: bool = False
+) -> tuple[dict[str, float], str | None]:
+    """
+    Column values for a step and their source: the samples labeled with its
+    span, else its step name, else the node-wide ones if it is alone on its node
+    """
+    if step.span_id:
+        values = _values(samples, step.span_id, None)
+        if values:
+            return values, "span"
+    if step.step:
+        values = _values(samples, None, step.step)
+        if values:
+            return values, "step"
+    if alone:
+        values = _node_values(samples)
+        if values:
+            return values, "node"
+    return {}, None
+
+
+def _node_values(samples: Samples) -> dict[str, float]:
+    """Column values of the unlabeled, node-wide samples"""
+    return _values(samples, None, None)
+
+
+def node_sample(values: dict[str, float]) -> dict[str, int]:
+    """Series sample of node-wide values, counters as the agent reports them"""
+    return {
+        metric: round(values[column] * scale)
+        for metric, (column, scale) in SERIES_SOURCES.items()
+        if column in values
+    }
+
+
+def load_active_steps() -> list[ActiveStep]:
+    """The step label registry: started, unfinished steps of running runs with a node"""
+    columns = [*PEAK_METRICS, *TOTAL_METRICS]
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(
+                Step.id, Step.span_id, Step.step, Run.node, *(getattr(Step, c) for c in columns)
+            )
+            .join(Run, Step.run_id == Run.id)
+            .where(
+                Step.start_ts.is_not(None),
+                Step.end_ts.is_(None),
+                Run.status == "running",
+                Run.node.is_not(None),
+            )
+        ).all()
+    return [
+        ActiveStep(
+            id=row[0],
+            span_id=row[1],
+            step=row[2],
+            node=row[3],
+            stored=dict(zip(columns, row[4:])),
+        )
+        for row in rows
+    ]
+
+
+def write_step_counters(rows: list[dict[str, Any]]) -> None:
+    """Update scraped counters of still-active steps in one executemany"""
+    if not rows:
+        return
+    table = Step.__table__
+    values: dict[str, Any] = {column: bindparam(column) for column in rows[0] if column != "step_id"}
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("step_id"), table.c.end_ts.is_(None))
+        .values(values)
+    )
+    with SessionLocal() as db:
+        db.connection().execute(stmt, rows)
+        db.commit()
+
+
+def write_scrape(rows: list[dict[str, Any]], *series: SeriesWriter | None) -> None:
+    """Store a scrape: step counters, then the open series blocks"""
+    write_step_counters(rows)
+    writers = [s for s in series if s is not None]
+    if not writers:
+        return
+    with SessionLocal() as db:
+        if sum(s.flush(db) for s in writers):
+            db.commit()
+
+
+class AgentScraper:
+    """Poll node agents concurrently and fold their samples into active steps"""
+
+    def __init__(
+        self,
+        url_template: str = "http://{node}:9102/metrics",
+        interval_s: float = 5.0,
+        timeout_s: float = 2.0,
+        concurrency: int = 32,
+        enabled: bool = True,
+        series: SeriesWriter | None = None,
+        node_series: SeriesWriter | None = None,
+        lease_s: float | None = None,
+    ) -> None:
+        self.url_template = url_template
+        self.interval_s = interval_s
+        self.timeout_s = timeout_s
+        self.concurrency = concurrency
+        self.enabled = enabled
+        self.series = series
+        self.node_series = node_series
+        self.lease_s = lease_s  # None: always scrape, without a lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.leading = False
+        self.steps: dict[int, StepTotals] = {}
+        self._client: httpx.AsyncClient | None = None
+        self._task: asyncio.Task | None = None
+
+    async def _fetch(
+        self, client: httpx.AsyncClient, node: str, limit: asyncio.Semaphore
+    ) -> Samples | None:
+        async with limit:
+            try:
+                response = await client.get(self.url_template.format(node=node))
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                agent_scrapes_total.labels(result="error").inc()
+                logger.debug("Scraping agent on %s failed: %s", node, e)
+                return None
+        agent_scrapes_total.labels(result="ok").inc()
+        return parse_metrics(response.text)
+
+    async def scrape_once(self) -> int:
+        """Scrape every node with an active step; returns the number of steps updated"""
+        active = await asyncio.to_thread(load_active_steps)
+        # Forget steps that stopped
+        live = {step.id for step in active}
+        stopped = [step_id for step_id in self.steps if step_id not in live]
+        for step_id in stopped:
+            del self.steps[step_id]
+        if self.series is not None:
+            self.series.forget(stopped)
+        if self.node_series is not None:
+            nodes_live = {step.node for step in active}
+            self.node_series.forget([n for n in self.node_series.blocks if n not in nodes_live])
+        if not active:
+            return 0
+
+        by_node: dict[str, list[ActiveStep]] = defaultdict(list)
+        for step in active:
+            by_node[step.node].append(step)
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout_s)
+        limit = asyncio.Semaphore(self.concurrency)
+        nodes = list(by_node)
+        results = await asyncio.gather(*(self._fetch(self._client, n, limit) for n in nodes))
+
+        rows = []
+        now_ms = int(time.time() * 1000)
+        for node, samples in zip(nodes, results):
+            if samples is None:
+                continue
+            if self.node_series is not None:
+                node_values = _node_values(samples)
+                if node_values:
+                    self.node_series.append(node, now_ms, node_sample(node_values))
+            alone = len(by_node[node]) == 1
+            for step in by_node[node]:
+                values, source = _step_values(samples, step, alone)
+                totals = self.steps.get(step.id)
+                if totals is not None and totals.source != source:
+                    # Counters from other samples, or after a gap, need a new baseline
+                    totals.last.clear()
+                    totals.source = source
+                if not values:
+                    continue
+                if totals is None:
+                    totals = self.steps[step.id] = StepTotals(source=source)
+                totals.observe(values)
+                rows.append(self._row(step, totals))
+                if self.series is not None:
+                    self.series.append(step.id, now_ms, totals.sample(values))
+        await asyncio.to_thread(write_scrape, rows, self.series, self.node_series)
+        return len(rows)
+
+    @staticmethod
+    def _row(step: ActiveStep, totals: StepTotals) -> dict[str, Any]:
+        # Never lower what is stored: another scraper, or this one before a restart
+        row: dict[str, Any] = {"step_id": step.id}
+        for column, value in (*totals.peaks.items(), *totals.totals.items()):
+            value = max(value, step.stored.get(column) or 0)
+            row[column] = int(value) if column in INTEGER_COLUMNS else value
+        for column in (*PEAK_METRICS, *TOTAL_METRICS):
+            row.setdefault(column, step.stored.get(column))
+        return row
+
+    async def lead(self) -> bool:
+        """Take or renew the scrape lease; without Redis nobody leads"""
+        if self.lease_s is None:
+            return True
+        try:
+            # Shielded: cancelling stop() mid-transaction can wedge the pooled connection
+            leading = await asyncio.shield(
+                aacquire_lease(LEASE_NAME, self.owner, int(self.lease_s * 1000))
+            )
+        except redis.RedisError as e:
+            logger.warning("Agent scrape lease unavailable: %s", e)
+            leading = False
+        if leading != self.leading:
+            logger.info("Agent scraper %s the lease", "took" if leading else "lost")
+            if not leading:
+                # Another worker appends from now on; start new blocks if we lead again
+                for writer in (self.series, self.node_series):
+                    if writer is not None:
+                        writer.forget(list(writer.blocks))
+        self.leading = leading
+        return leading
+
+    async def _run(self) -> None:
+        while True:
+            start = time.monotonic()
+            try:
+                if await self.lead():
+                    await self.scrape_once()
+            except Exception:
+                logger.exception("Agent scrape failed")
+            await asyncio.sleep(max(0.0, self.interval_s - (time.monotonic() - start)))
+
+    def start(self) -> None:
+        """Start scraping in the background on the running loop"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop scraping and close the HTTP client"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+scraper = AgentScraper(
+    url_template=settings.agent_url_template,
+    interval_s=settings.agent_scrape_interval_s,
+    timeout_s=settings.agent_scrape_timeout_s,
+    concurrency=settings.agent_scrape_concurrency,
+    enabled=settings.agent_scrape_enabled,
+    series=series_writer,
+    node_series=node_writer,
+    lease_s=settings.agent_scrape_lease_s,
+)
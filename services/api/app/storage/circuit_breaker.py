@@ -0,0 +1,98 @@
+"""Circuit breaker for optional backing services"""
+
+import threading
+import time
+from collections.abc import Callable
+
+from ..middleware.metrics import circuit_breaker_state
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are rejected without touching the service. Once reset_timeout_s has
+    passed a single probe call is let through (half-open): success closes
+    the circuit, failure opens it for another reset_timeout_s.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout_s: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._state = CLOSED
+        circuit_breaker_state.labels(name=name).set(_STATE_VALUES[CLOSED])
+
+    @property
+    def state(self) -> str:
+        """Current state, without claiming the half-open probe"""
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout_s:
+                return HALF_OPEN
+            return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """Whether calls are currently being rejected"""
+        return self.state == OPEN
+
+    def allow(self) -> bool:
+        """Whether a call may go to the service now"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if self._clock() - self._opened_at < self.reset_timeout_s:
+                    return False
+                self._set_state(HALF_OPEN)
+            # Half-open: only one probe at a time
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        """Record a successful call"""
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        """Record a failed call"""
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+                self._set_state(OPEN)
+
+    def reset(self) -> None:
+        """Close the circuit and forget past failures"""
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        circuit_breaker_state.labels(name=self.name).set(_STATE_VALUES[state])
@@ -0,0 +1,104 @@
+"""Cache value codecs"""
+
+import json
+import zlib
+from collections.abc import Callable
+from typing import Any
+
+# Every encoded value starts with a one-byte tag naming its format, so
+# codecs can change without flushing the cache. Values without a known tag
+# are read as legacy plain JSON.
+TAG_JSON = b"J"
+TAG_MSGPACK = b"M"
+TAG_ZLIB = b"D"
+TAG_ZSTD = b"Z"
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), default=str).encode()
+
+
+def _msgpack_dumps(obj: Any) -> bytes:
+    import msgpack
+
+    packed: bytes = msgpack.packb(obj, default=str, use_bin_type=True)
+    return packed
+
+
+def _msgpack_loads(data: bytes) -> Any:
+    import msgpack
+
+    return msgpack.unpackb(data, raw=False)
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    import zstandard
+
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+SERIALIZERS: dict[str, tuple[bytes, Callable[[Any], bytes]]] = {
+    "json": (TAG_JSON, _json_dumps),
+    "msgpack": (TAG_MSGPACK, _msgpack_dumps),
+}
+
+COMPRESSORS: dict[str, tuple[bytes, Callable[[bytes], bytes]]] = {
+    "zlib": (TAG_ZLIB, zlib.compress),
+    "zstd": (TAG_ZSTD, _zstd_compress),
+}
+
+_DESERIALIZERS: dict[bytes, Callable[[bytes], Any]] = {
+    TAG_JSON: json.loads,
+    TAG_MSGPACK: _msgpack_loads,
+}
+
+_DECOMPRESSORS: dict[bytes, Callable[[bytes], bytes]] = {
+    TAG_ZLIB: zlib.decompress,
+    TAG_ZSTD: _zstd_decompress,
+}
+
+
+class Codec:
+    """Serialize cache values, compressing payloads above a size threshold"""
+
+    def __init__(
+        self,
+        serializer: str = "msgpack",
+        compression: str = "zstd",
+        compress_min_bytes: int = 1024,
+    ) -> None:
+        if serializer not in SERIALIZERS:
+            raise ValueError(f"Unknown cache serializer: {serializer}")
+        if compression != "none" and compression not in COMPRESSORS:
+            raise ValueError(f"Unknown cache compression: {compression}")
+        self.name = serializer if compression == "none" else f"{serializer}+{compression}"
+        self._tag, self._dumps = SERIALIZERS[serializer]
+        self._compressor = COMPRESSORS.get(compression)
+        self.compress_min_bytes = compress_min_bytes
+
+    def encode(self, obj: Any) -> bytes:
+        """Encode a value for storage"""
+        data = self._tag + self._dumps(obj)
+        if self._compressor is not None and len(data) >= self.compress_min_bytes:
+            tag, compress = self._compressor
+            data = tag + compress(data)
+        return data
+
+    def decode(self, data: bytes | str) -> Any:
+        """Decode a stored value written by any codec"""
+        if isinstance(data, str):
+            return json.loads(data)
+        while True:
+            tag = data[:1]
+            if tag in _DECOMPRESSORS:
+                data = _DECOMPRESSORS[tag](data[1:])
+            elif tag in _DESERIALIZERS:
+                return _DESERIALIZERS[tag](data[1:])
+            else:
+                return json.loads(data)
@@ -0,0 +1,240 @@
+"""Two-tier feature cache: in-process LRU in front of Redis
+
+Workers tell each other to drop local copies over Redis pub/sub. A listener
+thread keeps that subscription alive, reconnecting with exponential backoff
+when Redis drops it. Messages published while it was disconnected are lost,
+so after reconnecting it clears the whole local tier instead of serving
+entries that may have been invalidated meanwhile.
+"""
+
+import logging
+import threading
+import uuid
+from typing import Any
+
+import redis
+
+from ..config import settings
+from ..middleware.conditional import make_etag
+from . import redis as redis_store
+from .local_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "im:feat:invalidate"
+LISTENER_BACKOFF_S = (0.5, 30.0)  # First and longest wait between reconnects
+
+# Redis payload marking a run id known to have no features
+_MISSING_PAYLOAD = {"missing": True}
+_ABSENT = object()
+
+# Identifies this process so it can ignore its own invalidation messages
+WORKER_ID = uuid.uuid4().hex
+
+local = LRUCache(maxsize=settings.feature_local_cache_size, ttl=settings.feature_local_cache_ttl)
+
+_listener: tuple[threading.Thread, threading.Event] | None = None
+
+
+def get(run_id: str) -> tuple[bool, dict[str, Any] | None]:
+    """
+    Look up features, local tier first.
+
+    Returns (hit, payload); a hit with a None payload is a cached miss.
+    """
+    value = local.get(run_id, _ABSENT)
+    if value is not _ABSENT:
+        return True, value
+
+    try:
+        cached = redis_store.get_cached_features(run_id)
+    except redis.RedisError as e:
+        logger.warning("Feature cache read failed: %s", e)
+        return False, None
+    return _fill_local(run_id, cached)
+
+
+async def aget(run_id: str) -> tuple[bool, dict[str, Any] | None]:
+    """Look up features, local tier first, without blocking the event loop"""
+    value = local.get(run_id, _ABSENT)
+    if value is not _ABSENT:
+        return True, value
+
+    try:
+        cached = await redis_store.aget_cached_features(run_id)
+    except redis.RedisError as e:
+        logger.warning("Feature cache read failed: %s", e)
+        return False, None
+    return _fill_local(run_id, cached)
+
+
+def _fill_local(run_id: str, cached: dict[str, Any] | None) -> tuple[bool, dict[str, Any] | None]:
+    if cached is None:
+        return False, None
+    payload = None if cached == _MISSING_PAYLOAD else cached
+    local.set(run_id, payload, ttl=settings.feature_negative_ttl if payload is None else None)
+    return True, payload
+
+
+def get_many(run_ids: list[str]) -> dict[str, dict[str, Any] | None]:
+    """
+    Look up features for many runs, with one Redis round trip for all local
+    misses. Only hits are returned; a None payload is a cached miss.
+    """
+    hits: dict[str, dict[str, Any] | None] = {}
+    misses = []
+    for run_id in run_ids:
+        value = local.get(run_id, _ABSENT)
+        if value is _ABSENT:
+            misses.append(run_id)
+        else:
+            hits[run_id] = value
+
+    if not misses:
+        return hits
+    try:
+        values = redis_store.get_many_cached_features(misses)
+    except redis.RedisError as e:
+        logger.warning("Feature cache read failed: %s", e)
+        return hits
+
+    for run_id, cached in zip(misses, values):
+        hit, payload = _fill_local(run_id, cached)
+        if hit:
+            hits[run_id] = payload
+    return hits
+
+
+def with_etag(payload: dict[str, Any]) -> dict[str, Any]:
+    """Payload stamped with the ETag of its content, computed once per write"""
+    if "etag" in payload:
+        return payload
+    return {**payload, "etag": make_etag(payload)}
+
+
+def put(run_id: str, payload: dict[str, Any], broadcast: bool = False) -> dict[str, Any]:
+    """
+    Write features through both tiers and return the stored payload.
+
+    With broadcast, other workers are told to drop their local copy (and any
+    negative entry) for this run id.
+    """
+    payload = with_etag(payload)
+    try:
+        redis_store.cache_features(run_id, payload)
+        if broadcast:
+            redis_store.publish(INVALIDATION_CHANNEL, f"{WORKER_ID}:{run_id}")
+    except redis.RedisError as e:
+        logger.warning("Feature cache write failed: %s", e)
+    local.set(run_id, payload)
+    return payload
+
+
+def put_missing(run_id: str) -> None:
+    """Negatively cache a run id that has no features"""
+    try:
+        redis_store.cache_features(run_id, _MISSING_PAYLOAD, ttl=settings.feature_negative_ttl)
+    except redis.RedisError as e:
+        logger.warning("Feature cache write failed: %s", e)
+    local.set(run_id, None, ttl=settings.feature_negative_ttl)
+
+
+async def aput(
+    run_id: str, payload: dict[str, Any], broadcast: bool = False
+) -> dict[str, Any]:
+    """Write features through both tiers without blocking the event loop"""
+    payload = with_etag(payload)
+    try:
+        await redis_store.acache_features(run_id, payload)
+        if broadcast:
+            await redis_store.apublish(INVALIDATION_CHANNEL, f"{WORKER_ID}:{run_id}")
+    except redis.RedisError as e:
+        logger.warning("Feature cache write failed: %s", e)
+    local.set(run_id, payload)
+    return payload
+
+
+async def aput_missing(run_id: str) -> None:
+    """Negatively cache a run id that has no features"""
+    try:
+        await redis_store.acache_features(
+            run_id, _MISSING_PAYLOAD, ttl=settings.feature_negative_ttl
+        )
+    except redis.RedisError as e:
+        logger.warning("Feature cache write failed: %s", e)
+    local.set(run_id, None, ttl=settings.feature_negative_ttl)
+
+
+def invalidate(run_id: str) -> None:
+    """Drop a run's features from both tiers on every worker"""
+    local.pop(run_id)
+    try:
+        redis_store.delete_cached_features(run_id)
+        redis_store.publish(INVALIDATION_CHANNEL, f"{WORKER_ID}:{run_id}")
+    except redis.RedisError as e:
+        logger.warning("Feature cache invalidation failed: %s", e)
+
+
+def _on_invalidation(message: dict[str, Any]) -> None:
+    data = message["data"]
+    if isinstance(data, bytes):
+        data = data.decode()
+    origin, _, run_id = data.partition(":")
+    if origin != WORKER_ID:
+        local.pop(run_id)
+
+
+def _listen(stopping: threading.Event) -> None:
+    backoff, max_backoff = LISTENER_BACKOFF_S
+    delay = backoff
+    disconnected = False
+    while not stopping.is_set():
+        pubsub = None
+        try:
+            pubsub = redis_store.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: _on_invalidation})
+            if disconnected:
+                # Invalidations sent while we were away are lost
+                local.clear()
+                logger.info("Feature invalidation listener reconnected; local cache cleared")
+                disconnected = False
+            delay = backoff
+            while not stopping.is_set():
+                pubsub.get_message(timeout=0.1)
+        except Exception as e:
+            # Meanwhile local entries still expire after feature_local_cache_ttl
+            logger.warning(
+                "Feature invalidation listener disconnected, retrying in %.1fs: %s",
+                delay,
+                e,
+                exc_info=not isinstance(e, redis.RedisError),
+            )
+            disconnected = True
+            stopping.wait(delay)
+            delay = min(delay * 2, max_backoff)
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
+
+def start_invalidation_listener() -> None:
+    """Subscribe to invalidations from other workers in a background thread"""
+    global _listener
+    if _listener is not None:
+        return
+    stopping = threading.Event()
+    thread = threading.Thread(
+        target=_listen, args=(stopping,), name="feature-invalidation", daemon=True
+    )
+    thread.start()
+    _listener = (thread, stopping)
+
+
+def stop_invalidation_listener() -> None:
+    """Stop the invalidation listener thread"""
+    global _listener
+    if _listener is not None:
+        thread, stopping = _listener
+        stopping.set()
+        thread.join(timeout=5)
+        _listener = None
@@ -0,0 +1,175 @@
+"""Background dependency health probing
+
+Kubernetes probes hit /healthz and /readyz every few seconds on every pod.
+Rather than querying the database and Redis on each probe, a background task
+checks them on an interval and keeps the latest results in memory, so the
+probe endpoints answer without any I/O. Results older than the staleness
+threshold are reported as such, and readiness fails on them. Only the
+database is required for readiness: Redis is a cache and rate-limit backend
+behind a circuit breaker, so an outage degrades the pod rather than taking
+every pod out of rotation at once.
+"""
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from sqlalchemy import text
+
+from ..config import settings
+from .postgres import engine, read_router
+from .redis import aping
+
+logger = logging.getLogger(__name__)
+
+Check = Callable[[], Awaitable[object]]
+
+
+@dataclass(frozen=True)
+class ProbeResult:
+    """Outcome of one dependency check"""
+
+    ok: bool
+    latency_ms: float
+    error: str | None = None
+
+
+class HealthProber:
+    """Periodically run dependency checks and keep the latest results"""
+
+    def __init__(
+        self,
+        checks: dict[str, Check],
+        required: frozenset[str] | None = None,
+        interval_s: float = 5.0,
+        timeout_s: float = 2.0,
+        stale_after_s: float = 15.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.checks = checks
+        self.required = frozenset(checks) if required is None else required
+        self.interval_s = interval_s
+        self.timeout_s = timeout_s
+        self.stale_after_s = stale_after_s
+        self._clock = clock
+        self.results: dict[str, ProbeResult] = {}
+        self.checked_at: float | None = None
+        self._task: asyncio.Task | None = None
+
+    async def _check(self, check: Check) -> ProbeResult:
+        start = time.perf_counter()
+        error: str | None = None
+        try:
+            await asyncio.wait_for(check(), self.timeout_s)
+        except TimeoutError:
+            error = f"timed out after {self.timeout_s}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        latency_ms = (time.perf_counter() - start) * 1000
+        return ProbeResult(ok=error is None, latency_ms=round(latency_ms, 3), error=error)
+
+    async def probe(self) -> dict[str, ProbeResult]:
+        """Run all checks concurrently and store their results"""
+        names = list(self.checks)
+        outcomes = await asyncio.gather(*(self._check(self.checks[n]) for n in names))
+        self.results = dict(zip(names, outcomes))
+        self.checked_at = self._clock()
+        return self.results
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def age_s(self) -> float | None:
+        """Seconds since the last completed probe, or None before the first"""
+        if self.checked_at is None:
+            return None
+        return self._clock() - self.checked_at
+
+    @property
+    def stale(self) -> bool:
+        age = self.age_s
+        return age is None or age > self.stale_after_s
+
+    @property
+    def ready(self) -> bool:
+        """Fresh results with every required dependency up"""
+        if self.stale:
+            return False
+        return all(self.results.get(n, ProbeResult(False, 0.0)).ok for n in self.required)
+
+    @property
+    def degraded(self) -> list[str]:
+        """Optional dependencies that were down at the last probe"""
+        return sorted(
+            n for n, result in self.results.items() if n not in self.required and not result.ok
+        )
+
+    async def current(self) -> dict[str, ProbeResult]:
+        """Latest results; probes inline only when no background task is running"""
+        if not self.running and self.stale:
+            await self.probe()
+        return self.results
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.probe()
+            except Exception:
+                logger.exception("Health probe failed")
+            await asyncio.sleep(self.interval_s)
+
+    def start(self) -> None:
+        """Start probing in the background on the running loop"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+def _select_one() -> None:
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+async def check_database() -> None:
+    """SELECT 1 on the primary, off the event loop"""
+    await asyncio.to_thread(_select_one)
+
+
+async def check_replica() -> None:
+    """Replica reachability and lag against replica_max_lag_s"""
+    lag = await asyncio.to_thread(read_router.measure_lag)
+    if lag > read_router.max_lag_s:
+        raise RuntimeError(f"replication lag {lag:.1f}s")
+
+
+def default_checks() -> dict[str, Check]:
+    """Database and Redis, plus the read replica when one is configured"""
+    checks: dict[str, Check] = {"database": check_database, "redis": aping}
+    if read_router.replica is not None:
+        checks["replica"] = check_replica
+    return checks
+
+
+# Reads fall back to the primary and Redis users to local state, so neither
+# a bad replica nor a Redis outage fails readiness
+prober = HealthProber(
+    default_checks(),
+    required=frozenset({"database"}),
+    interval_s=settings.health_check_interval_s,
+    timeout_s=settings.health_check_timeout_s,
+    stale_after_s=settings.health_stale_after_s,
+)
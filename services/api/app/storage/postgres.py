@@ -1,33 +1,398 @@
 """PostgreSQL storage"""
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import logging
+import threading
+import time
+from typing import Any
+
+from sqlalchemy import (
+    ColumnElement,
+    Engine,
+    Index,
+    case,
+    create_engine,
+    event,
+    func,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.orm import Session, sessionmaker
 
 from ..config import settings
-from ..models.orm import Base
+from ..models.orm import Base, Pipeline, Step
+from .local_cache import LRUCache
+
+logger = logging.getLogger(__name__)
 
 engine = create_engine(settings.database_url, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Seconds behind the primary; 0 when the server is not a standby or has replayed everything
+_PG_REPLICA_LAG_SQL = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class ReplicaRouter:
+    """
+    Hand out read-only sessions bound to a read replica.
+
+    Replica health and lag are probed at most once per check interval; while
+    the replica is unreachable or lagging more than max_lag_s, reads fall
+    back to the primary.
+    """
+
+    def __init__(
+        self,
+        primary: Engine,
+        replica: Engine | None = None,
+        max_lag_s: float = 30.0,
+        check_interval_s: float = 5.0,
+    ) -> None:
+        self.primary_session = sessionmaker(autocommit=False, autoflush=False, bind=primary)
+        self.replica_session = (
+            sessionmaker(autocommit=False, autoflush=False, bind=replica) if replica else None
+        )
+        self.replica = replica
+        self.max_lag_s = max_lag_s
+        self.check_interval_s = check_interval_s
+        self.last_lag_s: float | None = None
+        self._replica_ok = False
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def measure_lag(self) -> float:
+        """Return the replica's replication lag in seconds"""
+        assert self.replica is not None
+        with self.replica.connect() as conn:
+            if self.replica.dialect.name == "postgresql":
+                return float(conn.execute(_PG_REPLICA_LAG_SQL).scalar() or 0)
+            conn.execute(text("SELECT 1"))
+            return 0.0
+
+    def replica_available(self) -> bool:
+        """Whether reads should currently go to the replica"""
+        if self.replica is None:
+            return False
+
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval_s:
+            return self._replica_ok
+
+        with self._lock:
+            if now - self._checked_at < self.check_interval_s:
+                return self._replica_ok
+            try:
+                self.last_lag_s = self.measure_lag()
+                self._replica_ok = self.last_lag_s <= self.max_lag_s
+                if not self._replica_ok:
+                    logger.warning(
+                        "Read replica lagging %.1fs, reading from primary", self.last_lag_s
+                    )
+            except Exception as e:
+                self.last_lag_s = None
+                self._replica_ok = False
+                logger.warning("Read replica unavailable, reading from primary: %s", e)
+            self._checked_at = now
+        return self._replica_ok
+
+    def session(self) -> Session:
+        """Create a read-only session on the replica, or the primary as fallback"""
+        if self.replica_session is not None and self.replica_available():
+            return self.replica_session()
+        return self.primary_session()
+
+
+replica_engine = (
+    create_engine(settings.database_replica_url, pool_pre_ping=True)
+    if settings.database_replica_url
+    else None
+)
+read_router = ReplicaRouter(
+    engine,
+    replica_engine,
+    max_lag_s=settings.replica_max_lag_s,
+    check_interval_s=settings.replica_check_interval_s,
+)
+
+ReadSessionLocal = read_router.session
+
+# Pipeline name -> id. Only ids of committed rows are cached.
+pipeline_ids = LRUCache(maxsize=settings.pipeline_cache_size)
+
+_PENDING_PIPELINES = "im_pending_pipeline_ids"
+
 
 def init_db() -> None:
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
 
 
+def check_schema(bind: Engine = engine) -> tuple[list[str], list[str]]:
+    """Tables and table.column names of the ORM models missing from the database"""
+    inspector = inspect(bind)
+    existing = {
+        table: {c["name"] for c in columns}
+        for (_, table), columns in inspector.get_multi_columns().items()
+    }
+    missing_tables: list[str] = []
+    missing_columns: list[str] = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            missing_tables.append(table.name)
+            continue
+        missing_columns.extend(
+            f"{table.name}.{c.name}" for c in table.columns if c.name not in existing[table.name]
+        )
+    return missing_tables, missing_columns
+
+
+def missing_unique_indexes(bind: Engine = engine) -> list[Index]:
+    """Unique indexes of the ORM models missing from existing tables (upserts rely on them)"""
+    inspector = inspect(bind)
+    existing = {
+        table: {index["name"] for index in indexes}
+        for (_, table), indexes in inspector.get_multi_indexes().items()
+    }
+    return [
+        index
+        for table in Base.metadata.sorted_tables
+        if table.name in existing
+        for index in table.indexes
+        if index.unique and index.name not in existing[table.name]
+    ]
+
+
+def ensure_schema(bind: Engine = engine) -> None:
+    """
+    Fail fast unless the database has every table, column and unique index the
+    models use. Missing tables and indexes are created when
+    db_create_missing_tables is set; missing columns always need a migration.
+    """
+    missing_tables, missing_columns = check_schema(bind)
+    indexes = missing_unique_indexes(bind)
+    if missing_tables and settings.db_create_missing_tables:
+        logger.warning("Creating missing tables: %s", ", ".join(missing_tables))
+        Base.metadata.create_all(
+            bind=bind, tables=[Base.metadata.tables[t] for t in missing_tables]
+        )
+        missing_tables = []
+    if indexes and settings.db_create_missing_tables:
+        logger.warning("Creating missing indexes: %s", ", ".join(str(i.name) for i in indexes))
+        for index in indexes:
+            index.create(bind=bind)
+        indexes = []
+    missing = missing_tables + missing_columns + [f"index {i.name}" for i in indexes]
+    if missing:
+        raise RuntimeError(
+            "Database schema is out of date, missing: "
+            + ", ".join(missing)
+            + " (create tables with `python -m app.storage.postgres`)"
+        )
+
+
+def dialect_insert(db: Session, model: Any) -> Any:
+    """Dialect-specific INSERT supporting ON CONFLICT, or None if unsupported"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+
+        return postgresql_insert(model)
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+        return sqlite_insert(model)
+    return None
+
+
+def lock_or_create(db: Session, model: Any, **pk: Any) -> Any:
+    """
+    Get a row by primary key with a row lock, inserting an empty one first if
+    needed. Primary key values must be passed in column order.
+    """
+    insert = dialect_insert(db, model)
+    if insert is not None:
+        db.execute(insert.values(**pk).on_conflict_do_nothing(index_elements=list(pk)))
+    identity = tuple(pk.values()) if len(pk) > 1 else next(iter(pk.values()))
+    row = db.get(model, identity, with_for_update=True, populate_existing=True)
+    if row is None:
+        row = model(**pk)
+        db.add(row)
+        db.flush()
+    return row
+
+
+# Counters a step's end reports, stored as sent
+STEP_COUNTERS = (
+    "cpu_time_s",
+    "rss_max_bytes",
+    "io_r_bytes",
+    "io_w_bytes",
+    "cache_hits",
+    "cache_misses",
+)
+
+
+def _fill_counters(row: dict[str, Any]) -> dict[str, Any]:
+    # A new step that has only started has no cache activity yet; a stop
+    # without cache counters leaves whatever was scraped
+    if row.get("end_ts") is not None:
+        return row
+    return {
+        **row,
+        "cache_hits": row.get("cache_hits") or 0,
+        "cache_misses": row.get("cache_misses") or 0,
+    }
+
+
+def upsert_steps(db: Session, rows: list[dict[str, Any]]) -> None:
+    """
+    Insert or merge steps by (run_id, span_id) in one statement. A None in a
+    row keeps the stored value, and counters are only taken from rows with an
+    end_ts, so a late or replayed start never clears them. A stop's counters
+    never lower stored ones either, so fallback counters (the Jenkins
+    wrapper's) cannot undo what was scraped from the node agent. Rows must
+    all have the same keys, including end_ts.
+    """
+    if not rows:
+        return
+    insert = dialect_insert(db, Step)
+    if insert is None:
+        for row in rows:
+            step = db.execute(
+                select(Step).where(Step.run_id == row["run_id"], Step.span_id == row["span_id"])
+            ).scalar_one_or_none()
+            if step is None:
+                db.add(Step(**_fill_counters(row)))
+                continue
+            for column, value in row.items():
+                if value is None:
+                    continue
+                if column in STEP_COUNTERS:
+                    stored = getattr(step, column)
+                    if not row["end_ts"] or (stored is not None and stored > value):
+                        continue
+                setattr(step, column, value)
+        db.flush()
+        return
+
+    table = Step.__table__
+    merged: dict[str, ColumnElement[Any]] = {
+        column: func.coalesce(insert.excluded[column], table.c[column])
+        for column in rows[0]
+        if column not in ("run_id", "span_id", *STEP_COUNTERS)
+    }
+    merged.update(
+        {
+            counter: case(
+                (insert.excluded.end_ts.is_(None), table.c[counter]),
+                (table.c[counter] > insert.excluded[counter], table.c[counter]),
+                else_=func.coalesce(insert.excluded[counter], table.c[counter]),
+            )
+            for counter in STEP_COUNTERS
+        }
+    )
+    db.execute(
+        insert.on_conflict_do_update(index_elements=["run_id", "span_id"], set_=merged),
+        [_fill_counters(row) for row in rows],
+    )
+
+
+def get_pipeline_id(db: Session, name: str) -> int | None:
+    """Look up a pipeline id by name, served from the in-process cache when possible"""
+    pipeline_id: int | None = pipeline_ids.get(name)
+    if pipeline_id is not None:
+        return pipeline_id
+
+    pipeline_id = db.execute(select(Pipeline.id).where(Pipeline.name == name)).scalar()
+    if pipeline_id is not None:
+        pipeline_ids.set(name, pipeline_id)
+    return pipeline_id
+
+
+def get_or_create_pipeline_id(db: Session, name: str, repo: str = "unknown") -> int:
+    """
+    Get or create a pipeline and return its id.
+
+    Creation is an INSERT ... ON CONFLICT DO NOTHING RETURNING upsert, so
+    concurrent builds of a new pipeline cannot create duplicates. A freshly
+    inserted id is only cached once the session commits.
+    """
+    pipeline_id: int | None = pipeline_ids.get(name)
+    if pipeline_id is not None:
+        return pipeline_id
+
+    insert = dialect_insert(db, Pipeline)
+    if insert is None:
+        pipeline_id = get_pipeline_id(db, name)
+        if pipeline_id is None:
+            pipeline = Pipeline(name=name, repo=repo)
+            db.add(pipeline)
+            db.flush()
+            pipeline_id = int(pipeline.id)
+            db.info.setdefault(_PENDING_PIPELINES, {})[name] = pipeline_id
+        return pipeline_id
+
+    stmt = (
+        insert.values(name=name, repo=repo)
+        .on_conflict_do_nothing(index_elements=[Pipeline.name])
+        .returning(Pipeline.id)
+    )
+    inserted = db.execute(stmt).scalar()
+    if inserted is not None:
+        pipeline_id = int(inserted)
+        db.info.setdefault(_PENDING_PIPELINES, {})[name] = pipeline_id
+        return pipeline_id
+
+    # Row already existed (or a concurrent transaction just committed it)
+    pipeline_id = db.execute(select(Pipeline.id).where(Pipeline.name == name)).scalar_one()
+    pipeline_ids.set(name, pipeline_id)
+    return pipeline_id
+
+
+def invalidate_pipeline(name: str | None = None) -> None:
+    """Drop one cached pipeline id, or all of them"""
+    if name is None:
+        pipeline_ids.clear()
+    else:
+        pipeline_ids.pop(name)
+
+
+@event.listens_for(Session, "after_commit")
+def _promote_pending_pipelines(session: Session) -> None:
+    """Cache pipeline ids created in a transaction once it commits"""
+    pending = session.info.pop(_PENDING_PIPELINES, None)
+    if pending:
+        for name, pipeline_id in pending.items():
+            pipeline_ids.set(name, pipeline_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_pipelines(session: Session) -> None:
+    """Forget pipeline ids created in a rolled back transaction"""
+    session.info.pop(_PENDING_PIPELINES, None)
+
+
 def get_recent_runs(pipeline_name: str, limit: int = 100) -> list[dict]:
     """Get recent runs for a pipeline"""
-    from ..models.orm import Run, Pipeline
+    from ..models.orm import Run
 
-    session = SessionLocal()
+    session = ReadSessionLocal()
     try:
-        pipeline = session.query(Pipeline).filter(Pipeline.name == pipeline_name).first()
-        if not pipeline:
+        pipeline_id = get_pipeline_id(session, pipeline_name)
+        if pipeline_id is None:
             return []
 
         runs = (
             session.query(Run)
-            .filter(Run.pipeline_id == pipeline.id, Run.status == "success")
+            .filter(Run.pipeline_id == pipeline_id, Run.status == "success")
             .order_by(Run.started_at.desc())
             .limit(limit)
             .all()
@@ -46,3 +411,8 @@ def get_recent_runs(pipeline_name: str, limit: int = 100) -> list[dict]:
         ]
     finally:
         session.close()
+
+
+if __name__ == "__main__":
+    # Provision the schema ahead of deploys; the API only checks it at startup
+    init_db()
@@ -1,48 +1,483 @@
-"""Redis cache storage"""
+"""Redis cache storage
 
-import json
-from typing import Any
+Every helper exists in a blocking form (for scripts and the trainer) and an
+`a`-prefixed asyncio form for request handlers. The asyncio client shares
+one explicitly sized connection pool per worker, created in the FastAPI
+lifespan. Both forms report to redis_operations_total and
+redis_operation_duration_seconds, and both go through one circuit breaker:
+with tight socket timeouts a stalled Redis fails fast, and once the circuit
+opens calls raise CircuitOpenError immediately until a probe succeeds.
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from collections.abc import Callable
+from typing import Any, TypeVar
 
 import redis
+import redis.asyncio as aredis
 
 from ..config import settings
+from ..middleware.metrics import (
+    redis_operation_duration_seconds,
+    redis_operations_total,
+    redis_pool_connections,
+)
+from .circuit_breaker import CircuitBreaker
+from .codecs import Codec
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Errors that mean Redis is unreachable or stalled, as opposed to a bad command
+UNAVAILABLE_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+
+class CircuitOpenError(redis.ConnectionError):
+    """Raised instead of calling Redis while the circuit is open"""
+
+
+breaker = CircuitBreaker(
+    "redis",
+    failure_threshold=settings.redis_breaker_failures,
+    reset_timeout_s=settings.redis_breaker_reset_s,
+)
+
+_timeouts = {
+    "socket_timeout": settings.redis_socket_timeout,
+    "socket_connect_timeout": settings.redis_connect_timeout,
+}
+
+# Binary client: cache values are codec-encoded bytes
+redis_client = redis.from_url(settings.redis_url, **_timeouts)
+
+codec = Codec(
+    serializer=settings.cache_serializer,
+    compression=settings.cache_compression,
+    compress_min_bytes=settings.cache_compress_min_bytes,
+)
+
+_async_client: aredis.Redis | None = None
+_async_loop: asyncio.AbstractEventLoop | None = None
+
+# Served while Redis is unavailable
+_last_model_version = settings.model_version
+
+
+def _record(operation: str, start: float, status: str) -> None:
+    redis_operations_total.labels(operation=operation, status=status).inc()
+    redis_operation_duration_seconds.labels(operation=operation).observe(
+        time.perf_counter() - start
+    )
+
+
+def _admit(operation: str) -> None:
+    if not breaker.allow():
+        redis_operations_total.labels(operation=operation, status="rejected").inc()
+        raise CircuitOpenError("Redis circuit is open")
+
+
+def _failed(operation: str, start: float, error: Exception) -> None:
+    _record(operation, start, "error")
+    if isinstance(error, UNAVAILABLE_ERRORS):
+        breaker.record_failure()
+    else:
+        # The server answered, so it is reachable
+        breaker.record_success()
+
+
+def instrumented(operation: str) -> Callable[[F], F]:
+    """Guard a Redis helper with the circuit breaker, counting and timing it"""
+
+    def decorator(func: F) -> F:
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                _admit(operation)
+                start = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    _failed(operation, start, e)
+                    raise
+                finally:
+                    _refresh_pool_metrics()
+                _record(operation, start, "ok")
+                breaker.record_success()
+                return result
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            _admit(operation)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                _failed(operation, start, e)
+                raise
+            _record(operation, start, "ok")
+            breaker.record_success()
+            return result
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+# Async client lifecycle
 
-redis_client = redis.from_url(settings.redis_url, decode_responses=True)
+def init_async_redis() -> aredis.Redis:
+    """Create the shared asyncio client and its connection pool"""
+    global _async_client, _async_loop
+    pool = aredis.BlockingConnectionPool.from_url(
+        settings.redis_url,
+        max_connections=settings.redis_max_connections,
+        timeout=settings.redis_pool_timeout,
+        **_timeouts,
+    )
+    _async_client = aredis.Redis(connection_pool=pool)
+    _async_loop = asyncio.get_running_loop()
+    _refresh_pool_metrics()
+    return _async_client
 
 
+def get_async_redis() -> aredis.Redis:
+    """Get the shared asyncio client, creating it on first use"""
+    # Connections are bound to the loop that opened them
+    if _async_client is None or _async_loop is not asyncio.get_running_loop():
+        return init_async_redis()
+    return _async_client
+
+
+async def close_async_redis() -> None:
+    """Close the shared asyncio client and disconnect its pool"""
+    global _async_client, _async_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+        await _async_client.connection_pool.disconnect()
+    _async_client = None
+    _async_loop = None
+    _refresh_pool_metrics()
+
+
+def _refresh_pool_metrics() -> None:
+    # Set explicitly rather than via set_function, which multiprocess mode
+    # cannot aggregate across workers
+    pool = _async_client.connection_pool if _async_client is not None else None
+    redis_pool_connections.labels(state="max").set(pool.max_connections if pool else 0)
+    for state, attr in (("in_use", "_in_use_connections"), ("idle", "_available_connections")):
+        redis_pool_connections.labels(state=state).set(len(getattr(pool, attr, ())))
+
+
+def _feature_key(run_id: str) -> str:
+    return f"im:feat:{run_id}"
+
+
+def _suggestion_key(pipeline: str) -> str:
+    return f"im:last_suggest:{pipeline}"
+
+
+def _regression_key(pipeline_id: int) -> str:
+    return f"im:regress:{pipeline_id}"
+
+
+def _decode_many(values: list[Any]) -> list[Any | None]:
+    return [codec.decode(v) if v is not None else None for v in values]
+
+
+# Blocking helpers
+
+@instrumented("mget")
+def get_many(keys: list[str]) -> list[Any | None]:
+    """Get and decode many keys in one MGET round trip"""
+    if not keys:
+        return []
+    return _decode_many(redis_client.mget(keys))
+
+
+@instrumented("mset")
+def set_many(items: dict[str, Any], ttl: int | None = None) -> None:
+    """Encode and set many keys in one pipelined round trip"""
+    if not items:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for key, value in items.items():
+        pipe.set(key, codec.encode(value), ex=ttl)
+    pipe.execute()
+
+
+@instrumented("cache_features")
 def cache_features(run_id: str, features: dict[str, Any], ttl: int | None = None) -> None:
     """Cache feature vector"""
-    key = f"im:feat:{run_id}"
     ttl = ttl or settings.feature_cache_ttl
-    redis_client.setex(key, ttl, json.dumps(features))
+    redis_client.set(_feature_key(run_id), codec.encode(features), ex=ttl)
+
+
+def cache_many_features(features: dict[str, dict[str, Any]], ttl: int | None = None) -> None:
+    """Cache feature vectors for many runs in one round trip"""
+    ttl = ttl or settings.feature_cache_ttl
+    set_many({_feature_key(run_id): f for run_id, f in features.items()}, ttl=ttl)
 
 
+@instrumented("get_features")
 def get_cached_features(run_id: str) -> dict[str, Any] | None:
     """Get cached features"""
-    key = f"im:feat:{run_id}"
-    data = redis_client.get(key)
-    return json.loads(data) if data else None
+    data = redis_client.get(_feature_key(run_id))
+    return codec.decode(data) if data else None
 
 
+def get_many_cached_features(run_ids: list[str]) -> list[dict[str, Any] | None]:
+    """Get cached features for many runs in one round trip"""
+    return get_many([_feature_key(run_id) for run_id in run_ids])
+
+
+@instrumented("delete_features")
+def delete_cached_features(run_id: str) -> None:
+    """Drop cached features"""
+    redis_client.delete(_feature_key(run_id))
+
+
+@instrumented("publish")
+def publish(channel: str, message: str) -> None:
+    """Publish a message to a pub/sub channel"""
+    redis_client.publish(channel, message)
+
+
+@instrumented("cache_suggestion")
 def cache_suggestion(pipeline: str, suggestion: dict[str, Any]) -> None:
     """Cache last suggestion for pipeline"""
-    key = f"im:last_suggest:{pipeline}"
-    redis_client.set(key, json.dumps(suggestion))
+    redis_client.set(_suggestion_key(pipeline), codec.encode(suggestion))
+
 
+def cache_suggestions(suggestions: dict[str, dict[str, Any]]) -> None:
+    """Cache last suggestions for many pipelines in one round trip"""
+    set_many({_suggestion_key(p): s for p, s in suggestions.items()})
 
+
+@instrumented("get_suggestion")
 def get_cached_suggestion(pipeline: str) -> dict[str, Any] | None:
     """Get cached suggestion"""
-    key = f"im:last_suggest:{pipeline}"
-    data = redis_client.get(key)
-    return json.loads(data) if data else None
+    data = redis_client.get(_suggestion_key(pipeline))
+    return codec.decode(data) if data else None
+
+
+def get_cached_suggestions(pipelines: list[str]) -> list[dict[str, Any] | None]:
+    """Get cached suggestions for many pipelines in one round trip"""
+    return get_many([_suggestion_key(p) for p in pipelines])
+
+
+def _remember_model_version(version: bytes | str | None) -> str:
+    global _last_model_version
+    if version:
+        _last_model_version = version.decode() if isinstance(version, bytes) else version
+    return _last_model_version
+
+
+@instrumented("get_model_version")
+def _read_model_version() -> bytes | str | None:
+    return redis_client.get("im:model:active")
 
 
 def get_active_model_version() -> str:
-    """Get active model version"""
-    version = redis_client.get("im:model:active")
-    return version or "v1"
+    """Get active model version, or the last known one while Redis is unavailable"""
+    try:
+        return _remember_model_version(_read_model_version())
+    except redis.RedisError as e:
+        logger.warning("Serving last known model version: %s", e)
+        return _last_model_version
 
 
+@instrumented("set_model_version")
 def set_active_model_version(version: str) -> None:
     """Set active model version"""
     redis_client.set("im:model:active", version)
+    _remember_model_version(version)
+
+
+@instrumented("ping")
+def ping() -> bool:
+    """Check Redis connectivity"""
+    return bool(redis_client.ping())
+
+
+# Async helpers
+
+@instrumented("mget")
+async def aget_many(keys: list[str]) -> list[Any | None]:
+    """Get and decode many keys in one MGET round trip"""
+    if not keys:
+        return []
+    return _decode_many(await get_async_redis().mget(keys))
+
+
+@instrumented("mset")
+async def aset_many(items: dict[str, Any], ttl: int | None = None) -> None:
+    """Encode and set many keys in one pipelined round trip"""
+    if not items:
+        return
+    async with get_async_redis().pipeline(transaction=False) as pipe:
+        for key, value in items.items():
+            pipe.set(key, codec.encode(value), ex=ttl)
+        await pipe.execute()
+
+
+@instrumented("incrby")
+async def aincr_many(counts: dict[str, int], ttl: int) -> list[int]:
+    """Add to many counters in one pipelined round trip, returning their new values"""
+    if not counts:
+        return []
+    async with get_async_redis().pipeline(transaction=False) as pipe:
+        for key, amount in counts.items():
+            pipe.incrby(key, amount)
+            pipe.expire(key, ttl)
+        results = await pipe.execute()
+    return results[::2]
+
+
+@instrumented("update")
+async def aupdate(
+    key: str, update: Callable[[Any | None], Any], ttl: int | None = None, attempts: int = 5
+) -> Any:
+    """
+    Read-modify-write one key atomically (WATCH/MULTI): update gets the
+    decoded value (None if missing) and returns the new one. Retried when
+    another writer got in first.
+    """
+    client = get_async_redis()
+    for _ in range(attempts):
+        async with client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                current = await pipe.get(key)
+                value = update(codec.decode(current) if current is not None else None)
+                pipe.multi()
+                pipe.set(key, codec.encode(value), ex=ttl)
+                await pipe.execute()
+                return value
+            except redis.WatchError:
+                continue
+    raise redis.WatchError(f"{key} kept changing during {attempts} attempts")
+
+
+@instrumented("lease")
+async def aacquire_lease(name: str, owner: str, ttl_ms: int) -> bool:
+    """
+    Take or renew a lease on name for owner, for ttl_ms. False while another
+    owner holds it; the holder renews before it expires to keep it.
+    """
+    key = f"im:lease:{name}"
+    async with get_async_redis().pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(key)
+            holder = await pipe.get(key)
+            if holder is not None and holder != owner.encode():
+                return False
+            pipe.multi()
+            pipe.set(key, owner, px=ttl_ms)
+            await pipe.execute()
+            return True
+        except redis.WatchError:
+            # Someone else took it between our read and write
+            return False
+
+
+async def aupdate_regression_state(
+    pipeline_id: int, update: Callable[[Any | None], Any], ttl: int | None = None
+) -> Any:
+    """Atomically update a pipeline's regression detector state"""
+    return await aupdate(_regression_key(pipeline_id), update, ttl)
+
+
+@instrumented("cache_features")
+async def acache_features(run_id: str, features: dict[str, Any], ttl: int | None = None) -> None:
+    """Cache feature vector"""
+    ttl = ttl or settings.feature_cache_ttl
+    await get_async_redis().set(_feature_key(run_id), codec.encode(features), ex=ttl)
+
+
+async def acache_many_features(
+    features: dict[str, dict[str, Any]], ttl: int | None = None
+) -> None:
+    """Cache feature vectors for many runs in one round trip"""
+    ttl = ttl or settings.feature_cache_ttl
+    await aset_many({_feature_key(run_id): f for run_id, f in features.items()}, ttl=ttl)
+
+
+@instrumented("get_features")
+async def aget_cached_features(run_id: str) -> dict[str, Any] | None:
+    """Get cached features"""
+    data = await get_async_redis().get(_feature_key(run_id))
+    return codec.decode(data) if data else None
+
+
+async def aget_many_cached_features(run_ids: list[str]) -> list[dict[str, Any] | None]:
+    """Get cached features for many runs in one round trip"""
+    return await aget_many([_feature_key(run_id) for run_id in run_ids])
+
+
+@instrumented("delete_features")
+async def adelete_cached_features(run_id: str) -> None:
+    """Drop cached features"""
+    await get_async_redis().delete(_feature_key(run_id))
+
+
+@instrumented("publish")
+async def apublish(channel: str, message: str) -> None:
+    """Publish a message to a pub/sub channel"""
+    await get_async_redis().publish(channel, message)
+
+
+@instrumented("cache_suggestion")
+async def acache_suggestion(pipeline: str, suggestion: dict[str, Any]) -> None:
+    """Cache last suggestion for pipeline"""
+    await get_async_redis().set(_suggestion_key(pipeline), codec.encode(suggestion))
+
+
+async def acache_suggestions(suggestions: dict[str, dict[str, Any]]) -> None:
+    """Cache last suggestions for many pipelines in one round trip"""
+    await aset_many({_suggestion_key(p): s for p, s in suggestions.items()})
+
+
+@instrumented("get_suggestion")
+async def aget_cached_suggestion(pipeline: str) -> dict[str, Any] | None:
+    """Get cached suggestion"""
+    data = await get_async_redis().get(_suggestion_key(pipeline))
+    return codec.decode(data) if data else None
+
+
+async def aget_cached_suggestions(pipelines: list[str]) -> list[dict[str, Any] | None]:
+    """Get cached suggestions for many pipelines in one round trip"""
+    return await aget_many([_suggestion_key(p) for p in pipelines])
+
+
+@instrumented("get_model_version")
+async def _aread_model_version() -> bytes | str | None:
+    return await get_async_redis().get("im:model:active")
+
+
+async def aget_active_model_version() -> str:
+    """Get active model version, or the last known one while Redis is unavailable"""
+    try:
+        return _remember_model_version(await _aread_model_version())
+    except redis.RedisError as e:
+        logger.warning("Serving last known model version: %s", e)
+        return _last_model_version
+
+
+@instrumented("set_model_version")
+async def aset_active_model_version(version: str) -> None:
+    """Set active model version"""
+    await get_async_redis().set("im:model:active", version)
+    _remember_model_version(version)
+
+
+@instrumented("ping")
+async def aping() -> bool:
+    """Check Redis connectivity"""
+    return bool(await get_async_redis().ping())
@@ -0,0 +1,331 @@
+"""History retention: steps partitions, rollup summarization and chunked purging
+
+Runs older than retention_days are folded into pipeline_period_stats and
+then removed with their steps and dependents. On Postgres the steps table
+is range-partitioned by run id (alembic revision 0001), one partition per
+steps_partition_runs runs, so a block of expired runs loses its steps by
+detaching and dropping a partition instead of deleting rows. Runs cannot be
+partitioned themselves: trace ingestion upserts on the unique run_id, and a
+partitioned table's unique keys must include its partition key. Elsewhere
+(SQLite, or a schema not yet migrated) expired runs are deleted
+retention_chunk_size runs per transaction, so locks and WAL stay bounded.
+Run `python -m app.storage.retention` daily (k8s/retention-cronjob.yaml);
+each pass also creates the steps partitions new runs will need.
+"""
+
+import logging
+import re
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from sqlalchemy import Connection, Engine, func, or_, select, text
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..ml.sketch import DDSketch
+from ..models.orm import (
+    Feature,
+    NodeSeriesBlock,
+    PipelinePeriodStats,
+    Run,
+    Step,
+    StepSeriesBlock,
+    Suggestion,
+)
+from .postgres import SessionLocal, engine, lock_or_create
+
+logger = logging.getLogger(__name__)
+
+# The partitioned table, keyed by run_id ranges
+PARTITIONED_TABLE = "steps"
+
+_BOUNDS = re.compile(r"FOR VALUES FROM \('?(\d+)'?\) TO \('?(\d+)'?\)")
+
+run_cols = Run.__table__.c
+
+
+def month_start(ts: datetime) -> datetime:
+    """First instant of the month containing ts"""
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def partition_name(lo: int) -> str:
+    """Name of the steps partition for run ids starting at lo"""
+    return f"{PARTITIONED_TABLE}_p{lo}"
+
+
+def next_partitions(upper: int, next_id: int, size: int, ahead: int) -> list[tuple[int, int]]:
+    """Run id ranges to add after upper so ahead whole blocks follow next_id"""
+    blocks = []
+    while upper < next_id + size * ahead:
+        blocks.append((upper, upper + size))
+        upper += size
+    return blocks
+
+
+def is_partitioned(conn: Connection, table: str = PARTITIONED_TABLE) -> bool:
+    """Whether a table is a declaratively partitioned Postgres table"""
+    if conn.dialect.name != "postgresql":
+        return False
+    row = conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :table"
+        ),
+        {"table": table},
+    ).first()
+    return row is not None
+
+
+def list_partitions(
+    conn: Connection, table: str = PARTITIONED_TABLE
+) -> dict[str, tuple[int, int] | None]:
+    """Map a partitioned table's partitions to their run id range (None for DEFAULT)"""
+    rows = conn.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :table"
+        ),
+        {"table": table},
+    )
+    partitions: dict[str, tuple[int, int] | None] = {}
+    for name, bound in rows:
+        match = _BOUNDS.search(bound or "")
+        partitions[name] = (int(match[1]), int(match[2])) if match else None
+    return partitions
+
+
+def ensure_partitions(bind: Engine, size: int | None = None, ahead: int | None = None) -> list[str]:
+    """
+    Create steps partitions so that ahead empty blocks of size run ids follow
+    the newest run, plus a DEFAULT partition. No-op unless steps is partitioned.
+    """
+    size = size or settings.steps_partition_runs
+    ahead = settings.steps_partitions_ahead if ahead is None else ahead
+    default = f"{PARTITIONED_TABLE}_default"
+    created = []
+
+    with bind.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        existing = list_partitions(conn)
+        if default not in existing:
+            conn.execute(
+                text(f'CREATE TABLE "{default}" PARTITION OF "{PARTITIONED_TABLE}" DEFAULT')
+            )
+            created.append(default)
+
+        upper = max((bounds[1] for bounds in existing.values() if bounds), default=0)
+        # Rows the DEFAULT partition caught would violate a new range over them
+        stray = conn.execute(text(f'SELECT max(run_id) FROM "{default}"')).scalar()
+        if stray is not None and stray >= upper:
+            logger.warning(
+                "%s holds steps of runs up to %d, raise steps_partitions_ahead", default, stray
+            )
+            upper += (stray - upper) // size * size + size
+
+        next_id = conn.execute(select(func.coalesce(func.max(run_cols.id), 0) + 1)).scalar_one()
+        for lo, hi in next_partitions(upper, next_id, size, ahead):
+            name = partition_name(lo)
+            conn.execute(
+                text(
+                    f'CREATE TABLE "{name}" PARTITION OF "{PARTITIONED_TABLE}" '
+                    f"FOR VALUES FROM ({lo}) TO ({hi})"
+                )
+            )
+            created.append(name)
+
+    if created:
+        logger.info("Created partitions: %s", ", ".join(created))
+    return created
+
+
+def summarize_runs(db: Session, runs: list[Run]) -> None:
+    """Fold runs into their pipeline's monthly period rollup"""
+    if not runs:
+        return
+
+    ids = [r.id for r in runs]
+    step_rows: list[Any] = (
+        db.query(Step.run_id, func.max(Step.rss_max_bytes), func.count(Step.id))
+        .filter(Step.run_id.in_(ids))
+        .group_by(Step.run_id)
+        .all()
+    )
+    step_stats = {run_id: (rss or 0, count) for run_id, rss, count in step_rows}
+
+    groups: dict[tuple[int, datetime], list[Run]] = {}
+    for run in runs:
+        period = month_start(run.started_at or run.finished_at or datetime.utcnow())
+        groups.setdefault((run.pipeline_id, period), []).append(run)
+
+    for (pipeline_id, period), group in groups.items():
+        row = lock_or_create(
+            db, PipelinePeriodStats, pipeline_id=pipeline_id, period_start=period
+        )
+        durations = DDSketch.from_dict(row.duration_sketch)
+        rss = DDSketch.from_dict(row.rss_sketch)
+
+        for run in group:
+            max_rss, step_count = step_stats.get(run.id, (0, 0))
+            row.runs_total = (row.runs_total or 0) + 1
+            row.step_count = (row.step_count or 0) + step_count
+            if run.status == "success":
+                row.runs_success = (row.runs_success or 0) + 1
+                if run.duration_s is not None:
+                    durations.add(run.duration_s)
+                    row.duration_sum_s = (row.duration_sum_s or 0.0) + run.duration_s
+            if max_rss:
+                rss.add(max_rss)
+
+        row.duration_sketch = durations.to_dict()
+        row.rss_sketch = rss.to_dict()
+
+    db.flush()
+
+
+def _detach_dependents(db: Session, runs: list[Run]) -> None:
+    """Delete features and step series, and unlink suggestions, of runs about to be removed"""
+    ids = [r.id for r in runs]
+    keys = [r.run_id for r in runs if r.run_id]
+    db.query(Feature).filter(Feature.run_id.in_(ids)).delete(synchronize_session=False)
+    step_ids = select(Step.id).where(Step.run_id.in_(ids))
+    db.query(StepSeriesBlock).filter(StepSeriesBlock.step_id.in_(step_ids)).delete(
+        synchronize_session=False
+    )
+    if keys:
+        db.query(Suggestion).filter(Suggestion.run_id.in_(keys)).update(
+            {Suggestion.run_id: None}, synchronize_session=False
+        )
+
+
+def purge_expired_runs(db: Session, cutoff: datetime, chunk_size: int | None = None) -> int:
+    """
+    Summarize and delete runs started before cutoff, chunk_size runs per
+    transaction, so locks and WAL stay bounded however much has expired.
+    """
+    chunk_size = chunk_size or settings.retention_chunk_size
+    purged = 0
+
+    while True:
+        runs = (
+            db.query(Run)
+            .filter(run_cols.started_at < cutoff)
+            .order_by(Run.started_at, Run.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not runs:
+            break
+
+        ids = [r.id for r in runs]
+        summarize_runs(db, runs)
+        _detach_dependents(db, runs)
+        db.query(Step).filter(Step.run_id.in_(ids)).delete(synchronize_session=False)
+        db.query(Run).filter(Run.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        purged += len(ids)
+
+    return purged
+
+
+def purge_node_series(db: Session, cutoff: datetime) -> int:
+    """Delete node series blocks whose last sample is before cutoff"""
+    cutoff_ms = int(cutoff.replace(tzinfo=UTC).timestamp() * 1000)
+    deleted = (
+        db.query(NodeSeriesBlock)
+        .filter(NodeSeriesBlock.__table__.c.end_ms < cutoff_ms)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+
+def drop_expired_partitions(
+    db: Session, cutoff: datetime, chunk_size: int | None = None
+) -> list[str]:
+    """
+    Drop the oldest steps partitions whose runs all started before cutoff,
+    after summarizing those runs, then delete the runs. A partition is only
+    dropped once a newer run exists past its range. No-op unless steps is
+    partitioned.
+    """
+    chunk_size = chunk_size or settings.retention_chunk_size
+    conn = db.connection()
+    if not is_partitioned(conn):
+        return []
+
+    newest = db.execute(select(func.max(run_cols.id))).scalar()
+    ranged = sorted(
+        (bounds, name) for name, bounds in list_partitions(conn).items() if bounds is not None
+    )
+    dropped = []
+    for (lo, hi), name in ranged:
+        in_range = run_cols.id.between(lo, hi - 1)
+        live = db.execute(
+            select(run_cols.id)
+            .where(in_range, or_(run_cols.started_at.is_(None), run_cols.started_at >= cutoff))
+            .limit(1)
+        ).first()
+        if newest is None or hi > newest or live is not None:
+            break
+
+        last_id = lo - 1
+        while True:
+            expired = (
+                db.query(Run)
+                .filter(in_range, run_cols.id > last_id)
+                .order_by(Run.id)
+                .limit(chunk_size)
+                .all()
+            )
+            if not expired:
+                break
+            summarize_runs(db, expired)
+            _detach_dependents(db, expired)
+            last_id = int(expired[-1].id)
+
+        db.execute(text(f'ALTER TABLE "{PARTITIONED_TABLE}" DETACH PARTITION "{name}"'))
+        db.execute(text(f'DROP TABLE "{name}"'))
+        db.query(Run).filter(in_range).delete(synchronize_session=False)
+        db.commit()
+        dropped.append(name)
+
+    if dropped:
+        logger.info("Dropped partitions: %s", ", ".join(dropped))
+    return dropped
+
+
+def apply_retention(now: datetime | None = None) -> dict[str, Any]:
+    """Run one retention pass: create partitions, then drop or purge expired history"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=settings.retention_days)
+
+    created = ensure_partitions(engine)
+    db = SessionLocal()
+    try:
+        dropped, purged = [], 0
+        if is_partitioned(db.connection()):
+            dropped = drop_expired_partitions(db, cutoff)
+        else:
+            purged = purge_expired_runs(db, cutoff)
+        node_blocks = purge_node_series(db, cutoff)
+    finally:
+        db.close()
+
+    return {
+        "cutoff": cutoff.isoformat(),
+        "partitions_created": created,
+        "partitions_dropped": dropped,
+        "runs_purged": purged,
+        "node_series_blocks_purged": node_blocks,
+    }
+
+
+if __name__ == "__main__":
+    # CLI for scheduled retention (the daily CronJob)
+    logging.basicConfig(
+        level=settings.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s %(message)s"
+    )
+    logger.info("Retention pass complete: %s", apply_retention())
@@ -0,0 +1,340 @@
+"""Per-step resource time series in compact binary blocks
+
+The agent scraper records each active step's memory, CPU and I/O every few
+seconds. Samples are kept per step in blocks of up to series_block_size
+samples, one step_series row per block. A block is a column directory
+followed by one column per series. Timestamps are stored as zigzag varint
+delta-of-deltas, so a regular scrape interval costs about a byte per
+sample. Metrics are stored as varint deltas. Each row also carries the
+block's time range and per-metric min/max, so reads fetch only the blocks
+overlapping the requested range and decode only the requested column.
+Coarse min/max views come straight from the block summaries. A block's seq
+is allocated by the database when the block is first inserted, and the
+insert has no ON CONFLICT: writers in different workers or pods never
+overwrite each other's blocks, and a collision fails and is retried.
+Later flushes update only the blocks the writer inserted itself. Node-wide
+agent samples, which belong to no single step, are kept the same way in
+node_series, keyed by node.
+"""
+
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import Select, bindparam, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models.orm import NodeSeriesBlock, StepSeriesBlock
+
+FORMAT_VERSION = 1
+TIMESTAMP_COLUMN = "ts"
+SEQ_ATTEMPTS = 5
+SERIES_METRICS = ("rss_bytes", "cpu_ms", "io_r_bytes", "io_w_bytes")
+
+
+def _put_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(data: bytes, pos: int) -> tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_column(values: Iterable[int], order: int = 1) -> bytes:
+    """Zigzag varints of the order-th differences (the first values are kept as deltas from 0)"""
+    out = bytearray()
+    prev = [0] * order
+    for value in values:
+        delta = value
+        for i in range(order):
+            delta, prev[i] = delta - prev[i], delta
+        _put_varint(out, delta * 2 if delta >= 0 else -delta * 2 - 1)
+    return bytes(out)
+
+
+def decode_column(data: bytes, count: int, order: int = 1, pos: int = 0) -> list[int]:
+    """Inverse of encode_column"""
+    values = []
+    prev = [0] * order
+    for _ in range(count):
+        zigzag, pos = _get_varint(data, pos)
+        value = zigzag >> 1 if not zigzag & 1 else -((zigzag + 1) >> 1)
+        for i in reversed(range(order)):
+            value = prev[i] = prev[i] + value
+        values.append(value)
+    return values
+
+
+def encode_block(timestamps: list[int], columns: dict[str, list[int]]) -> bytes:
+    """Pack samples into a block: header, column directory, then the columns"""
+    payloads = [(TIMESTAMP_COLUMN, encode_column(timestamps, order=2))]
+    payloads += [(name, encode_column(values)) for name, values in columns.items()]
+    out = bytearray([FORMAT_VERSION])
+    _put_varint(out, len(timestamps))
+    _put_varint(out, len(payloads))
+    for name, payload in payloads:
+        encoded = name.encode()
+        _put_varint(out, len(encoded))
+        out += encoded
+        _put_varint(out, len(payload))
+    for _, payload in payloads:
+        out += payload
+    return bytes(out)
+
+
+def decode_block(
+    data: bytes, metrics: Iterable[str] | None = None
+) -> tuple[list[int], dict[str, list[int]]]:
+    """Timestamps and the requested metric columns (all if None); others are skipped"""
+    if data[0] != FORMAT_VERSION:
+        raise ValueError(f"Unknown series block format {data[0]}")
+    count, pos = _get_varint(data, 1)
+    ncolumns, pos = _get_varint(data, pos)
+    directory = []
+    for _ in range(ncolumns):
+        length, pos = _get_varint(data, pos)
+        name = data[pos : pos + length].decode()
+        size, pos = _get_varint(data, pos + length)
+        directory.append((name, size))
+
+    wanted = None if metrics is None else set(metrics)
+    timestamps: list[int] = []
+    columns: dict[str, list[int]] = {}
+    for name, size in directory:
+        if name == TIMESTAMP_COLUMN:
+            timestamps = decode_column(data, count, order=2, pos=pos)
+        elif wanted is None or name in wanted:
+            columns[name] = decode_column(data, count, pos=pos)
+        pos += size
+    return timestamps, columns
+
+
+@dataclass
+class OpenBlock:
+    """The block of a step (or node) that samples are currently appended to"""
+
+    seq: int | None = None  # None until the block is first inserted
+    timestamps: list[int] = field(default_factory=list)
+    columns: dict[str, list[int]] = field(default_factory=dict)
+    dirty: bool = False
+
+
+class SeriesWriter:
+    """Buffer samples per key and write each key's open block on flush"""
+
+    def __init__(
+        self, block_size: int = 256, model: Any = StepSeriesBlock, key: str = "step_id"
+    ) -> None:
+        self.block_size = block_size
+        self.table = model.__table__
+        self.key = key
+        self.blocks: dict[Any, OpenBlock] = {}
+
+    def append(self, key: Any, ts_ms: int, values: dict[str, int]) -> None:
+        """Add one sample; metrics missing from values repeat their last value (or 0)"""
+        block = self.blocks.setdefault(key, OpenBlock())
+        for metric in SERIES_METRICS:
+            column = block.columns.setdefault(metric, [])
+            value = values.get(metric)
+            if value is None:
+                value = column[-1] if column else 0
+            column.append(int(value))
+        block.timestamps.append(int(ts_ms))
+        block.dirty = True
+
+    def forget(self, keys: Iterable[Any]) -> None:
+        """Drop open blocks of steps (or nodes) that are no longer recorded"""
+        for key in keys:
+            self.blocks.pop(key, None)
+
+    @staticmethod
+    def _row(block: OpenBlock) -> dict[str, Any]:
+        return {
+            "start_ms": block.timestamps[0],
+            "end_ms": block.timestamps[-1],
+            "count": len(block.timestamps),
+            "summary": {m: [min(v), max(v)] for m, v in block.columns.items()},
+            "data": encode_block(block.timestamps, block.columns),
+        }
+
+    def _insert(self, db: Session, key: Any, row: dict[str, Any]) -> int:
+        """Insert a new block under the key's next seq, allocated in the same statement"""
+        table = self.table
+        next_seq = select(
+            literal(key, table.c[self.key].type),
+            func.coalesce(func.max(table.c.seq), -1) + 1,
+            *(literal(value, table.c[column].type) for column, value in row.items()),
+        ).where(table.c[self.key] == key)
+        stmt = (
+            insert(table)
+            .from_select([self.key, "seq", *row], next_seq)
+            .returning(table.c.seq)
+        )
+        for attempt in range(SEQ_ATTEMPTS):
+            try:
+                with db.begin_nested():
+                    return int(db.execute(stmt).scalar_one())
+            except IntegrityError:
+                # Another writer took this seq between our read and insert
+                if attempt == SEQ_ATTEMPTS - 1:
+                    raise
+        raise AssertionError("unreachable")
+
+    def flush(self, db: Session) -> int:
+        """Write every block with new samples; the caller commits"""
+        dirty = {key: b for key, b in self.blocks.items() if b.dirty}
+        if not dirty:
+            return 0
+
+        updates = []
+        for key, block in dirty.items():
+            row = self._row(block)
+            if block.seq is None:
+                block.seq = self._insert(db, key, row)
+            else:
+                updates.append({"b_key": key, "b_seq": block.seq, **row})
+        if updates:
+            table = self.table
+            db.execute(
+                update(table)
+                .where(
+                    table.c[self.key] == bindparam("b_key"),
+                    table.c.seq == bindparam("b_seq"),
+                )
+                .values({column: bindparam(column) for column in updates[0] if column[:2] != "b_"}),
+                updates,
+            )
+
+        for key, block in dirty.items():
+            block.dirty = False
+            if len(block.timestamps) >= self.block_size:
+                self.blocks[key] = OpenBlock()
+        return len(dirty)
+
+
+def lttb(points: list[tuple[int, float]], threshold: int) -> list[tuple[int, float]]:
+    """Largest-Triangle-Three-Buckets: threshold points keeping the visual shape"""
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return points if threshold >= n else points[:: max(1, n // max(threshold, 1))]
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = avg_end - avg_start
+        avg_x = sum(p[0] for p in points[avg_start:avg_end]) / span
+        avg_y = sum(p[1] for p in points[avg_start:avg_end]) / span
+
+        ax, ay = points[a]
+        best, best_area = a + 1, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def minmax_buckets(
+    points: list[tuple[int, float]], buckets: int, start_ms: int, end_ms: int
+) -> list[tuple[int, float, float]]:
+    """(bucket start, min, max) over equal time buckets; empty buckets are omitted"""
+    width = max(1, -(-(end_ms - start_ms + 1) // buckets))
+    out: dict[int, list[float]] = {}
+    for ts, value in points:
+        key = (ts - start_ms) // width
+        bucket = out.get(key)
+        if bucket is None:
+            out[key] = [value, value]
+        else:
+            bucket[0] = min(bucket[0], value)
+            bucket[1] = max(bucket[1], value)
+    return [(start_ms + k * width, lo, hi) for k, (lo, hi) in sorted(out.items())]
+
+
+def read_series(
+    db: Session,
+    step_id: int,
+    metric: str,
+    points: int,
+    start_ms: int | None = None,
+    end_ms: int | None = None,
+    method: str = "lttb",
+) -> dict[str, Any]:
+    """
+    A step's series for one metric reduced to about `points` points, as
+    [ts, value] (lttb, or raw when there are fewer samples) or
+    [ts, min, max] (minmax). Only blocks overlapping the range are read.
+    """
+    table = StepSeriesBlock.__table__
+    query: Select = select(
+        table.c.seq, table.c.start_ms, table.c.end_ms, table.c.count, table.c.summary
+    ).where(table.c.step_id == step_id)
+    if start_ms is not None:
+        query = query.where(table.c.end_ms >= start_ms)
+    if end_ms is not None:
+        query = query.where(table.c.start_ms <= end_ms)
+    blocks = db.execute(query.order_by(table.c.seq)).all()
+    result: dict[str, Any] = {"method": method, "samples": 0, "blocks_decoded": 0, "points": []}
+    if not blocks:
+        return result
+
+    lo = blocks[0].start_ms if start_ms is None else start_ms
+    hi = blocks[-1].end_ms if end_ms is None else end_ms
+    inside = [b for b in blocks if b.start_ms >= lo and b.end_ms <= hi]
+    result["samples"] = sum(b.count for b in inside)
+
+    # Coarse min/max: whole blocks per bucket, answered from their summaries
+    if method == "minmax" and len(inside) == len(blocks) and len(blocks) >= points:
+        per_bucket = -(-len(blocks) // points)
+        for i in range(0, len(blocks), per_bucket):
+            group = blocks[i : i + per_bucket]
+            summaries = [b.summary[metric] for b in group]
+            result["points"].append(
+                [group[0].start_ms, min(s[0] for s in summaries), max(s[1] for s in summaries)]
+            )
+        return result
+
+    data: dict[int, bytes] = dict(
+        db.execute(
+            select(table.c.seq, table.c.data).where(
+                table.c.step_id == step_id, table.c.seq.in_([b.seq for b in blocks])
+            )
+        ).all()
+    )
+    samples: list[tuple[int, float]] = []
+    for block in blocks:
+        timestamps, columns = decode_block(data[block.seq], [metric])
+        samples.extend(
+            (ts, value) for ts, value in zip(timestamps, columns[metric]) if lo <= ts <= hi
+        )
+    result["samples"] = len(samples)
+    result["blocks_decoded"] = len(blocks)
+
+    if method == "minmax":
+        result["points"] = [list(p) for p in minmax_buckets(samples, points, lo, hi)]
+    else:
+        result["points"] = [list(p) for p in lttb(samples, points)]
+    return result
+
+
+writer = SeriesWriter(block_size=settings.series_block_size)
+node_writer = SeriesWriter(settings.series_block_size, NodeSeriesBlock, key="node")
@@ -0,0 +1,97 @@
+"""Benchmark cache codecs: encoded size and encode/decode speed.
+
+Usage (from services/api):
+    python -m benchmarks.bench_codecs
+    python -m benchmarks.bench_codecs --redis   # also time N GETs vs one MGET
+"""
+
+import argparse
+import random
+import sys
+import time
+import timeit
+
+from app.storage.codecs import Codec
+
+CODECS = {
+    "json": Codec("json", "none"),
+    "json+zstd": Codec("json", "zstd"),
+    "msgpack": Codec("msgpack", "none"),
+    "msgpack+zlib": Codec("msgpack", "zlib"),
+    "msgpack+zstd": Codec("msgpack", "zstd"),
+}
+
+
+def payloads() -> dict[str, object]:
+    rng = random.Random(42)
+    features = {
+        "vector": {
+            "max_rss_gb": 6.2,
+            "total_io_gb": 2.5,
+            "num_steps": 5,
+            "avg_step_duration_s": 60.0,
+            "max_step_duration_s": 240.0,
+            "total_cpu_s": 812.5,
+        },
+        "label": None,
+        "created_at": "2025-10-25T15:10:00",
+    }
+    large = {
+        "vector": {f"f{i}": rng.random() for i in range(2000)},
+        "label": {"duration_s": 300.0},
+        "created_at": "2025-10-25T15:10:00",
+    }
+    suggestion = {
+        "concurrency": 6,
+        "cpu_req": 4,
+        "mem_req_gb": 12,
+        "cache": {"ccache": True, "size_gb": 10},
+    }
+    return {"features": features, "suggestion": suggestion, "large_vector": large}
+
+
+def bench_codecs(number: int) -> None:
+    print(f"{'payload':<14}{'codec':<15}{'bytes':>8}{'encode us':>12}{'decode us':>12}")
+    for name, value in payloads().items():
+        for codec_name, codec in CODECS.items():
+            encoded = codec.encode(value)
+            assert codec.decode(encoded) == value
+            enc = timeit.timeit(lambda: codec.encode(value), number=number) / number * 1e6
+            dec = timeit.timeit(lambda: codec.decode(encoded), number=number) / number * 1e6
+            print(f"{name:<14}{codec_name:<15}{len(encoded):>8}{enc:>12.1f}{dec:>12.1f}")
+
+
+def bench_round_trips(n_keys: int) -> None:
+    from app.storage import redis as redis_store
+
+    keys = [f"im:bench:{i}" for i in range(n_keys)]
+    redis_store.set_many({k: payloads()["features"] for k in keys}, ttl=60)
+
+    start = time.perf_counter()
+    for key in keys:
+        redis_store.codec.decode(redis_store.redis_client.get(key))
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    redis_store.get_many(keys)
+    batched = time.perf_counter() - start
+
+    redis_store.redis_client.delete(*keys)
+    print(f"\n{n_keys} keys: {single * 1e3:.2f} ms with GET each, {batched * 1e3:.2f} ms with MGET")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--redis", action="store_true", help="Also benchmark round trips")
+    parser.add_argument("--keys", type=int, default=200)
+    args = parser.parse_args()
+
+    bench_codecs(args.number)
+    if args.redis:
+        bench_round_trips(args.keys)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""Load test: ingest latency under concurrent optimize traffic.
+
+Measures POST /runs latency on an idle API, then again while a number of
+clients hammer POST /optimize, for three ways of running the optimizer:
+  inline   on the event loop, as before the inference pool
+  thread   in the pool's single-thread mode (INFERENCE_WORKERS=0)
+  process  in the process pool (INFERENCE_WORKERS=--workers)
+The model is a freshly trained random forest, so each optimize call does real
+CPU work. Requests go straight through the ASGI interface of one API worker
+with a throwaway SQLite database; each mode runs in its own interpreter.
+
+Usage (from services/api):
+    python -m benchmarks.bench_inference
+    python -m benchmarks.bench_inference --optimize-clients 16 --ingest 300
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ("inline", "thread", "process")
+VERSION = "bench"
+HEADERS = {"X-IM-Token": "dev-key-change-in-production"}
+
+
+def _run_payload(i: int) -> dict:
+    return {
+        "pipeline": "bench/pipeline",
+        "build_number": i,
+        "git_sha": f"{i:040x}",
+        "git_branch": "main",
+        "start_time": "2025-01-01T10:00:00Z",
+        "end_time": "2025-01-01T10:10:00Z",
+        "duration_s": 600.0,
+        "status": "success",
+        "tool": "cmake",
+        "concurrency": 4,
+        "cpu_req": 4,
+        "mem_req_gb": 8,
+        "steps": [
+            {
+                "name": name,
+                "start_time": "2025-01-01T10:00:00Z",
+                "end_time": "2025-01-01T10:05:00Z",
+                "duration_s": 300.0,
+                "cpu_usage_pct": 200.0,
+                "rss_max_bytes": 2 * 1024**3,
+                "io_r_bytes": 10 * 1024**2,
+                "io_w_bytes": 5 * 1024**2,
+                "exit_code": 0,
+            }
+            for name in ("build", "test")
+        ],
+    }
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def _child(mode: str, ingest: int, optimize_clients: int) -> dict:
+    import httpx
+
+    import app.main as main
+    from app.ml import inference
+
+    if mode == "inline":
+
+        async def inline(fn, *args):
+            return fn(*args)
+
+        inference.pool.run = inline
+
+    async with main.lifespan(main.app):
+        while inference.pool.warming_up():
+            await asyncio.sleep(0.01)
+        if mode != "inline":
+            await inference.pool.load(VERSION)
+        else:
+            from app.ml import model_store
+
+            model_store.warm_up(VERSION)
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            counter = iter(range(10**9))
+
+            async def measure_ingest() -> list[float]:
+                latencies = []
+                for _ in range(ingest):
+                    start = time.perf_counter()
+                    response = await client.post(
+                        "/runs", json=_run_payload(next(counter)), headers=HEADERS
+                    )
+                    latencies.append((time.perf_counter() - start) * 1e3)
+                    assert response.status_code in (200, 201), response.text
+                return latencies
+
+            idle = await measure_ingest()
+
+            stop = asyncio.Event()
+            optimized = 0
+
+            async def optimize_client() -> None:
+                nonlocal optimized
+                payload = {"pipeline": "bench/pipeline", "context": {"num_steps": 12}}
+                while not stop.is_set():
+                    response = await client.post("/optimize", json=payload, headers=HEADERS)
+                    if response.status_code == 200:
+                        optimized += 1
+
+            clients = [asyncio.create_task(optimize_client()) for _ in range(optimize_clients)]
+            await asyncio.sleep(0.2)
+            start = time.perf_counter()
+            loaded = await measure_ingest()
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await asyncio.gather(*clients)
+
+    return {
+        "idle_p50": statistics.median(idle),
+        "idle_p99": _percentile(idle, 0.99),
+        "load_p50": statistics.median(loaded),
+        "load_p99": _percentile(loaded, 0.99),
+        "optimize_rps": optimized / elapsed,
+    }
+
+
+def _train_model(model_path: str) -> None:
+    import joblib
+    import numpy as np
+    from sklearn.ensemble import RandomForestRegressor
+
+    rng = np.random.default_rng(0)
+    features = rng.uniform(0, 16, size=(4000, 9))
+    target = features @ rng.uniform(1, 50, size=9) + rng.normal(0, 10, size=4000)
+    model = RandomForestRegressor(n_estimators=300, max_depth=14, random_state=0)
+    model.fit(features, target)
+    joblib.dump(model, os.path.join(model_path, f"model_{VERSION}.joblib"))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ingest", type=int, default=200, help="Ingest requests per phase")
+    parser.add_argument("--optimize-clients", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2, help="Processes in process mode")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        result = asyncio.run(_child(args.mode, args.ingest, args.optimize_clients))
+        print(json.dumps(result))
+        return 0
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        _train_model(tmp)
+        for mode in MODES:
+            env = {
+                **os.environ,
+                "DATABASE_URL": f"sqlite:///{tmp}/{mode}.db",
+                "MODEL_PATH": tmp,
+                "MODEL_VERSION": VERSION,
+                "MODEL_VERSION_CHECK_S": "3600",
+                "INFERENCE_WORKERS": "0" if mode == "thread" else str(args.workers),
+                "INFERENCE_TIMEOUT_S": "60",
+                "RATE_LIMIT_ENABLED": "false",
+                "LOG_LEVEL": "WARNING",
+            }
+            env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+            out = subprocess.run(
+                [
+                    sys.executable, "-m", "benchmarks.bench_inference",
+                    "--mode", mode,
+                    "--ingest", str(args.ingest),
+                    "--optimize-clients", str(args.optimize_clients),
+                ],
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            if out.returncode:
+                sys.stderr.write(out.stderr)
+                return out.returncode
+            results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print(f"POST /runs latency (ms), {args.optimize_clients} concurrent optimize clients\n")
+    print(
+        f"{'mode':<10}{'idle p50':>10}{'idle p99':>10}{'load p50':>10}{'load p99':>10}"
+        f"{'optimize/s':>12}"
+    )
+    for mode, r in results.items():
+        print(
+            f"{mode:<10}{r['idle_p50']:>10.1f}{r['idle_p99']:>10.1f}{r['load_p50']:>10.1f}"
+            f"{r['load_p99']:>10.1f}{r['optimize_rps']:>12.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Benchmark POST /runs request decoding: per-step objects vs step columns.
+
+Times the CPU work done before the database sees a run: parsing the JSON
+body, validating it into RunIngestReq and building the step INSERT
+parameters, for both payload formats and a range of step counts.
+
+Usage (from services/api):
+    python -m benchmarks.bench_ingest
+    python -m benchmarks.bench_ingest --steps 10 1000 10000
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.models.schemas import RunIngestReq  # noqa: E402
+from app.routers.runs import step_rows  # noqa: E402
+from app.routing import loads  # noqa: E402
+
+START = 1735725600.0
+RUN = {
+    "pipeline": "bench/pipeline",
+    "build_number": 1,
+    "git_sha": "0" * 40,
+    "git_branch": "main",
+    "start_time": "2025-01-01T10:00:00Z",
+    "end_time": "2025-01-01T11:00:00Z",
+    "duration_s": 3600.0,
+    "status": "success",
+    "tool": "bazel",
+    "concurrency": 8,
+    "cpu_req": 8,
+    "mem_req_gb": 16,
+}
+
+
+def _iso(epoch: float) -> str:
+    from datetime import UTC, datetime
+
+    return datetime.fromtimestamp(epoch, UTC).isoformat().replace("+00:00", "Z")
+
+
+def payloads(n: int) -> dict[str, bytes]:
+    starts = [START + i * 0.25 for i in range(n)]
+    columns = {
+        "name": [f"step-{i}" for i in range(n)],
+        "start_ts": starts,
+        "end_ts": [s + 0.2 for s in starts],
+        "duration_s": [0.2] * n,
+        "cpu_usage_pct": [95.5] * n,
+        "rss_max_bytes": [512 * 1024**2 + i for i in range(n)],
+        "io_r_bytes": [4096 * i for i in range(n)],
+        "io_w_bytes": [1024 * i for i in range(n)],
+        "exit_code": [0] * n,
+    }
+    steps = [
+        {
+            "name": columns["name"][i],
+            "start_time": _iso(columns["start_ts"][i]),
+            "end_time": _iso(columns["end_ts"][i]),
+            "duration_s": 0.2,
+            "cpu_usage_pct": 95.5,
+            "rss_max_bytes": columns["rss_max_bytes"][i],
+            "io_r_bytes": columns["io_r_bytes"][i],
+            "io_w_bytes": columns["io_w_bytes"][i],
+            "exit_code": 0,
+        }
+        for i in range(n)
+    ]
+    return {
+        "objects": json.dumps({**RUN, "steps": steps}).encode(),
+        "columns": json.dumps({**RUN, "step_columns": columns}).encode(),
+    }
+
+
+def decode_json(body: bytes) -> list:
+    req = RunIngestReq.model_validate(json.loads(body))
+    return step_rows(1, req.columns())
+
+
+def decode_fast(body: bytes) -> list:
+    req = RunIngestReq.model_validate(loads(body))
+    return step_rows(1, req.columns())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{'steps':>7}  {'format':<8}{'bytes':>10}{'json ms':>10}{'orjson ms':>11}")
+    for n in args.steps:
+        for name, body in payloads(n).items():
+            assert len(decode_fast(body)) == n
+            number = max(1, 2000 // n)
+            slow = min(timeit.repeat(lambda: decode_json(body), number=number, repeat=3))
+            fast = min(timeit.repeat(lambda: decode_fast(body), number=number, repeat=3))
+            print(
+                f"{n:>7}  {name:<8}{len(body):>10}{slow / number * 1e3:>10.2f}"
+                f"{fast / number * 1e3:>11.2f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
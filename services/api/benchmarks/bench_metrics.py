@@ -0,0 +1,128 @@
+"""Benchmark per-request overhead of the metrics middleware.
+
+Compares a bare app, the previous `app.middleware("http")` function
+middleware labelled by raw path, and the pure ASGI MetricsMiddleware
+labelled by route template. Requests are driven straight through the ASGI
+interface, so the numbers exclude any HTTP client or server.
+
+Usage (from services/api):
+    python -m benchmarks.bench_metrics
+    python -m benchmarks.bench_metrics --number 50000
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from fastapi import FastAPI, Request
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+from app.middleware.metrics import MetricsMiddleware, http_requests_total
+
+_registry = CollectorRegistry()
+_legacy_total = Counter(
+    "legacy_requests_total", "", ["method", "endpoint", "status_code"], registry=_registry
+)
+_legacy_duration = Histogram(
+    "legacy_request_duration_seconds", "", ["method", "endpoint"], registry=_registry
+)
+_legacy_in_progress = Gauge(
+    "legacy_requests_in_progress", "", ["method", "endpoint"], registry=_registry
+)
+
+
+async def legacy_metrics_middleware(request: Request, call_next):
+    """The previous function middleware, kept for comparison"""
+    method = request.method
+    endpoint = request.url.path
+    _legacy_in_progress.labels(method=method, endpoint=endpoint).inc()
+    start_time = time.time()
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    except Exception:
+        status_code = 500
+        raise
+    finally:
+        duration = time.time() - start_time
+        _legacy_total.labels(method=method, endpoint=endpoint, status_code=status_code).inc()
+        _legacy_duration.labels(method=method, endpoint=endpoint).observe(duration)
+        _legacy_in_progress.labels(method=method, endpoint=endpoint).dec()
+    return response
+
+
+def build_app(variant: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/features/{run_id}")
+    async def get_features(run_id: str) -> dict[str, str]:
+        return {"run_id": run_id}
+
+    if variant == "legacy":
+        app.middleware("http")(legacy_metrics_middleware)
+    elif variant == "asgi":
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+def _scope(path: str) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+
+
+async def _drive(app: FastAPI, number: int, distinct_paths: int) -> float:
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        pass
+
+    paths = [f"/features/{i}" for i in range(distinct_paths)]
+    for path in paths[:100]:
+        await app(_scope(path), receive, send)
+
+    start = time.perf_counter()
+    for i in range(number):
+        await app(_scope(paths[i % distinct_paths]), receive, send)
+    return (time.perf_counter() - start) / number * 1e6
+
+
+def _series(metric) -> int:
+    return sum(1 for m in metric.collect() for s in m.samples if s.name.endswith("_total"))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--paths", type=int, default=1000, help="Distinct run ids requested")
+    args = parser.parse_args()
+
+    results = {}
+    for variant in ("bare", "legacy", "asgi"):
+        results[variant] = asyncio.run(_drive(build_app(variant), args.number, args.paths))
+
+    print(f"{'variant':<10}{'us/request':>12}{'overhead us':>14}")
+    for variant, us in results.items():
+        print(f"{variant:<10}{us:>12.1f}{us - results['bare']:>14.1f}")
+    print(
+        f"\nrequest-count series after {args.paths} distinct paths: "
+        f"legacy={_series(_legacy_total)}, asgi={_series(http_requests_total)}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
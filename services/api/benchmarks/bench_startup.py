@@ -0,0 +1,121 @@
+"""Benchmark API cold start.
+
+Each sample runs in a fresh interpreter and measures, in milliseconds:
+  import   importing app.main
+  startup  running the lifespan startup (schema check, Redis pool, probes)
+  ready    from process start until model warm-up finishes and /readyz can pass
+The database is a throwaway SQLite file; Redis is used if REDIS_URL points at
+one and otherwise fails fast like any outage.
+
+Pass --record to append the medians, with the commit and date, to a JSON
+lines file and compare against the previous entry, so startup time can be
+tracked across changes.
+
+Usage (from services/api):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --samples 10 --record benchmarks/startup_history.jsonl
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import UTC, datetime
+from pathlib import Path
+
+_CHILD = """
+import asyncio, json, time
+t0 = time.perf_counter()
+import app.main as main
+from app.ml import inference
+t1 = time.perf_counter()
+
+async def run():
+    async with main.lifespan(main.app):
+        t2 = time.perf_counter()
+        while inference.pool.warming_up():
+            await asyncio.sleep(0.001)
+        t3 = time.perf_counter()
+    return t2, t3
+
+t2, t3 = asyncio.run(run())
+print(json.dumps({"import": (t1 - t0) * 1e3, "startup": (t2 - t1) * 1e3, "ready": (t3 - t0) * 1e3}))
+"""
+
+PHASES = ("import", "startup", "ready")
+
+
+def _sample(env: dict[str, str]) -> dict[str, float]:
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _previous(path: Path) -> dict | None:
+    if not path.exists():
+        return None
+    lines = [line for line in path.read_text().splitlines() if line.strip()]
+    return json.loads(lines[-1]) if lines else None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--record", type=Path, help="JSON lines file to append results to")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{tmp}/bench.db",
+            "MODEL_PATH": tmp,
+            "LOG_LEVEL": "WARNING",
+        }
+        env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        _sample(env)  # creates the schema and warms the filesystem cache
+        samples = [_sample(env) for _ in range(args.samples)]
+
+    medians = {p: round(statistics.median(s[p] for s in samples), 1) for p in PHASES}
+    previous = _previous(args.record) if args.record else None
+
+    print(f"{'phase':<10}{'median ms':>12}{'min ms':>10}{'max ms':>10}{'prev ms':>10}")
+    for phase in PHASES:
+        values = [s[phase] for s in samples]
+        prev = f"{previous['ms'][phase]:>10.1f}" if previous else f"{'-':>10}"
+        print(f"{phase:<10}{medians[phase]:>12.1f}{min(values):>10.1f}{max(values):>10.1f}{prev}")
+
+    if args.record:
+        entry = {
+            "date": datetime.now(UTC).isoformat(timespec="seconds"),
+            "commit": _commit(),
+            "python": sys.version.split()[0],
+            "samples": args.samples,
+            "ms": medians,
+        }
+        with args.record.open("a") as f:
+            f.write(json.dumps(entry) + "\n")
+        if previous:
+            change = medians["ready"] - previous["ms"]["ready"]
+            print(f"\nready: {change:+.1f} ms vs {previous['commit']} ({previous['date']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
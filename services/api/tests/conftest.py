@@ -2,9 +2,64 @@
 
 import os
 
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
 # Set test environment variables before any app imports
 os.environ["DATABASE_URL"] = "sqlite:///./test.db"
 os.environ["REDIS_URL"] = "redis://localhost:6379/15"  # Use different DB for tests
 os.environ["API_KEY"] = "dev-key-change-in-production"
 os.environ["ENVIRONMENT"] = "test"
 os.environ["LOG_LEVEL"] = "WARNING"
+# Suites share one client address; rate limiting is tested with its own limiters
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+# Inference runs in a thread; the process pool is tested explicitly
+os.environ["INFERENCE_WORKERS"] = "0"
+
+from app.deps import get_db, get_read_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.orm import Base  # noqa: E402
+from app.storage.postgres import invalidate_pipeline  # noqa: E402
+
+TEST_DB_URL = os.getenv("TEST_DATABASE_URL", "sqlite:///./test.db")
+
+engine = create_engine(
+    TEST_DB_URL,
+    connect_args={"check_same_thread": False} if "sqlite" in TEST_DB_URL else {},
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db_engine():
+    """The test database engine, e.g. to listen for the statements a request runs"""
+    return engine
+
+
+@pytest.fixture
+def db_session():
+    """Session on a freshly created schema, dropped with the pipeline cache afterwards"""
+    Base.metadata.create_all(bind=engine)
+    invalidate_pipeline()
+    session = TestingSessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+        invalidate_pipeline()
+
+
+@pytest.fixture
+def client(db_session):
+    """Test client whose primary and read dependencies both use db_session"""
+
+    def override_get_db():
+        yield db_session
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
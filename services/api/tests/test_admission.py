@@ -0,0 +1,152 @@
+"""Tests for admission control and load shedding"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.middleware.admission import AdmissionController, AdmissionMiddleware
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+TARGETS = {"ingest": 8.0, "reads": 4.0, "optimize": 2.0}
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def controller(clock):
+    return AdmissionController(TARGETS, alpha=1.0, decay_s=5.0, clock=clock)
+
+
+def _finish(controller, clock, route_class: str, latency_s: float) -> None:
+    ticket = controller.admit(route_class)
+    assert ticket is not None
+    clock.now += latency_s
+    controller.release(route_class, ticket)
+
+
+def test_optimize_is_shed_before_ingest(controller, clock):
+    """The same queueing delay sheds optimize while ingest is still admitted"""
+    controller.loop_lag_s = 3.0
+
+    assert controller.admit("optimize") is None
+    assert controller.admit("reads") is not None
+    assert controller.admit("ingest") is not None
+
+    controller.loop_lag_s = 9.0
+    assert controller.admit("ingest") is None
+
+
+def test_slow_completions_shed_until_latency_decays(controller, clock):
+    """Recent latency above target sheds the class until it decays"""
+    _finish(controller, clock, "optimize", 3.0)
+    assert controller.projected_latency("optimize") == pytest.approx(3.0)
+    assert controller.admit("optimize") is None
+    assert controller.admit("ingest") is not None
+
+    clock.now += 5.0  # 3.0 * e^-1 ~= 1.1s, under the 2s target
+    assert controller.admit("optimize") is not None
+
+
+def test_long_in_flight_request_does_not_shed_its_class(controller, clock):
+    """Projection follows completed requests; one long request alone sheds nothing"""
+    ticket = controller.admit("reads")
+    clock.now += 5.0
+    assert controller.projected_latency("reads") == pytest.approx(0.0)
+    assert controller.admit("reads") is not None
+
+    # Once it completes, its latency counts
+    controller.release("reads", ticket)
+    assert controller.admit("reads") is None
+
+
+def test_in_flight_requests_stretch_the_projection(clock):
+    """Recent latency is scaled by 1 + in_flight / capacity for the class only"""
+    controller = AdmissionController(TARGETS, alpha=1.0, capacity=2, clock=clock)
+    _finish(controller, clock, "reads", 2.0)
+    assert controller.projected_latency("reads") == pytest.approx(2.0)
+
+    assert controller.admit("reads") is not None
+    assert controller.projected_latency("reads") == pytest.approx(3.0)
+    assert controller.admit("reads") is not None
+    assert controller.admit("reads") is not None  # 4.0s, at the target
+    assert controller.projected_latency("reads") == pytest.approx(5.0)
+    assert controller.admit("reads") is None
+    assert controller.admit("ingest") is not None
+
+
+def _app(controller: AdmissionController) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/runs")
+    async def ingest() -> dict[str, str]:
+        return {"status": "ok"}
+
+    @app.post("/optimize")
+    async def optimize() -> dict[str, str]:
+        await asyncio.sleep(0)
+        return {"status": "ok"}
+
+    @app.get("/export/runs")
+    async def export_runs() -> dict[str, str]:
+        return {"status": "ok"}
+
+    @app.get("/healthz")
+    async def healthz() -> dict[str, str]:
+        return {"status": "ok"}
+
+    app.add_middleware(AdmissionMiddleware, controller=controller)
+    return app
+
+
+def test_middleware_sheds_with_retry_after(controller):
+    """Shed requests get 503 and Retry-After; exempt paths are never shed"""
+    client = TestClient(_app(controller))
+    assert client.post("/optimize").status_code == 200
+    assert not controller.classes["optimize"].in_flight
+
+    controller.loop_lag_s = 4.5
+    response = client.post("/optimize")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "3"
+    assert response.json()["detail"] == "Overloaded (optimize), retry later"
+
+    assert client.post("/runs").status_code == 200
+    assert client.get("/healthz").status_code == 200
+
+
+def test_streaming_exports_are_not_admitted(controller, clock):
+    """Exports neither get shed nor feed the reads latency"""
+    client = TestClient(_app(controller))
+    controller.loop_lag_s = 10.0
+    assert client.get("/export/runs").status_code == 200
+
+    controller.loop_lag_s = 0.0
+    assert not controller.classes["reads"].in_flight
+    assert controller.classes["reads"].latency_s == 0.0
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_is_measured():
+    """A blocked event loop shows up as queueing delay"""
+    controller = AdmissionController(TARGETS, alpha=1.0, lag_interval_s=0.01)
+    controller.start()
+    await asyncio.sleep(0.02)
+
+    time.sleep(0.1)  # block the loop
+    await asyncio.sleep(0.005)  # the overdue lag probe runs first
+    assert controller.loop_lag_s > 0.05
+    await controller.stop()
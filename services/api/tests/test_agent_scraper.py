@@ -0,0 +1,298 @@
+"""Tests for scraping node agent metrics into active steps"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from prometheus_client import REGISTRY
+
+from app.models.orm import Base, NodeSeriesBlock, Pipeline, Run, Step, StepSeriesBlock
+from app.storage import redis as redis_store
+from app.storage.agent_scraper import LEASE_NAME, AgentScraper, parse_metrics
+from app.storage.postgres import SessionLocal, engine, upsert_steps
+from app.storage.series import SeriesWriter, decode_block
+
+
+class FakeAgent:
+    """Serves whatever exposition text it is given, like the agent on :9102"""
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.scrapes = 0
+        self._server: asyncio.AbstractServer | None = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await reader.readuntil(b"\r\n\r\n")
+        self.scrapes += 1
+        body = self.text.encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+        writer.close()
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"{host}:{port}"
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+
+def _exposition(mem: float, io_read: float, cpu_user: float, span_b_mem: float) -> str:
+    """Node-wide samples at 10x, span-a's own by span_id, span-b's by step name"""
+    return f"""# HELP im_mem_used_bytes Memory in use
+# TYPE im_mem_used_bytes gauge
+im_mem_used_bytes {mem * 10}
+# TYPE im_io_read_bytes_total counter
+im_io_read_bytes_total {io_read * 10}
+im_cpu_user_seconds_total {cpu_user * 10}
+im_cpu_system_seconds_total 50
+im_cpu_usage_percent 42.5
+im_mem_used_bytes{{span_id="span-a"}} {mem}
+im_io_read_bytes_total{{span_id="span-a",device="sda"}} {io_read}
+im_cpu_user_seconds_total{{span_id="span-a"}} {cpu_user}
+im_cpu_system_seconds_total{{span_id="span-a"}} 5
+im_mem_used_bytes{{step="unit",stage="test"}} {span_b_mem}
+"""
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest_asyncio.fixture
+async def agent():
+    fake = FakeAgent()
+    node = await fake.start()
+    yield fake, node
+    await fake.stop()
+
+
+def _active_run(db, node: str) -> Run:
+    pipeline = Pipeline(name="scrape/pipeline", repo="r")
+    db.add(pipeline)
+    db.flush()
+    run = Run(pipeline_id=pipeline.id, run_id="build-1", status="running", node=node)
+    db.add(run)
+    db.flush()
+    started = datetime(2025, 1, 1, 10, 0)
+    db.add_all(
+        [
+            Step(run_id=run.id, span_id="span-a", stage="build", start_ts=started),
+            Step(run_id=run.id, span_id="span-b", stage="test", step="unit", start_ts=started),
+            Step(run_id=run.id, span_id="span-c", start_ts=started, end_ts=started, io_r_bytes=7),
+            Step(run_id=run.id, span_id="span-d", stage="lint", start_ts=started),
+        ]
+    )
+    db.commit()
+    return run
+
+
+def _steps(db, run: Run) -> dict[str, Step]:
+    db.expire_all()
+    return {s.span_id: s for s in db.query(Step).filter(Step.run_id == run.id)}
+
+
+def test_parse_metrics_keeps_wanted_samples_only():
+    """Comments and other metrics are skipped; labeled samples are keyed by span or step"""
+    text = (
+        "# TYPE im_mem_used_bytes gauge\n"
+        "im_mem_used_bytes 2048 1735725600000\n"
+        'im_mem_used_bytes{span_id="s-1",note="a \\"quoted\\" {value}"} 512\n'
+        'im_mem_used_bytes{step="compile"} 256\n'
+        'im_io_read_bytes_total{device="sda"} 10\n'
+        'im_io_read_bytes_total{device="sdb"} 5\n'
+        "im_cpu_usage_percent 99\n"
+        "im_cache_hits_total NaN\n"
+        "\n"
+    )
+    assert parse_metrics(text) == {
+        ("im_mem_used_bytes", None, None): 2048.0,
+        ("im_mem_used_bytes", "s-1", None): 512.0,
+        ("im_mem_used_bytes", None, "compile"): 256.0,
+        ("im_io_read_bytes_total", None, None): 15.0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_scrape_folds_samples_into_active_steps(db, agent):
+    """Peaks and counter totals accumulate per active step and survive resets"""
+    fake, node = agent
+    run = _active_run(db, node)
+    series = SeriesWriter()
+    node_series = SeriesWriter(model=NodeSeriesBlock, key="node")
+    scraper = AgentScraper(
+        url_template="http://{node}/metrics",
+        interval_s=0.01,
+        series=series,
+        node_series=node_series,
+    )
+
+    fake.text = _exposition(mem=1000, io_read=500, cpu_user=10, span_b_mem=300)
+    assert await scraper.scrape_once() == 2
+    steps = _steps(db, run)
+    assert (steps["span-a"].rss_max_bytes, steps["span-a"].io_r_bytes) == (1000, 0)
+    assert steps["span-b"].rss_max_bytes == 300  # labeled with its step name
+    assert steps["span-c"].io_r_bytes == 7  # finished steps are left alone
+    assert steps["span-d"].rss_max_bytes is None  # node-wide samples are not its own
+
+    fake.text = _exposition(mem=800, io_read=1700, cpu_user=12, span_b_mem=350)
+    await scraper.scrape_once()
+    fake.text = _exposition(mem=900, io_read=100, cpu_user=13, span_b_mem=320)  # agent restart
+    await scraper.scrape_once()
+    steps = _steps(db, run)
+    assert steps["span-a"].rss_max_bytes == 1000
+    assert steps["span-a"].io_r_bytes == 1300
+    assert steps["span-a"].cpu_time_s == pytest.approx(3.0)
+    assert steps["span-b"].rss_max_bytes == 350
+
+    # Every scrape is also a sample of the step's series
+    block = db.query(StepSeriesBlock).filter(StepSeriesBlock.step_id == steps["span-a"].id).one()
+    _, columns = decode_block(block.data)
+    assert columns["rss_bytes"] == [1000, 800, 900]
+    assert columns["io_r_bytes"] == [0, 1200, 1300]
+    assert columns["cpu_ms"] == [0, 2000, 3000]
+    assert not db.query(StepSeriesBlock).filter(StepSeriesBlock.step_id == steps["span-d"].id).all()
+
+    # Unlabeled samples are the node's own series, as reported
+    block = db.query(NodeSeriesBlock).filter(NodeSeriesBlock.node == node).one()
+    _, columns = decode_block(block.data)
+    assert columns["rss_bytes"] == [10000, 8000, 9000]
+    assert columns["io_r_bytes"] == [5000, 17000, 1000]
+    assert columns["cpu_ms"] == [150_000, 170_000, 180_000]
+
+    # A stop without counters keeps the scraped ones, and the step is no longer scraped
+    upsert_steps(
+        db,
+        [{"run_id": run.id, "span_id": "span-a", "end_ts": datetime(2025, 1, 1, 10, 5)}],
+    )
+    db.commit()
+    assert await scraper.scrape_once() == 1
+    assert set(scraper.steps) == set(series.blocks) == {_steps(db, run)["span-b"].id}
+    assert set(node_series.blocks) == {node}
+    assert _steps(db, run)["span-a"].io_r_bytes == 1300
+    await scraper.stop()
+
+
+@pytest.mark.asyncio
+async def test_node_samples_go_to_a_step_alone_on_its_node(db, agent):
+    """Node-wide samples count towards a step only while no other step is active there"""
+    fake, node = agent
+    pipeline = Pipeline(name="scrape/alone", repo="r")
+    db.add(pipeline)
+    db.flush()
+    run = Run(pipeline_id=pipeline.id, run_id="build-2", status="running", node=node)
+    db.add(run)
+    db.flush()
+    started = datetime(2025, 1, 1, 10, 0)
+    db.add(Step(run_id=run.id, span_id="solo", stage="build", start_ts=started))
+    db.commit()
+    scraper = AgentScraper(url_template="http://{node}/metrics", interval_s=0.01)
+
+    for io_read in (100, 200):
+        fake.text = _exposition(mem=100, io_read=io_read, cpu_user=1, span_b_mem=0)
+        assert await scraper.scrape_once() == 1
+    solo = _steps(db, run)["solo"]
+    assert (solo.rss_max_bytes, solo.io_r_bytes) == (1000, 1000)
+
+    # Another step shares the node: neither gets node-wide samples
+    db.add(Step(run_id=run.id, span_id="other", stage="test", start_ts=started))
+    db.commit()
+    fake.text = _exposition(mem=100, io_read=500, cpu_user=1, span_b_mem=0)
+    assert await scraper.scrape_once() == 0
+
+    # Alone again, counters continue from a new baseline
+    db.query(Step).filter(Step.span_id == "other").update({Step.end_ts: started})
+    db.commit()
+    for io_read in (600, 700):
+        fake.text = _exposition(mem=100, io_read=io_read, cpu_user=1, span_b_mem=0)
+        assert await scraper.scrape_once() == 1
+    assert _steps(db, run)["solo"].io_r_bytes == 2000
+
+    # The Jenkins wrapper's zero fallback counters do not lower what was scraped
+    upsert_steps(
+        db,
+        [
+            {
+                "run_id": run.id,
+                "span_id": "solo",
+                "end_ts": datetime(2025, 1, 1, 10, 5),
+                "rss_max_bytes": 0,
+                "io_r_bytes": 0,
+                "cache_hits": 0,
+            }
+        ],
+    )
+    db.commit()
+    solo = _steps(db, run)["solo"]
+    assert (solo.rss_max_bytes, solo.io_r_bytes, solo.cache_hits) == (1000, 2000, 0)
+    await scraper.stop()
+
+
+@pytest.mark.asyncio
+async def test_unreachable_agents_are_counted_not_fatal(db, agent):
+    """A node whose agent is down is skipped; the background loop keeps running"""
+    fake, node = agent
+    _active_run(db, "127.0.0.1:1")
+    scraper = AgentScraper(url_template="http://{node}/metrics", interval_s=0.01, timeout_s=0.5)
+    before = REGISTRY.get_sample_value("agent_scrapes_total", {"result": "error"}) or 0
+
+    scraper.start()
+    await asyncio.sleep(0.1)
+    assert scraper._task is not None and not scraper._task.done()
+    await scraper.stop()
+
+    assert REGISTRY.get_sample_value("agent_scrapes_total", {"result": "error"}) > before
+    assert fake.scrapes == 0
+
+
+@pytest_asyncio.fixture
+async def lease():
+    redis_store.init_async_redis()
+    key = f"im:lease:{LEASE_NAME}"
+    await redis_store.get_async_redis().delete(key)
+    yield key
+    await redis_store.get_async_redis().delete(key)
+    await redis_store.close_async_redis()
+
+
+@pytest.mark.asyncio
+async def test_only_the_lease_holder_scrapes(db, agent, lease):
+    """Workers all run the scraper; one holds the lease and the rest stand by"""
+    fake, node = agent
+    _active_run(db, node)
+    fake.text = _exposition(mem=1000, io_read=500, cpu_user=10, span_b_mem=300)
+    workers = [
+        AgentScraper(url_template="http://{node}/metrics", interval_s=0.01, lease_s=1)
+        for _ in range(3)
+    ]
+    for i, worker in enumerate(workers):
+        worker.owner = f"pod:{i}"
+        worker.start()
+    for _ in range(100):
+        await asyncio.sleep(0.02)
+        if fake.scrapes:
+            break
+    assert fake.scrapes > 0
+    assert [w.leading for w in workers] == [True, False, False]
+
+    # The leader goes away; once its lease lapses another worker takes over
+    await workers[0].stop()
+    await redis_store.get_async_redis().delete(lease)
+    await asyncio.sleep(0.1)
+    assert sum(w.leading for w in workers[1:]) == 1
+    for worker in workers[1:]:
+        await worker.stop()
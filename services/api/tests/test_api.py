@@ -7,6 +7,7 @@ from sqlalchemy.orm import sessionmaker
 from app.main import app
 from app.models.orm import Base
 from app.deps import get_db
+from app.storage.postgres import invalidate_pipeline
 import os
 
 # Test database URL
@@ -26,6 +27,7 @@ def test_db():
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
+    invalidate_pipeline()
 
 
 @pytest.fixture(scope="function")
@@ -106,3 +108,34 @@ def test_optimize_with_auth(client):
     assert "concurrency" in suggestions
     assert "cpu_req" in suggestions
     assert "mem_req_gb" in suggestions
+
+
+def test_optimize_batch(client, db_session):
+    """Batch optimize answers in input order and stores one row per known pipeline"""
+    from app.models.orm import Pipeline, Suggestion
+
+    db_session.add(Pipeline(name="matrix/pipeline", repo="https://example.com/matrix"))
+    db_session.commit()
+
+    headers = {"X-IM-Token": "dev-key-change-in-production"}
+    items = [
+        {"pipeline": "matrix/pipeline", "context": {"tool": "cmake"}},
+        {
+            "pipeline": "matrix/pipeline",
+            "context": {"tool": "cmake"},
+            "constraints": {"max_concurrency": 2},
+        },
+        {"pipeline": "unknown/pipeline", "context": {"tool": "bazel"}},
+    ]
+
+    response = client.post("/optimize/batch", json={"items": items}, headers=headers)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == 3
+    assert results[1]["suggestions"]["concurrency"] <= 2
+    assert all("rationale" in r for r in results)
+
+    assert db_session.query(Suggestion).count() == 2
+
+    assert client.post("/optimize/batch", json={"items": []}, headers=headers).status_code == 422
+    assert client.post("/optimize/batch", json={"items": items}).status_code == 403
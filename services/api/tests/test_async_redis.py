@@ -0,0 +1,78 @@
+"""Tests for the pooled asyncio Redis client"""
+
+import asyncio
+
+import pytest
+import pytest_asyncio
+import redis
+from prometheus_client import REGISTRY
+
+from app.config import settings
+from app.storage import redis as redis_store
+
+pytestmark = pytest.mark.asyncio
+
+VALUE = {"vector": {"max_rss_gb": 6.2}, "label": None, "created_at": "2025-01-01"}
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def async_client():
+    redis_store.init_async_redis()
+    yield
+    await redis_store.close_async_redis()
+
+
+def _count(operation: str, status: str = "ok") -> float:
+    labels = {"operation": operation, "status": status}
+    return REGISTRY.get_sample_value("redis_operations_total", labels) or 0.0
+
+
+def _pool(state: str) -> float:
+    return REGISTRY.get_sample_value("redis_pool_connections", {"state": state})
+
+
+async def test_async_helpers_round_trip():
+    """Async helpers read what the blocking helpers write, and vice versa"""
+    await redis_store.acache_features("a1", VALUE, ttl=60)
+    assert redis_store.get_cached_features("a1") == VALUE
+
+    redis_store.cache_features("a2", VALUE, ttl=60)
+    assert await redis_store.aget_cached_features("a2") == VALUE
+    assert await redis_store.aget_many_cached_features(["a1", "missing"]) == [VALUE, None]
+
+    await redis_store.acache_suggestions({"p/a": {"concurrency": 4}})
+    assert await redis_store.aget_cached_suggestion("p/a") == {"concurrency": 4}
+
+    await redis_store.adelete_cached_features("a1")
+    assert await redis_store.aget_cached_features("a1") is None
+    assert await redis_store.aping()
+
+
+async def test_operations_are_counted_and_timed():
+    """Every helper call reports its outcome under its operation label"""
+    before = _count("get_features")
+    await redis_store.aget_cached_features("nope")
+    redis_store.get_cached_features("nope")
+    assert _count("get_features") == before + 2
+
+
+async def test_pool_is_bounded(monkeypatch):
+    """Concurrent callers share at most redis_max_connections connections"""
+    monkeypatch.setattr(settings, "redis_max_connections", 2)
+    redis_store.init_async_redis()
+
+    await asyncio.gather(*(redis_store.aping() for _ in range(20)))
+    assert _pool("max") == 2
+    assert 1 <= _pool("idle") <= 2
+    assert _pool("in_use") == 0
+
+
+async def test_errors_are_counted(monkeypatch):
+    """Failed calls are counted with status=error and re-raised"""
+    monkeypatch.setattr(settings, "redis_url", "redis://127.0.0.1:1/15")
+    redis_store.init_async_redis()
+
+    before = _count("ping", "error")
+    with pytest.raises(redis.RedisError):
+        await redis_store.aping()
+    assert _count("ping", "error") == before + 1
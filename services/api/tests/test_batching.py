@@ -0,0 +1,78 @@
+"""Tests for micro-batching of concurrent optimize requests"""
+
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.ml.batching import MicroBatcher
+
+pytestmark = pytest.mark.asyncio
+
+
+class Recorder:
+    """run_batch stand-in recording the batches it was given"""
+
+    def __init__(self, fail: bool = False) -> None:
+        self.batches: list[list[int]] = []
+        self.fail = fail
+
+    async def __call__(self, items: list[int]) -> list[int]:
+        self.batches.append(items)
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("pool saturated")
+        return [item * 10 for item in items]
+
+
+def _count(name: str) -> float:
+    return REGISTRY.get_sample_value(f"{name}_count") or 0.0
+
+
+async def test_concurrent_submissions_share_a_batch():
+    """Items submitted within the wait window run together, results in order"""
+    run = Recorder()
+    batcher = MicroBatcher(run, max_wait_s=0.01, max_size=32)
+    batches_before = _count("optimize_batch_size")
+    waits_before = _count("optimize_batch_queue_wait_seconds")
+
+    results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert results == [0, 10, 20, 30, 40]
+    assert run.batches == [[0, 1, 2, 3, 4]]
+    assert _count("optimize_batch_size") == batches_before + 1
+    assert _count("optimize_batch_queue_wait_seconds") == waits_before + 5
+
+
+async def test_full_batch_is_dispatched_without_waiting():
+    """Reaching max_size flushes immediately; the remainder waits for the timer"""
+    run = Recorder()
+    batcher = MicroBatcher(run, max_wait_s=10, max_size=2)
+
+    full = await asyncio.wait_for(asyncio.gather(batcher.submit(1), batcher.submit(2)), 1)
+    assert full == [10, 20]
+
+    batcher.max_wait_s = 0.01
+    assert await asyncio.gather(batcher.submit(3), batcher.submit(4), batcher.submit(5)) == [
+        30,
+        40,
+        50,
+    ]
+    assert run.batches == [[1, 2], [3, 4], [5]]
+
+
+async def test_batch_failure_reaches_every_caller():
+    """An exception from run_batch is raised in each waiting coroutine"""
+    batcher = MicroBatcher(Recorder(fail=True), max_wait_s=0.01)
+    results = await asyncio.gather(
+        batcher.submit(1), batcher.submit(2), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+async def test_zero_wait_disables_batching():
+    """max_wait_s=0 runs each item on its own"""
+    run = Recorder()
+    batcher = MicroBatcher(run, max_wait_s=0)
+    assert await asyncio.gather(batcher.submit(1), batcher.submit(2)) == [10, 20]
+    assert run.batches == [[1], [2]]
@@ -0,0 +1,118 @@
+"""Tests for the Redis circuit breaker and its fallbacks"""
+
+import pytest
+import redis
+from prometheus_client import REGISTRY
+
+from app.config import settings
+from app.middleware.rate_limit import HybridRateLimiter, Limit
+from app.storage import redis as redis_store
+from app.storage.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+DEAD_REDIS_URL = "redis://127.0.0.1:1/15"
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _state(name: str) -> float:
+    return REGISTRY.get_sample_value("circuit_breaker_state", {"name": name})
+
+
+@pytest.fixture(autouse=True)
+def reset_breaker():
+    redis_store.breaker.reset()
+    yield
+    redis_store.breaker.reset()
+
+
+@pytest.fixture
+def redis_down(monkeypatch):
+    """Point both Redis clients at a port nothing listens on"""
+    monkeypatch.setattr(
+        redis_store, "redis_client", redis.from_url(DEAD_REDIS_URL, socket_connect_timeout=0.1)
+    )
+    monkeypatch.setattr(settings, "redis_url", DEAD_REDIS_URL)
+    monkeypatch.setattr(redis_store, "_async_client", None)
+    monkeypatch.setattr(redis_store.breaker, "failure_threshold", 2)
+
+
+def test_breaker_opens_probes_and_closes():
+    """Consecutive failures open the circuit; one probe after the timeout decides"""
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout_s=10, clock=clock)
+
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert _state("test") == 2
+
+    clock.now = 10
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # only one probe in flight
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert _state("test") == 0
+
+
+def test_helpers_short_circuit_when_open(redis_down):
+    """Once open, helpers raise CircuitOpenError without touching Redis"""
+    for _ in range(2):
+        with pytest.raises(redis.ConnectionError):
+            redis_store.get_cached_features("r1")
+    assert redis_store.breaker.is_open
+
+    labels = {"operation": "get_features", "status": "rejected"}
+    before = REGISTRY.get_sample_value("redis_operations_total", labels) or 0.0
+    with pytest.raises(redis_store.CircuitOpenError):
+        redis_store.get_cached_features("r1")
+    assert REGISTRY.get_sample_value("redis_operations_total", labels) == before + 1
+    assert _state("redis") == 2
+
+
+def test_last_known_model_version_is_served(monkeypatch):
+    """The active model version survives a Redis outage"""
+    redis_store.set_active_model_version("v7")
+    assert redis_store.get_active_model_version() == "v7"
+
+    monkeypatch.setattr(
+        redis_store, "redis_client", redis.from_url(DEAD_REDIS_URL, socket_connect_timeout=0.1)
+    )
+    assert redis_store.get_active_model_version() == "v7"
+
+
+@pytest.mark.asyncio
+async def test_limiter_counts_locally_while_open():
+    """Rate limiting keeps working from local buckets while the circuit is open"""
+    limiter = HybridRateLimiter({"default": Limit(per_minute=60, burst=2)})
+    for _ in range(settings.redis_breaker_failures):
+        redis_store.breaker.record_failure()
+
+    assert limiter.check("default", "token:a") == 0
+    await limiter.sync()  # short-circuits without raising
+    assert limiter.check("default", "token:a") == 0
+    assert limiter.check("default", "token:a") > 0
+
+
+def test_optimize_survives_redis_outage(redis_down, client):
+    """Suggestions are still served while Redis is down"""
+    payload = {"pipeline": "breaker/pipeline", "context": {"tool": "cmake"}}
+    headers = {"X-IM-Token": "dev-key-change-in-production"}
+    for _ in range(3):
+        response = client.post("/optimize", json=payload, headers=headers)
+        assert response.status_code == 200
+        assert "concurrency" in response.json()["suggestions"]
+    assert redis_store.breaker.is_open
@@ -0,0 +1,61 @@
+"""Tests for cache codecs and batched Redis helpers"""
+
+import json
+
+import pytest
+
+from app.storage import redis as redis_store
+from app.storage.codecs import TAG_ZSTD, Codec
+
+VALUE = {"vector": {"max_rss_gb": 6.2, "num_steps": 5}, "label": None, "created_at": "2025-01-01"}
+
+
+@pytest.mark.parametrize("serializer", ["json", "msgpack"])
+@pytest.mark.parametrize("compression", ["none", "zlib", "zstd"])
+def test_codec_round_trip(serializer, compression):
+    """Every codec combination decodes what it encodes"""
+    codec = Codec(serializer, compression, compress_min_bytes=0)
+    assert codec.decode(codec.encode(VALUE)) == VALUE
+
+
+def test_compression_only_above_threshold():
+    """Small values skip compression, large ones are compressed"""
+    codec = Codec("msgpack", "zstd", compress_min_bytes=1024)
+    assert codec.encode(VALUE)[:1] != TAG_ZSTD
+
+    large = {"vector": {f"f{i}": 0.5 for i in range(500)}}
+    encoded = codec.encode(large)
+    assert encoded[:1] == TAG_ZSTD
+    assert codec.decode(encoded) == large
+
+
+def test_decode_reads_any_codec_and_legacy_json():
+    """Values written by another codec or as plain JSON stay readable"""
+    codec = Codec("msgpack", "zstd")
+    assert codec.decode(Codec("json", "zlib", compress_min_bytes=0).encode(VALUE)) == VALUE
+    assert codec.decode(json.dumps(VALUE).encode()) == VALUE
+    assert codec.decode(json.dumps(VALUE)) == VALUE
+
+
+def test_unknown_codec_rejected():
+    with pytest.raises(ValueError):
+        Codec("pickle")
+    with pytest.raises(ValueError):
+        Codec("json", "lz4")
+
+
+def test_get_many_and_set_many():
+    """Batched helpers round-trip values in one call each"""
+    redis_store.cache_many_features({"b1": VALUE, "b2": {"vector": {}}}, ttl=60)
+    assert redis_store.get_many_cached_features(["b1", "missing", "b2"]) == [
+        VALUE,
+        None,
+        {"vector": {}},
+    ]
+
+    redis_store.cache_suggestions({"p/a": {"concurrency": 4}, "p/b": {"concurrency": 8}})
+    assert redis_store.get_cached_suggestions(["p/b", "p/a"]) == [
+        {"concurrency": 8},
+        {"concurrency": 4},
+    ]
+    assert redis_store.get_many([]) == []
@@ -0,0 +1,77 @@
+"""Tests for streaming export endpoints"""
+
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.orm import Pipeline, Run, Step
+
+HEADERS = {"X-IM-Token": "dev-key-change-in-production"}
+
+
+@pytest.fixture(autouse=True)
+def seeded(db_session):
+    """Two pipelines with interleaved runs, two steps each"""
+    start = datetime(2025, 1, 1, 10, 0, 0)
+    for name in ("export/a", "export/b"):
+        pipeline = Pipeline(name=name, repo="unknown")
+        db_session.add(pipeline)
+        db_session.flush()
+        for i in range(7):
+            run = Run(
+                pipeline_id=pipeline.id,
+                run_id=f"{name}-{i}",
+                status="success",
+                duration_s=60.0 + i,
+                started_at=start + timedelta(minutes=i),
+            )
+            db_session.add(run)
+            db_session.flush()
+            db_session.add(Step(run_id=run.id, name="build", rss_max_bytes=1024))
+            db_session.add(Step(run_id=run.id, name="test", rss_max_bytes=2048))
+    db_session.commit()
+
+
+def test_export_runs_ndjson_pages_in_key_order(client):
+    """Keyset pages cover every run once, ordered by (pipeline_id, started_at)"""
+    response = client.get("/export/runs?format=ndjson&page_size=3", headers=HEADERS)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 14
+    keys = [(r["pipeline_id"], r["started_at"], r["id"]) for r in rows]
+    assert keys == sorted(keys)
+    assert len({r["run_id"] for r in rows}) == 14
+
+
+def test_export_runs_csv_filtered_by_pipeline(client):
+    """CSV export has one header row and honours filters"""
+    response = client.get(
+        "/export/runs?format=csv&pipeline=export/b&since=2025-01-01T10:02:00&page_size=2",
+        headers=HEADERS,
+    )
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [r["run_id"] for r in rows] == [f"export/b-{i}" for i in range(2, 7)]
+
+
+def test_export_steps_arrow(client):
+    """Arrow IPC stream decodes to every step"""
+    pa = pytest.importorskip("pyarrow")
+    response = client.get("/export/steps?format=arrow&page_size=4", headers=HEADERS)
+    assert response.status_code == 200
+
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == 28
+    assert set(table.column("name").to_pylist()) == {"build", "test"}
+
+
+def test_export_requires_auth_and_known_pipeline(client):
+    """Exports are authenticated and reject unknown pipelines"""
+    assert client.get("/export/runs").status_code == 403
+    response = client.get("/export/steps?pipeline=missing", headers=HEADERS)
+    assert response.status_code == 404
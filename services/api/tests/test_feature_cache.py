@@ -0,0 +1,151 @@
+"""Tests for the two-tier feature cache"""
+
+import time
+
+import pytest
+import redis
+from sqlalchemy import event
+
+from app.storage import feature_cache
+from app.storage import redis as redis_store
+
+HEADERS = {"X-IM-Token": "dev-key-change-in-production"}
+
+RUN_PAYLOAD = {
+    "pipeline": "feature-cache/pipeline",
+    "build_number": 1,
+    "git_sha": "abc123",
+    "git_branch": "main",
+    "start_time": "2025-01-01T10:00:00Z",
+    "end_time": "2025-01-01T10:05:00Z",
+    "duration_s": 300.0,
+    "status": "success",
+    "tool": "cmake",
+    "concurrency": 4,
+    "cpu_req": 4,
+    "mem_req_gb": 8,
+    "steps": [
+        {
+            "name": "build",
+            "start_time": "2025-01-01T10:00:00Z",
+            "end_time": "2025-01-01T10:05:00Z",
+            "duration_s": 300.0,
+            "cpu_usage_pct": 200.0,
+            "rss_max_bytes": 2147483648,
+            "io_r_bytes": 10485760,
+            "io_w_bytes": 5242880,
+            "exit_code": 0,
+        }
+    ],
+}
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    """Every test starts and ends with empty feature caches"""
+    redis_store.redis_client.flushdb()
+    feature_cache.local.clear()
+    yield
+    feature_cache.local.clear()
+
+
+def test_ingest_writes_features_through(client, db_engine, monkeypatch):
+    """Materialized features are served from local memory without Redis or the DB"""
+    response = client.post("/runs", json=RUN_PAYLOAD, headers=HEADERS)
+    assert response.status_code == 201
+    run_id = str(response.json()["run_id"])
+
+    assert redis_store.get_cached_features(run_id)["vector"]["num_steps"] == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("local tier should have served this")
+
+    monkeypatch.setattr(redis_store, "aget_cached_features", fail)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", record)
+    try:
+        response = client.get(f"/features/{run_id}")
+    finally:
+        event.remove(db_engine, "before_cursor_execute", record)
+    assert response.status_code == 200
+    assert response.json()["vector"]["max_rss_gb"] == pytest.approx(2.0)
+    assert statements == []
+
+
+def test_redis_hit_fills_local_tier(client):
+    """A Redis hit is promoted into the in-process LRU"""
+    response = client.post("/runs", json=RUN_PAYLOAD, headers=HEADERS)
+    run_id = str(response.json()["run_id"])
+    feature_cache.local.clear()
+
+    assert client.get(f"/features/{run_id}").status_code == 200
+    assert feature_cache.local.get(run_id)["vector"]["num_steps"] == 1
+
+
+def test_unknown_run_is_negatively_cached(client):
+    """Misses are remembered so repeated lookups skip the database"""
+    assert client.get("/features/999").status_code == 404
+    assert feature_cache.get("999") == (True, None)
+
+    feature_cache.local.clear()
+    assert feature_cache.get("999") == (True, None)  # Redis tier remembers too
+
+
+def test_pubsub_invalidation_drops_local_entries():
+    """Invalidations published by other workers evict local copies"""
+    feature_cache.start_invalidation_listener()
+    try:
+        time.sleep(0.2)
+        feature_cache.local.set("42", {"vector": {}})
+        redis_store.publish(feature_cache.INVALIDATION_CHANNEL, "other-worker:42")
+
+        deadline = time.monotonic() + 2.0
+        while "42" in feature_cache.local and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert "42" not in feature_cache.local
+
+        # Our own messages are ignored
+        feature_cache.local.set("43", {"vector": {}})
+        redis_store.publish(feature_cache.INVALIDATION_CHANNEL, f"{feature_cache.WORKER_ID}:43")
+        time.sleep(0.3)
+        assert "43" in feature_cache.local
+    finally:
+        feature_cache.stop_invalidation_listener()
+        feature_cache.local.clear()
+
+
+def test_invalidation_listener_reconnects_and_clears_local(monkeypatch):
+    """A dropped subscription is retried with backoff; entries that may be stale go"""
+    monkeypatch.setattr(feature_cache, "LISTENER_BACKOFF_S", (0.05, 0.2))
+    real_pubsub = redis_store.redis_client.pubsub
+    failures = []
+
+    def flaky_pubsub(**kwargs):
+        if len(failures) < 3:
+            failures.append(1)
+            raise redis.ConnectionError("Connection refused")
+        return real_pubsub(**kwargs)
+
+    monkeypatch.setattr(redis_store.redis_client, "pubsub", flaky_pubsub)
+    feature_cache.local.set("44", {"vector": {}})
+    feature_cache.start_invalidation_listener()
+    try:
+        deadline = time.monotonic() + 2.0
+        while "44" in feature_cache.local and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert len(failures) == 3
+        assert "44" not in feature_cache.local  # cleared on reconnect
+
+        feature_cache.local.set("45", {"vector": {}})
+        redis_store.publish(feature_cache.INVALIDATION_CHANNEL, "other-worker:45")
+        deadline = time.monotonic() + 2.0
+        while "45" in feature_cache.local and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert "45" not in feature_cache.local
+    finally:
+        feature_cache.stop_invalidation_listener()
+        feature_cache.local.clear()
@@ -0,0 +1,157 @@
+"""Tests for background health probing and the probe endpoints"""
+
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.storage import health
+from app.storage.health import HealthProber
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def _up() -> None:
+    pass
+
+
+async def _down() -> None:
+    raise ConnectionError("refused")
+
+
+async def _hang() -> None:
+    await asyncio.sleep(10)
+
+
+@pytest.fixture
+def fake_prober(monkeypatch):
+    """Swap the app's prober for one with controllable checks and clock"""
+    clock = FakeClock()
+    calls = {"database": 0}
+
+    async def database() -> None:
+        calls["database"] += 1
+
+    prober = HealthProber(
+        {"database": database, "redis": _up},
+        required=frozenset({"database"}),
+        stale_after_s=15,
+        clock=clock,
+    )
+    monkeypatch.setattr(health, "prober", prober)
+    monkeypatch.setattr("app.routers.health.prober", prober)
+    return prober, clock, calls
+
+
+@pytest.mark.asyncio
+async def test_probe_records_latency_errors_and_timeouts():
+    """Each check reports status and latency; slow checks time out"""
+    prober = HealthProber({"a": _up, "b": _down, "c": _hang}, timeout_s=0.05)
+    results = await prober.probe()
+
+    assert results["a"].ok and results["a"].error is None
+    assert results["a"].latency_ms >= 0
+    assert not results["b"].ok and results["b"].error == "refused"
+    assert not results["c"].ok and "timed out" in results["c"].error
+    assert not prober.ready
+
+
+@pytest.mark.asyncio
+async def test_staleness_and_optional_dependencies():
+    """Readiness needs fresh results and only the required checks up"""
+    clock = FakeClock()
+    prober = HealthProber(
+        {"database": _up, "replica": _down},
+        required=frozenset({"database"}),
+        stale_after_s=15,
+        clock=clock,
+    )
+    assert prober.stale and prober.age_s is None
+
+    await prober.probe()
+    assert prober.ready
+
+    clock.now = 16
+    assert prober.age_s == 16
+    assert prober.stale and not prober.ready
+
+
+@pytest.mark.asyncio
+async def test_background_task_refreshes_results():
+    """The started task probes immediately and then on its interval"""
+    calls = []
+
+    async def check() -> None:
+        calls.append(1)
+
+    prober = HealthProber({"database": check}, interval_s=0.01)
+    prober.start()
+    await asyncio.sleep(0.05)
+    await prober.stop()
+
+    assert len(calls) >= 2
+    assert prober.ready
+    assert not prober.running
+
+
+def test_probes_answer_from_memory(fake_prober):
+    """While the background task runs, probes never run the checks themselves"""
+    prober, clock, calls = fake_prober
+    asyncio.run(prober.probe())
+    prober._task = Mock(done=lambda: False)  # as if the background task were running
+    assert calls["database"] == 1
+
+    clock.now = 2.5
+    client = TestClient(app)
+    for _ in range(5):
+        response = client.get("/readyz")
+        assert response.status_code == 200
+    assert calls["database"] == 1
+
+    data = response.json()
+    assert data["status"] == "ready"
+    assert data["checked_age_s"] == 2.5
+    assert data["dependencies"]["database"]["status"] == "up"
+    assert "latency_ms" in data["dependencies"]["redis"]
+
+    # A stuck background task shows up as stale results and fails readiness
+    clock.now = 20
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert "stale" in response.json()["status"]
+    assert client.get("/healthz").status_code == 200
+
+
+def test_readyz_reports_unavailable_dependency(fake_prober):
+    """The database down fails readiness; Redis down only degrades it"""
+    prober, _, _ = fake_prober
+    prober.checks["redis"] = _down
+
+    client = TestClient(app)
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "degraded: redis unavailable"
+    assert data["dependencies"]["redis"] == {
+        "status": "down",
+        "latency_ms": data["dependencies"]["redis"]["latency_ms"],
+        "error": "refused",
+    }
+
+    health_data = client.get("/healthz").json()
+    assert health_data["status"] == "ok"
+    assert health_data["database"] == "connected"
+
+    prober.checks["database"] = _down
+    asyncio.run(prober.probe())
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["status"] == "error: database unavailable - refused"
@@ -0,0 +1,119 @@
+"""Tests for ETags, conditional GET and response compression"""
+
+import gzip
+
+import pytest
+import zstandard
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.middleware.compression import CompressionMiddleware, choose_encoding
+from app.middleware.conditional import etag_matches
+from app.storage import feature_cache
+from app.storage import redis as redis_store
+
+PAYLOAD = {"vector": {"max_rss_gb": 2.0}, "label": None, "created_at": "2025-01-01T10:00:00"}
+LARGE_PAYLOAD = {**PAYLOAD, "vector": {f"f{i}": i * 0.5 for i in range(500)}}
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    redis_store.redis_client.flushdb()
+    feature_cache.local.clear()
+
+
+def test_if_none_match_returns_304_without_database(client, db_engine):
+    """A matching ETag is answered from the cache tier with an empty 304"""
+    feature_cache.put("etag-1", PAYLOAD)
+    first = client.get("/features/etag-1", headers={"Accept-Encoding": "identity"})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and etag.endswith('"')
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db_engine, "before_cursor_execute", record)
+    try:
+        second = client.get("/features/etag-1", headers={"If-None-Match": etag})
+    finally:
+        event.remove(db_engine, "before_cursor_execute", record)
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+    assert statements == []
+
+
+def test_etag_changes_with_content(client):
+    """New feature content gets a new ETag, so stale validators get a full response"""
+    feature_cache.put("etag-2", PAYLOAD)
+    etag = client.get("/features/etag-2").headers["etag"]
+
+    feature_cache.put("etag-2", {**PAYLOAD, "label": {"duration_s": 42.0}})
+    response = client.get("/features/etag-2", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["label"] == {"duration_s": 42.0}
+
+
+def test_compressed_variant_has_own_etag(client):
+    """Large responses are compressed and their coding-specific ETag still validates"""
+    feature_cache.put("etag-3", LARGE_PAYLOAD)
+    with client.stream("GET", "/features/etag-3", headers={"Accept-Encoding": "zstd"}) as r:
+        raw = b"".join(r.iter_raw())
+        assert r.headers["content-encoding"] == "zstd"
+        assert r.headers["etag"].endswith('-zstd"')
+        assert "accept-encoding" in r.headers["vary"].lower()
+        etag = r.headers["etag"]
+    assert b"f499" in zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+
+    response = client.get(
+        "/features/etag-3", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 304
+
+
+def test_etag_matching():
+    assert etag_matches('"a", "b"', '"b"')
+    assert etag_matches('W/"b"', '"b"')
+    assert etag_matches('"b-gzip"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"c"', '"b"')
+    assert not etag_matches(None, '"b"')
+
+
+def test_encoding_negotiation():
+    assert choose_encoding("gzip, deflate, zstd") == "zstd"
+    assert choose_encoding("gzip, zstd;q=0") == "gzip"
+    assert choose_encoding("gzip, zstd", zstd=False) == "gzip"
+    assert choose_encoding("br, identity") is None
+
+
+def test_small_responses_are_not_compressed(client):
+    feature_cache.put("etag-4", PAYLOAD)
+    with client.stream("GET", "/features/etag-4", headers={"Accept-Encoding": "gzip"}) as r:
+        assert "content-encoding" not in r.headers
+
+
+def test_streamed_responses_are_compressed_per_chunk():
+    """Streams are compressed incrementally and decode to the original body"""
+    chunks = [f'{{"row": {i}}}\n'.encode() * 50 for i in range(20)]
+
+    stream_app = FastAPI()
+
+    @stream_app.get("/stream")
+    def stream() -> StreamingResponse:
+        return StreamingResponse(iter(chunks), media_type="application/x-ndjson")
+
+    stream_app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    client = TestClient(stream_app)
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as r:
+        raw = b"".join(r.iter_raw())
+        assert r.headers["content-encoding"] == "gzip"
+        assert "content-length" not in r.headers
+    assert gzip.decompress(raw) == b"".join(chunks)
+    assert len(raw) < len(b"".join(chunks)) / 5
@@ -0,0 +1,131 @@
+"""Tests for the inference pool"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.ml import inference, model_store
+from app.ml.inference import InferenceOverloadedError, InferencePool, InferenceTimeoutError
+from app.models.orm import Base
+from app.storage.postgres import engine
+
+
+def _save_constant_model(version: str, value: float) -> None:
+    from sklearn.dummy import DummyRegressor
+
+    model_store.save_model(DummyRegressor(constant=value).fit([[0] * 9], [value]), version, {})
+
+
+@pytest.fixture
+def model_dir(tmp_path, monkeypatch):
+    """Models saved where both this process and spawned workers look"""
+    monkeypatch.setenv("MODEL_PATH", str(tmp_path))
+    monkeypatch.setattr(model_store.settings, "model_path", str(tmp_path))
+    monkeypatch.setattr(model_store, "_models", {})
+    _save_constant_model("v1", 42.0)
+    _save_constant_model("v2", 7.0)
+    return tmp_path
+
+
+@pytest.mark.asyncio
+async def test_process_pool_preloads_and_reloads_on_version_change(model_dir, monkeypatch):
+    """Workers serve the active model and are replaced when the version changes"""
+    active = {"version": "v1"}
+
+    async def active_version() -> str:
+        return active["version"]
+
+    monkeypatch.setattr(inference, "aget_active_model_version", active_version)
+    pool = InferencePool(workers=1, timeout_s=30)
+    try:
+        await pool.start()
+        assert not pool.warming_up()
+        assert pool.version == "v1"
+        assert await pool.run(model_store.predict_duration, {}, {}) == 42.0
+
+        old = pool._executor
+        await pool.check_version()
+        assert pool._executor is old  # unchanged version keeps the pool
+
+        active["version"] = "v2"
+        await pool.check_version()
+        assert pool._executor is not old
+        assert await pool.run(model_store.predict_duration, {}, {}) == 7.0
+    finally:
+        await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_queue_is_bounded():
+    """Jobs beyond max_queue are rejected instead of waiting"""
+    pool = InferencePool(workers=0, max_queue=1, timeout_s=5)
+    try:
+        slow = asyncio.ensure_future(pool.run(time.sleep, 0.2))
+        await asyncio.sleep(0.01)
+        assert pool.pending == 1
+        with pytest.raises(InferenceOverloadedError):
+            await pool.run(time.sleep, 0)
+        await slow
+        assert pool.pending == 0
+        await pool.run(time.sleep, 0)
+    finally:
+        await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_slow_jobs_time_out():
+    """Callers stop waiting after the timeout; the job holds its slot until it ends"""
+    pool = InferencePool(workers=0, max_queue=2, timeout_s=0.05)
+    try:
+        with pytest.raises(InferenceTimeoutError):
+            await pool.run(time.sleep, 0.3)
+        assert pool.pending == 1  # still running in the worker
+
+        # Queued behind it: cancelled on timeout, so its slot is freed at once
+        with pytest.raises(InferenceTimeoutError):
+            await pool.run(time.sleep, 0)
+        await asyncio.sleep(0)
+        assert pool.pending == 1
+
+        await asyncio.sleep(0.3)
+        assert pool.pending == 0
+    finally:
+        await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_event_loop_stays_responsive():
+    """The loop keeps serving while a job occupies the pool"""
+    pool = InferencePool(workers=0, timeout_s=5)
+    try:
+        job = asyncio.ensure_future(pool.run(time.sleep, 0.3))
+        start = time.perf_counter()
+        for _ in range(10):
+            await asyncio.sleep(0.005)
+        assert time.perf_counter() - start < 0.2
+        await job
+    finally:
+        await pool.stop()
+
+
+def test_saturated_pool_answers_503(monkeypatch):
+    """/optimize sheds load with Retry-After when the pool is saturated"""
+
+    async def overloaded(fn, *args):
+        raise InferenceOverloadedError("64 inference jobs queued")
+
+    monkeypatch.setattr(inference.pool, "run", overloaded)
+    Base.metadata.create_all(bind=engine)
+    try:
+        response = TestClient(app).post(
+            "/optimize",
+            json={"pipeline": "busy/pipeline", "context": {"tool": "cmake"}},
+            headers={"X-IM-Token": "dev-key-change-in-production"},
+        )
+    finally:
+        Base.metadata.drop_all(bind=engine)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
@@ -1,12 +1,16 @@
 """Integration tests for complete workflows"""
 
+from datetime import datetime
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
-from app.models.orm import Base, Run, Step, Feature, Pipeline
+from app.models.orm import Base, Run, Step, Feature, Pipeline, PipelineStats
+from app.ml.sketch import DDSketch
 from app.deps import get_db
+from app.storage.postgres import invalidate_pipeline
 import os
 
 # Test database URL
@@ -26,6 +30,7 @@ def test_db():
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
+    invalidate_pipeline()
 
 
 @pytest.fixture(scope="function")
@@ -260,6 +265,195 @@ def test_failed_run_ingestion(client, db_session):
     assert run.steps[0].exit_code == 1
 
 
+def test_columnar_run_ingestion(client, db_session):
+    """Steps sent as parallel arrays are stored like per-step objects"""
+
+    headers = {"X-IM-Token": "dev-key-change-in-production"}
+
+    run_payload = {
+        "pipeline": "columnar/pipeline",
+        "build_number": 1,
+        "git_sha": "col123",
+        "git_branch": "main",
+        "start_time": "2025-01-01T10:00:00Z",
+        "end_time": "2025-01-01T10:10:00Z",
+        "duration_s": 600.0,
+        "status": "success",
+        "tool": "bazel",
+        "concurrency": 8,
+        "cpu_req": 8,
+        "mem_req_gb": 16,
+        "step_columns": {
+            "name": ["build", "test"],
+            "start_ts": [1735725600.0, 1735726080.5],
+            "end_ts": [1735726080.5, 1735726200.0],
+            "duration_s": [480.5, 119.5],
+            "cpu_usage_pct": [350.0, 200.0],
+            "rss_max_bytes": [8589934592, 2147483648],
+            "io_r_bytes": [104857600, 20971520],
+            "io_w_bytes": [52428800, 10485760],
+            "exit_code": [0, 1],
+        },
+    }
+
+    response = client.post("/runs", json=run_payload, headers=headers)
+    assert response.status_code == 201
+    run_id = response.json()["run_id"]
+
+    steps = db_session.query(Step).filter(Step.run_id == run_id).order_by(Step.id).all()
+    assert [s.name for s in steps] == ["build", "test"]
+    assert steps[0].start_ts == datetime(2025, 1, 1, 10, 0, 0)
+    assert steps[1].start_ts == datetime(2025, 1, 1, 10, 8, 0, 500000)
+    assert steps[1].exit_code == 1
+    assert steps[0].rss_max_bytes == 8589934592
+
+    features = db_session.query(Feature).filter(Feature.run_id == run_id).first()
+    assert features.num_steps == 2
+    assert features.max_rss_gb == 8.0
+
+    # Columns of different lengths, or both formats at once, are rejected
+    run_payload["step_columns"]["exit_code"] = [0]
+    response = client.post("/runs", json=run_payload, headers=headers)
+    assert response.status_code == 422
+
+    run_payload["step_columns"]["exit_code"] = [0, 1]
+    run_payload["steps"] = [
+        {
+            "name": "build",
+            "start_time": "2025-01-01T10:00:00Z",
+            "end_time": "2025-01-01T10:08:00Z",
+            "duration_s": 480.0,
+            "cpu_usage_pct": 350.0,
+            "rss_max_bytes": 1,
+            "io_r_bytes": 1,
+            "io_w_bytes": 1,
+            "exit_code": 0,
+        }
+    ]
+    response = client.post("/runs", json=run_payload, headers=headers)
+    assert response.status_code == 422
+
+    # Malformed JSON is still a validation error
+    response = client.post(
+        "/runs",
+        content=b'{"pipeline": ',
+        headers={**headers, "Content-Type": "application/json"},
+    )
+    assert response.status_code == 422
+
+
+def test_step_events_merge_in_any_order(client, db_session):
+    """Batched start/stop events become one step per span, however they arrive"""
+
+    headers = {"X-IM-Token": "dev-key-change-in-production"}
+    response = client.post(
+        "/builds/start",
+        json={
+            "pipeline": "events/pipeline",
+            "run_id": "build-7",
+            "branch": "main",
+            "commit": "abc123",
+            "image": "builder:v2",
+        },
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    def event(span: str, kind: str, ts: str, **counters) -> dict:
+        return {
+            "run_id": "build-7",
+            "stage": span,
+            "step": span,
+            "span_id": f"span-{span}",
+            "event": kind,
+            "timestamp": ts,
+            "counters": counters,
+        }
+
+    # The stop of "compile" arrives first, its start in a later batch
+    stops = [
+        event("compile", "stop", "2025-01-01T10:05:00Z", rss_max_bytes=2048, cache_hits=3),
+        event("test", "start", "2025-01-01T10:05:00Z"),
+        event("test", "stop", "2025-01-01T10:06:00+01:00", cpu_time_s=12.5),
+        event("lint", "start", "2025-01-01T10:00:00Z", rss_max_bytes=1),
+        {**event("lint", "start", "2025-01-01T10:00:00Z"), "run_id": "build-unknown"},
+    ]
+    response = client.post("/builds/steps:batch", json={"events": stops}, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"ok": True, "steps": 3, "unknown_runs": ["build-unknown"]}
+
+    starts = [event("compile", "start", "2025-01-01T10:00:00Z")]
+    for _ in range(2):  # a retried batch changes nothing
+        response = client.post(
+            "/builds/steps:batch", json={"events": starts + stops[:1]}, headers=headers
+        )
+        assert response.json()["steps"] == 1
+
+    db_session.expire_all()
+    run = db_session.query(Run).filter(Run.run_id == "build-7").one()
+    steps = {s.span_id: s for s in db_session.query(Step).filter(Step.run_id == run.id)}
+    assert set(steps) == {"span-compile", "span-test", "span-lint"}
+
+    compile_step = steps["span-compile"]
+    assert compile_step.start_ts == datetime(2025, 1, 1, 10, 0)
+    assert compile_step.end_ts == datetime(2025, 1, 1, 10, 5)
+    assert (compile_step.rss_max_bytes, compile_step.cache_hits) == (2048, 3)
+
+    # Timestamps are stored as UTC
+    assert steps["span-test"].end_ts == datetime(2025, 1, 1, 9, 6)
+    assert steps["span-test"].cpu_time_s == 12.5
+
+    # A step that only started has no counters yet
+    lint = steps["span-lint"]
+    assert (lint.end_ts, lint.rss_max_bytes, lint.cache_hits) == (None, None, 0)
+
+    # A late start does not clear a stop's counters
+    response = client.post(
+        "/builds/step", json=event("compile", "start", "2025-01-01T10:00:00Z"), headers=headers
+    )
+    assert response.status_code == 200
+    db_session.expire_all()
+    assert db_session.get(Step, compile_step.id).rss_max_bytes == 2048
+
+    response = client.post(
+        "/builds/step",
+        json={**event("lint", "stop", "2025-01-01T10:01:00Z"), "run_id": "build-unknown"},
+        headers=headers,
+    )
+    assert response.status_code == 404
+
+
+def test_retried_completion_is_counted_once(client, db_session):
+    """Only the running -> finished transition folds a run into the rollup"""
+    headers = {"X-IM-Token": "dev-key-change-in-production"}
+    response = client.post(
+        "/builds/start",
+        json={
+            "pipeline": "retry/pipeline",
+            "run_id": "build-retried",
+            "branch": "main",
+            "commit": "abc123",
+            "image": "builder:v2",
+        },
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    for _ in range(3):
+        response = client.post(
+            "/builds/complete",
+            json={"run_id": "build-retried", "status": "success", "duration_s": 120.0},
+            headers=headers,
+        )
+        assert response.status_code == 200
+
+    db_session.expire_all()
+    run = db_session.query(Run).filter(Run.run_id == "build-retried").one()
+    stats = db_session.get(PipelineStats, run.pipeline_id)
+    assert (stats.runs_total, stats.runs_success) == (1, 1)
+    assert DDSketch.from_dict(stats.duration_sketch).count == 1
+
+
 def test_authentication_required(client):
     """Test that authentication is required for protected endpoints"""
 
@@ -0,0 +1,49 @@
+"""Tests for the HTTP metrics middleware"""
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.storage import feature_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_local_cache():
+    feature_cache.local.clear()
+
+
+def _requests(endpoint: str, status_code: str) -> float:
+    labels = {"method": "GET", "endpoint": endpoint, "status_code": status_code}
+    return REGISTRY.get_sample_value("http_requests_total", labels) or 0.0
+
+
+def test_requests_labelled_by_route_template(client):
+    """Distinct path parameters share one series"""
+    before = _requests("/features/{run_id}", "404")
+    for run_id in ("metrics-1", "metrics-2", "metrics-3"):
+        assert client.get(f"/features/{run_id}").status_code == 404
+
+    assert _requests("/features/{run_id}", "404") == before + 3
+    assert _requests("/features/metrics-1", "404") == 0.0
+
+
+def test_unmatched_paths_share_one_series(client):
+    """Requests that match no route do not create per-path series"""
+    before = _requests("<unmatched>", "404")
+    client.get("/no/such/path/1")
+    client.get("/no/such/path/2")
+    assert _requests("<unmatched>", "404") == before + 2
+
+
+def test_latency_and_in_progress_recorded(client):
+    """Latency is observed per route and the in-progress gauge returns to zero"""
+    labels = {"method": "GET", "endpoint": "/healthz"}
+    before = REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) or 0.0
+    assert client.get("/healthz").status_code == 200
+    assert REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) == before + 1
+    assert REGISTRY.get_sample_value("http_requests_in_progress", {"method": "GET"}) == 0.0
+
+
+def test_metrics_endpoint_not_counted(client):
+    """Scrapes do not count themselves"""
+    client.get("/metrics")
+    assert _requests("/metrics", "200") == 0.0
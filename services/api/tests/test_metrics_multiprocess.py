@@ -0,0 +1,71 @@
+"""Tests for multiprocess-mode metrics aggregation"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+WORKER = """
+from app.middleware.metrics import http_requests_in_progress, http_requests_total
+http_requests_total.labels("GET", "/features/{run_id}", "200").inc(3)
+http_requests_in_progress.labels("GET").inc()
+"""
+
+SCRAPE = """
+import asyncio
+from app.middleware.metrics import cleanup_dead_workers, metrics_endpoint
+if {cleanup}:
+    print("dead", len(cleanup_dead_workers()))
+print(asyncio.run(metrics_endpoint()).body.decode())
+"""
+
+
+def _run(code: str, multiproc_dir: Path) -> str:
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(multiproc_dir)}
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=API_DIR, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def _sample(output: str, prefix: str) -> float | None:
+    for line in output.splitlines():
+        if line.startswith(prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_counters_aggregate_across_workers(tmp_path):
+    """/metrics sums counters written by every worker, dead or alive"""
+    _run(WORKER, tmp_path)
+    _run(WORKER, tmp_path)
+
+    output = _run(SCRAPE.format(cleanup=False), tmp_path)
+    series = 'http_requests_total{endpoint="/features/{run_id}",method="GET",status_code="200"}'
+    assert _sample(output, series) == 6.0
+    # Live gauges of exited workers still count until they are cleaned up
+    assert _sample(output, 'http_requests_in_progress{method="GET"}') == 2.0
+
+
+def test_dead_worker_files_are_cleaned(tmp_path):
+    """Cleanup drops exited workers' files but keeps their counter totals"""
+    _run(WORKER, tmp_path)
+    _run(WORKER, tmp_path)
+
+    output = _run(SCRAPE.format(cleanup=True), tmp_path)
+    assert "dead 2" in output
+    assert _sample(output, 'http_requests_in_progress{method="GET"}') in (None, 0.0)
+    series = 'http_requests_total{endpoint="/features/{run_id}",method="GET",status_code="200"}'
+    assert _sample(output, series) == 6.0
+
+    # Each restart folds the dead workers into the same archive files
+    _run(WORKER, tmp_path)
+    output = _run(SCRAPE.format(cleanup=True), tmp_path)
+    assert "dead 2" in output  # the new worker and the previous scrape
+    assert _sample(output, series) == 9.0
+    files = sorted(p.name for p in tmp_path.glob("*.db"))
+    assert "counter_archive.db" in files and "histogram_archive.db" in files
+    assert len(files) <= 2 + 4  # the archives and the last scrape's own files
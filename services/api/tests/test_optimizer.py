@@ -92,3 +92,39 @@ def test_safety_guards():
 
     # CPU should be >= concurrency / 4 = 2
     assert safe["cpu_req"] >= 2
+
+
+class CountingModel:
+    """Stand-in model scoring rows by concurrency and counting predict calls"""
+
+    def __init__(self) -> None:
+        self.calls: list[int] = []
+
+    def predict(self, rows):
+        self.calls.append(len(rows))
+        return [1000.0 / row[2] + row[1] for row in rows]
+
+
+def test_suggest_many_scores_all_items_in_one_pass(monkeypatch):
+    """Batched suggestions match single ones and share one model call"""
+    from app.config import settings
+    from app.ml import model_store
+    from app.ml.optimizer import suggest_many
+
+    model = CountingModel()
+    monkeypatch.setattr(settings, "exploration_rate", 0.0)
+    monkeypatch.setattr(model_store, "get_model", lambda version: model)
+
+    requests = [
+        ({"num_steps": 5}, {}, None),
+        ({"num_steps": 5}, {"max_concurrency": 2}, None),
+        ({"max_rss_gb": 4.0}, {"min_ram_gb": 16}, {"last_success": {"concurrency": 8}}),
+    ]
+    batched = suggest_many(requests)
+    assert len(model.calls) == 1
+
+    single = [suggest(*request) for request in requests]
+    assert batched == single
+    assert model.calls[0] == sum(model.calls[1:])
+    assert batched[1][0]["concurrency"] <= 2
+    assert batched[2][0]["mem_req_gb"] >= 16
@@ -0,0 +1,50 @@
+"""Tests for the pipeline name -> id cache"""
+
+from app.models.orm import Pipeline
+from app.storage.postgres import (
+    get_or_create_pipeline_id,
+    get_pipeline_id,
+    invalidate_pipeline,
+    pipeline_ids,
+)
+
+
+def test_get_or_create_is_idempotent(db_session):
+    """Repeated get-or-create returns the same id and a single row"""
+    first = get_or_create_pipeline_id(db_session, "cache/pipeline", repo="git@x")
+    db_session.commit()
+    second = get_or_create_pipeline_id(db_session, "cache/pipeline")
+    db_session.commit()
+
+    assert first == second
+    assert db_session.query(Pipeline).filter(Pipeline.name == "cache/pipeline").count() == 1
+
+
+def test_new_id_cached_only_after_commit(db_session):
+    """A freshly inserted id is not cached until its transaction commits"""
+    pipeline_id = get_or_create_pipeline_id(db_session, "pending/pipeline")
+    assert pipeline_ids.get("pending/pipeline") is None
+
+    db_session.commit()
+    assert pipeline_ids.get("pending/pipeline") == pipeline_id
+
+
+def test_rollback_discards_pending_id(db_session):
+    """A rolled back insert never reaches the cache"""
+    get_or_create_pipeline_id(db_session, "rolled-back/pipeline")
+    db_session.rollback()
+
+    assert pipeline_ids.get("rolled-back/pipeline") is None
+    assert get_pipeline_id(db_session, "rolled-back/pipeline") is None
+
+
+def test_existing_row_is_cached(db_session):
+    """Looking up a committed pipeline fills the cache"""
+    db_session.add(Pipeline(name="existing/pipeline", repo="unknown"))
+    db_session.commit()
+
+    pipeline_id = get_or_create_pipeline_id(db_session, "existing/pipeline")
+    assert pipeline_ids.get("existing/pipeline") == pipeline_id
+
+    invalidate_pipeline("existing/pipeline")
+    assert pipeline_ids.get("existing/pipeline") is None
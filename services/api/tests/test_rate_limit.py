@@ -0,0 +1,168 @@
+"""Tests for hybrid token-bucket rate limiting"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.middleware.rate_limit import (
+    WINDOW_S,
+    HybridRateLimiter,
+    Limit,
+    RateLimitMiddleware,
+    classify,
+)
+from app.storage import redis as redis_store
+
+LIMITS = {
+    "default": Limit(per_minute=60, burst=2),
+    "ingest": Limit(per_minute=600, burst=5),
+    "optimize": Limit(per_minute=60, burst=1),
+}
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clean_redis():
+    redis_store.redis_client.flushdb()
+
+
+def _app(
+    limiter: HybridRateLimiter,
+    api_keys: tuple[str, ...] | None = ("agent-a", "agent-b"),
+    addresses: tuple[str, ...] = ("testclient",),
+) -> list[TestClient]:
+    """Clients at addresses of a test app whose valid API keys are api_keys (None: settings)"""
+    app = FastAPI()
+
+    @app.post("/runs")
+    async def ingest() -> dict[str, str]:
+        return {"status": "ok"}
+
+    @app.post("/optimize")
+    async def optimize() -> dict[str, str]:
+        return {"status": "ok"}
+
+    @app.get("/healthz")
+    async def healthz() -> dict[str, str]:
+        return {"status": "ok"}
+
+    app.add_middleware(RateLimitMiddleware, limiter=limiter, api_keys=api_keys)
+    return [TestClient(app, client=(address, 50000)) for address in addresses]
+
+
+def test_routes_are_classified():
+    assert classify("/runs") == "ingest"
+    assert classify("/builds/start") == "ingest"
+    assert classify("/optimize") == "optimize"
+    assert classify("/features/42") == "default"
+    assert classify("/runsheet") == "default"
+    assert classify("/healthz") is None
+
+
+def test_bucket_allows_burst_then_refills():
+    """A bucket admits its burst at once and refills at per_minute / 60 per second"""
+    clock = FakeClock()
+    limiter = HybridRateLimiter(LIMITS, clock=clock)
+
+    assert limiter.check("default", "k") == 0
+    assert limiter.check("default", "k") == 0
+    assert limiter.check("default", "k") == pytest.approx(1.0)
+
+    clock.now = 1.0
+    assert limiter.check("default", "k") == 0
+
+
+def test_limits_are_per_token_and_per_class():
+    """Tokens behind one address get separate buckets; ingest and optimize are separate"""
+    [client] = _app(HybridRateLimiter(LIMITS))
+
+    def post(path: str, token: str):
+        return client.post(path, headers={"X-IM-Token": token})
+
+    assert post("/optimize", "agent-a").status_code == 200
+    response = post("/optimize", "agent-a")
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+    assert post("/optimize", "agent-b").status_code == 200
+    for _ in range(5):
+        assert post("/runs", "agent-a").status_code == 200
+    assert post("/runs", "agent-a").status_code == 429
+    assert client.get("/healthz").status_code == 200
+
+
+def test_unknown_tokens_share_the_address_bucket():
+    """Random tokens from one address do not get a fresh bucket each"""
+    [client] = _app(HybridRateLimiter(LIMITS))
+    statuses = [
+        client.post("/optimize", headers={"X-IM-Token": f"random-{i}"}).status_code
+        for i in range(3)
+    ]
+    assert statuses == [200, 429, 429]
+    assert client.post("/optimize").status_code == 429  # no token: the same bucket
+    assert client.post("/optimize", headers={"X-IM-Token": "agent-a"}).status_code == 200
+
+
+def test_default_api_key_is_limited_per_address():
+    """Agents sharing the single configured api_key get one bucket per address"""
+    agent_a, agent_b, other = _app(
+        HybridRateLimiter(LIMITS), api_keys=None, addresses=("10.0.0.1", "10.0.0.2", "10.0.0.1")
+    )
+    headers = {"X-IM-Token": settings.api_key}
+
+    assert agent_a.post("/optimize", headers=headers).status_code == 200
+    assert agent_a.post("/optimize", headers=headers).status_code == 429
+    assert agent_b.post("/optimize", headers=headers).status_code == 200
+    assert other.post("/optimize", headers=headers).status_code == 429
+    assert other.post("/optimize").status_code == 200  # unauthenticated: the address bucket
+
+
+@pytest.mark.asyncio
+async def test_sync_enforces_global_limit():
+    """Counts from all workers add up in Redis and block a key everywhere"""
+    wall = FakeClock(WINDOW_S * 1000 + 5)
+    limits = {"default": Limit(per_minute=4, burst=10)}
+    workers = [HybridRateLimiter(limits, wall_clock=wall) for _ in range(2)]
+
+    for worker in workers:
+        assert worker.check("default", "k") == 0
+        assert worker.check("default", "k") == 0
+    for worker in workers:
+        await worker.sync()
+    # The first worker synced before the total reached the limit
+    assert workers[0].check("default", "k") == 0
+    await workers[0].sync()
+
+    assert redis_store.redis_client.get(f"im:rl:default:k:{WINDOW_S * 1000}") == b"5"
+    for worker in workers:
+        assert worker.check("default", "k") == pytest.approx(WINDOW_S - 5)
+
+    wall.now += WINDOW_S
+    assert workers[0].check("default", "k") == 0
+
+
+@pytest.mark.asyncio
+async def test_idle_worker_learns_of_exhausted_key():
+    """A worker that saw no new traffic still picks up the global total"""
+    wall = FakeClock(WINDOW_S * 2000)
+    limits = {"default": Limit(per_minute=3, burst=10)}
+    busy, idle = HybridRateLimiter(limits, wall_clock=wall), HybridRateLimiter(
+        limits, wall_clock=wall
+    )
+
+    assert idle.check("default", "k") == 0
+    await idle.sync()
+    for _ in range(2):
+        assert busy.check("default", "k") == 0
+    await busy.sync()
+
+    await idle.sync()
+    assert idle.check("default", "k") > 0
@@ -0,0 +1,208 @@
+"""Tests for the online build duration regression detector"""
+
+import json
+import random
+
+import pytest
+import pytest_asyncio
+from prometheus_client import REGISTRY
+
+from app.ml.regressions import (
+    REGRESSION_CHANNEL,
+    DetectorConfig,
+    RegressionDetector,
+    SeriesState,
+    stage_durations,
+)
+from app.models.orm import Pipeline
+from app.storage import redis as redis_store
+
+HEADERS = {"X-IM-Token": "dev-key-change-in-production"}
+
+
+def _durations(seed: int, n: int, mean: float, spread: float) -> list[float]:
+    rng = random.Random(seed)
+    return [mean + rng.uniform(-spread, spread) for _ in range(n)]
+
+
+def _regressions(pipeline: str, stage: str = "") -> float:
+    labels = {"pipeline": pipeline, "stage": stage}
+    return REGISTRY.get_sample_value("build_regressions_total", labels) or 0.0
+
+
+def test_cusum_flags_step_change_with_commit_range():
+    """Noise never alarms; a sustained 15% slowdown does, naming where it started"""
+    config = DetectorConfig()
+    state = SeriesState()
+    for i, duration in enumerate(_durations(1, 60, 600, 20)):
+        assert state.update(duration, f"c{i}", config) is None
+
+    tripped = None
+    for i, duration in enumerate(_durations(2, 10, 690, 20), start=60):
+        tripped = state.update(duration, f"c{i}", config)
+        if tripped:
+            break
+    assert tripped is not None
+    assert tripped["commit_range"] == {"from": "c59", "to": f"c{i}"}
+    assert tripped["first_slow_commit"] == "c60"
+    assert tripped["ratio"] == pytest.approx(1.15, abs=0.05)
+    assert i - 60 < 5
+
+    # Re-baselined: the new level is normal from now on
+    for j, duration in enumerate(_durations(3, 30, 690, 20), start=i + 1):
+        assert state.update(duration, f"c{j}", config) is None
+
+
+def test_single_slow_run_does_not_alarm():
+    config = DetectorConfig()
+    state = SeriesState()
+    for i, duration in enumerate(_durations(4, 30, 300, 10)):
+        state.update(duration, f"c{i}", config)
+    assert state.update(330, "flaky", config) is None
+    for i, duration in enumerate(_durations(5, 30, 300, 10)):
+        assert state.update(duration, f"d{i}", config) is None
+    assert state.cusum == 0
+
+
+def test_stage_durations_sum_per_stage():
+    pairs = [("build", 10.0), ("test", 5.0), ("build", 2.5), (None, 1.0), ("lint", None)]
+    assert stage_durations(pairs) == {"build": 12.5, "test": 5.0}
+
+
+@pytest.mark.asyncio
+async def test_memory_detector_tracks_stages_and_skips_failures():
+    detector = RegressionDetector(use_redis=False)
+    for i in range(20):
+        found = await detector.observe_run(
+            1,
+            "mem/pipeline",
+            run_id=str(i),
+            status="success",
+            duration_s=300,
+            commit=f"c{i}",
+            stages={"compile": 200, "test": 100},
+        )
+        assert found == []
+    # Failed runs are not comparable and are not observed
+    await detector.observe_run(
+        1,
+        "mem/pipeline",
+        run_id="f",
+        status="failure",
+        duration_s=5000,
+        commit="f",
+        stages={"compile": 4900},
+    )
+    assert detector.local[1][""]["n"] == 20
+
+    before = _regressions("mem/pipeline", "test")
+    found = []
+    for i in range(20, 30):
+        found += await detector.observe_run(
+            1,
+            "mem/pipeline",
+            run_id=str(i),
+            status="success",
+            duration_s=300,
+            commit=f"c{i}",
+            stages={"compile": 200, "test": 160},
+        )
+    # The run total is within noise for this test, the stage is not
+    assert [r.stage for r in found] == ["test"]
+    assert found[0].commit_range["from"] == "c19"
+    assert _regressions("mem/pipeline", "test") == before + 1
+
+
+@pytest_asyncio.fixture
+async def shared_state():
+    redis_store.init_async_redis()
+    await redis_store.get_async_redis().delete("im:regress:9001")
+    yield
+    await redis_store.get_async_redis().delete("im:regress:9001")
+    await redis_store.close_async_redis()
+
+
+@pytest.mark.asyncio
+async def test_workers_share_detector_state_in_redis(shared_state):
+    """Runs completed on different workers feed one detector and publish one event"""
+    workers = [RegressionDetector(), RegressionDetector()]
+    pubsub = redis_store.get_async_redis().pubsub()
+    await pubsub.subscribe(REGRESSION_CHANNEL)
+
+    found = []
+    durations = [120.0] * 20 + [200.0] * 5
+    for i, duration in enumerate(durations):
+        found += await workers[i % 2].observe_run(
+            9001,
+            "shared/pipeline",
+            run_id=str(i),
+            status="success",
+            duration_s=duration,
+            commit=f"c{i}",
+        )
+    assert all(not w.local for w in workers)
+    assert len(found) == 1 and found[0].commit_range["from"] == "c19"
+
+    message = None
+    for _ in range(20):
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1)
+        if message:
+            break
+    await pubsub.aclose()
+    assert json.loads(message["data"])["pipeline"] == "shared/pipeline"
+
+
+@pytest.fixture
+def detector_state():
+    # Pipeline ids restart with the database; drop detector state left under them
+    for key in redis_store.redis_client.scan_iter("im:regress:*"):
+        redis_store.redis_client.delete(key)
+
+
+def test_build_complete_feeds_detector(detector_state, client, db_session):
+    """Each completed build updates the detector once; a slower stage is reported"""
+    pipeline = "regress/pipeline"
+    before = _regressions(pipeline, "compile")
+    for i in range(16):
+        run_id = f"{pipeline}-{i}"
+        compile_s = 400 if i < 12 else 520
+        response = client.post(
+            "/builds/start",
+            json={
+                "pipeline": pipeline,
+                "run_id": run_id,
+                "branch": "main",
+                "commit": f"sha{i}",
+                "image": "builder:1",
+            },
+            headers=HEADERS,
+        )
+        assert response.status_code == 200
+        events = []
+        for span, stage, start, end in (("a", "compile", 0, compile_s), ("b", "test", 600, 660)):
+            for event, offset in (("start", start), ("stop", end)):
+                events.append(
+                    {
+                        "run_id": run_id,
+                        "stage": stage,
+                        "step": stage,
+                        "span_id": span,
+                        "event": event,
+                        "timestamp": f"2025-01-01T10:{offset // 60:02d}:{offset % 60:02d}Z",
+                    }
+                )
+        response = client.post("/builds/steps:batch", json={"events": events}, headers=HEADERS)
+        assert response.json()["steps"] == 2
+        for _ in range(2):  # a retried completion is observed once
+            response = client.post(
+                "/builds/complete",
+                json={"run_id": run_id, "status": "success", "duration_s": 700},
+                headers=HEADERS,
+            )
+            assert response.status_code == 200
+    assert _regressions(pipeline, "compile") == before + 1
+    assert _regressions(pipeline) == 0
+
+    pipeline_id = db_session.query(Pipeline.id).filter(Pipeline.name == pipeline).scalar()
+    state = redis_store.codec.decode(redis_store.redis_client.get(f"im:regress:{pipeline_id}"))
+    assert state[""]["n"] == 16
@@ -0,0 +1,80 @@
+"""Tests for read-replica session routing"""
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.storage.postgres import ReplicaRouter
+
+
+@pytest.fixture
+def engines(tmp_path):
+    """Two local SQLite files standing in for a primary and a replica"""
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    for eng, name in ((primary, "primary"), (replica, "replica")):
+        with eng.begin() as conn:
+            conn.execute(text("CREATE TABLE whoami (name TEXT)"))
+            conn.execute(text("INSERT INTO whoami VALUES (:name)"), {"name": name})
+    yield primary, replica
+    primary.dispose()
+    replica.dispose()
+
+
+def _whoami(router: ReplicaRouter) -> str:
+    session = router.session()
+    try:
+        return session.execute(text("SELECT name FROM whoami")).scalar()
+    finally:
+        session.close()
+
+
+def test_reads_go_to_primary_without_replica(engines):
+    """No replica configured means every read hits the primary"""
+    primary, _ = engines
+    router = ReplicaRouter(primary)
+    assert _whoami(router) == "primary"
+
+
+def test_reads_go_to_healthy_replica(engines):
+    """A reachable replica within the lag budget serves reads"""
+    primary, replica = engines
+    router = ReplicaRouter(primary, replica, max_lag_s=5.0)
+    assert _whoami(router) == "replica"
+    assert router.last_lag_s == 0.0
+
+
+def test_lagging_replica_falls_back_to_primary(engines, monkeypatch):
+    """Reads return to the primary while the replica lags too far behind"""
+    primary, replica = engines
+    router = ReplicaRouter(primary, replica, max_lag_s=5.0, check_interval_s=0.0)
+
+    monkeypatch.setattr(router, "measure_lag", lambda: 60.0)
+    assert _whoami(router) == "primary"
+
+    monkeypatch.setattr(router, "measure_lag", lambda: 1.0)
+    assert _whoami(router) == "replica"
+
+
+def test_unreachable_replica_falls_back_to_primary(engines, tmp_path):
+    """Replica connection errors route reads to the primary"""
+    primary, _ = engines
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    router = ReplicaRouter(primary, broken)
+    assert _whoami(router) == "primary"
+    assert router.last_lag_s is None
+
+
+def test_lag_probe_is_rate_limited(engines, monkeypatch):
+    """Lag is probed at most once per check interval"""
+    primary, replica = engines
+    router = ReplicaRouter(primary, replica, check_interval_s=60.0)
+    calls = []
+
+    def probe() -> float:
+        calls.append(1)
+        return 0.0
+
+    monkeypatch.setattr(router, "measure_lag", probe)
+    for _ in range(5):
+        _whoami(router)
+    assert len(calls) == 1
@@ -0,0 +1,125 @@
+"""Tests for history retention"""
+
+from datetime import datetime
+
+import pytest
+
+from app.models.orm import (
+    Feature,
+    Pipeline,
+    PipelinePeriodStats,
+    Run,
+    Step,
+    Suggestion,
+)
+from app.storage import retention
+from app.storage.retention import (
+    drop_expired_partitions,
+    ensure_partitions,
+    month_start,
+    next_partitions,
+    partition_name,
+    purge_expired_runs,
+)
+
+
+def _add_run(db, pipeline_id, started_at, duration_s=100.0, status="success"):
+    run = Run(
+        pipeline_id=pipeline_id,
+        run_id=f"run-{started_at:%Y%m%d%H%M%S}",
+        status=status,
+        duration_s=duration_s,
+        started_at=started_at,
+    )
+    db.add(run)
+    db.flush()
+    db.add(Step(run_id=run.id, name="build", rss_max_bytes=2 * 1024**3))
+    db.add(Feature(run_id=run.id, tool="cmake"))
+    return run
+
+
+def test_month_start():
+    assert month_start(datetime(2025, 3, 17, 12, 30)) == datetime(2025, 3, 1)
+
+
+def test_next_partitions_keep_whole_blocks_ahead():
+    """Blocks continue from the last range until ahead of them follow the next run id"""
+    assert next_partitions(0, 1, 100, 2) == [(0, 100), (100, 200), (200, 300)]
+    assert next_partitions(200, 150, 100, 2) == [(200, 300), (300, 400)]
+    assert next_partitions(400, 150, 100, 2) == []
+    assert partition_name(20000) == "steps_p20000"
+
+
+def test_partition_management_is_noop_when_unpartitioned(db_session, db_engine):
+    """Without a partitioned steps table retention falls back to chunked deletes"""
+    pipeline = Pipeline(name="retention/unpartitioned", repo="unknown")
+    db_session.add(pipeline)
+    db_session.flush()
+    _add_run(db_session, pipeline.id, datetime(2024, 1, 1))
+    db_session.commit()
+
+    assert ensure_partitions(db_engine) == []
+    assert drop_expired_partitions(db_session, datetime(2025, 1, 1)) == []
+    assert db_session.query(Run).count() == 1
+
+
+def test_purge_summarizes_then_deletes_in_chunks(db_session):
+    """Expired runs are rolled up per month and deleted with their dependents"""
+    pipeline = Pipeline(name="retention/pipeline", repo="unknown")
+    db_session.add(pipeline)
+    db_session.flush()
+
+    for day in range(1, 6):
+        _add_run(db_session, pipeline.id, datetime(2024, 1, day), duration_s=100.0 * day)
+    old_failed = _add_run(db_session, pipeline.id, datetime(2024, 2, 3), status="failure")
+    db_session.add(Suggestion(pipeline_id=pipeline.id, run_id=old_failed.run_id, payload={}))
+    recent = _add_run(db_session, pipeline.id, datetime(2025, 6, 1))
+    db_session.commit()
+    recent_id = recent.id
+
+    purged = purge_expired_runs(db_session, datetime(2025, 1, 1), chunk_size=2)
+    assert purged == 6
+
+    remaining = db_session.query(Run).all()
+    assert [r.id for r in remaining] == [recent_id]
+    assert db_session.query(Step).count() == 1
+    assert db_session.query(Feature).count() == 1
+    assert db_session.query(Suggestion).one().run_id is None
+
+    january = db_session.get(PipelinePeriodStats, (pipeline.id, datetime(2024, 1, 1)))
+    assert january.runs_total == 5
+    assert january.runs_success == 5
+    assert january.duration_sum_s == pytest.approx(1500.0)
+    assert january.step_count == 5
+
+    february = db_session.get(PipelinePeriodStats, (pipeline.id, datetime(2024, 2, 1)))
+    assert february.runs_total == 1
+    assert february.runs_success == 0
+
+
+def test_each_chunk_is_committed(db_session, monkeypatch):
+    """A failure mid-purge keeps the chunks already deleted"""
+    pipeline = Pipeline(name="retention/chunks", repo="unknown")
+    db_session.add(pipeline)
+    db_session.flush()
+    for day in range(1, 6):
+        _add_run(db_session, pipeline.id, datetime(2024, 1, day))
+    db_session.commit()
+
+    summarize = retention.summarize_runs
+    calls = []
+
+    def failing_summarize(db, runs):
+        calls.append(len(runs))
+        if len(calls) == 2:
+            raise RuntimeError("connection lost")
+        summarize(db, runs)
+
+    monkeypatch.setattr(retention, "summarize_runs", failing_summarize)
+    with pytest.raises(RuntimeError):
+        purge_expired_runs(db_session, datetime(2025, 1, 1), chunk_size=2)
+    db_session.rollback()
+
+    assert db_session.query(Run).count() == 3
+    stats = db_session.get(PipelinePeriodStats, (pipeline.id, datetime(2024, 1, 1)))
+    assert stats.runs_total == 2
@@ -0,0 +1,93 @@
+"""Tests for mergeable sketches and per-pipeline rollups"""
+
+import random
+
+import pytest
+
+from app.ml.optimizer import apply_safety_guards, candidate_configs, suggest
+from app.ml.rollups import get_pipeline_stats, record_completed_run
+from app.ml.sketch import DDSketch
+from app.models.orm import Pipeline, PipelineStats
+
+
+def test_sketch_quantiles_within_relative_accuracy():
+    """Quantiles stay within the configured relative error"""
+    rng = random.Random(7)
+    values = [rng.lognormvariate(5, 1) for _ in range(5000)]
+    sketch = DDSketch(relative_accuracy=0.01)
+    for v in values:
+        sketch.add(v)
+
+    ordered = sorted(values)
+    for q in (0.5, 0.9, 0.95, 0.99):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.011 * exact
+
+
+def test_sketch_merge_and_roundtrip():
+    """Merged sketches match a sketch of the combined data"""
+    a, b, combined = DDSketch(), DDSketch(), DDSketch()
+    for v in range(1, 501):
+        a.add(v)
+        combined.add(v)
+    for v in range(501, 1001):
+        b.add(v)
+        combined.add(v)
+
+    a.merge(b)
+    restored = DDSketch.from_dict(a.to_dict())
+    assert restored.count == 1000
+    assert restored.quantile(0.95) == combined.quantile(0.95)
+    assert DDSketch.from_dict(None).quantile(0.5) is None
+
+
+def test_record_completed_run_updates_rollup(db_session):
+    """Each completed run folds into the rollup without reading history"""
+    pipeline = Pipeline(name="rollup/pipeline", repo="unknown")
+    db_session.add(pipeline)
+    db_session.flush()
+
+    for i, duration in enumerate([100.0, 200.0, 300.0]):
+        record_completed_run(
+            db_session,
+            pipeline.id,
+            status="success",
+            duration_s=duration,
+            max_rss_bytes=(i + 1) * 1024**3,
+            step_durations=[duration / 2, duration / 2],
+            cache_hits=3,
+            cache_misses=1,
+            resources={"concurrency": 4, "cpu_req": 4, "mem_req_gb": 8 + i},
+        )
+    record_completed_run(db_session, pipeline.id, status="failure", duration_s=5.0)
+    db_session.commit()
+
+    row = db_session.get(PipelineStats, pipeline.id)
+    assert row.runs_total == 4
+    assert row.runs_success == 3
+    assert row.duration_p50_s == pytest.approx(200.0, rel=0.02)
+
+    stats = get_pipeline_stats(db_session, pipeline.id)
+    assert stats["rss_p95_bytes"] == pytest.approx(2 * 1024**3, rel=0.02)
+    assert stats["cache_hit_ratio"] == pytest.approx(0.75)
+    assert stats["avg_step_duration_s"] == pytest.approx(100.0)
+    assert stats["last_success"]["mem_req_gb"] == 10
+
+
+def test_optimizer_reads_rollup_stats():
+    """Safety guards and candidates fall back to server-side stats"""
+    stats = {
+        "rss_p95_bytes": 10 * 1024**3,
+        "last_success": {"concurrency": 8, "cpu_req": 8, "mem_req_gb": 16},
+    }
+
+    safe = apply_safety_guards({"concurrency": 4, "cpu_req": 4, "mem_req_gb": 2}, {}, stats)
+    assert safe["mem_req_gb"] >= 12
+
+    candidates = candidate_configs({}, stats)
+    grid = candidates[:15]  # Exploration may append a random config
+    assert all(6 <= c["concurrency"] <= 10 for c in grid)
+    assert all(7 <= c["cpu_req"] <= 9 for c in grid)
+
+    suggestions, _, _ = suggest({"tool": "cmake"}, {}, stats)
+    assert suggestions["mem_req_gb"] >= 12
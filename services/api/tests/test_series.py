@@ -0,0 +1,119 @@
+"""Tests for per-step resource series blocks and their read API"""
+
+from app.models.orm import Pipeline, Run, Step, StepSeriesBlock
+from app.storage.series import SeriesWriter, decode_block, encode_block, lttb, minmax_buckets
+
+T0 = 1_735_725_600_000  # 2025-01-01T10:00:00Z in milliseconds
+
+
+def _step(db) -> Step:
+    pipeline = Pipeline(name="series/pipeline", repo="r")
+    db.add(pipeline)
+    db.flush()
+    run = Run(pipeline_id=pipeline.id, run_id="series-1", status="running")
+    db.add(run)
+    db.flush()
+    step = Step(run_id=run.id, span_id="span-a", stage="build")
+    db.add(step)
+    db.commit()
+    return step
+
+
+def _record(db, step_id: int, n: int, block_size: int) -> None:
+    """n samples 5 s apart, flushed every sample like the scraper does"""
+    writer = SeriesWriter(block_size=block_size)
+    for i in range(n):
+        rss = 1000 + i * 10 + (5000 if i == n // 2 else 0)
+        writer.append(step_id, T0 + i * 5000, {"rss_bytes": rss, "cpu_ms": i * 800})
+        writer.flush(db)
+    db.commit()
+
+
+def test_block_round_trip_is_compact():
+    """Regular timestamps cost about a byte each; unrequested columns are skipped"""
+    timestamps = [T0 + i * 5000 + (3 if i == 7 else 0) for i in range(256)]
+    columns = {
+        "rss_bytes": [4 * 1024**3 - i * 4096 for i in range(256)],
+        "io_r_bytes": [i * i for i in range(256)],
+    }
+    data = encode_block(timestamps, columns)
+    assert decode_block(data) == (timestamps, columns)
+    assert decode_block(data, ["io_r_bytes"]) == (timestamps, {"io_r_bytes": columns["io_r_bytes"]})
+    assert len(data) < 256 * 8  # vs. 24 bytes per raw (ts, rss, io) sample
+
+
+def test_downsampling_keeps_extremes():
+    points = [(i, 0.0) for i in range(100)]
+    points[40] = (40, 9.0)
+    sampled = lttb(points, 10)
+    assert len(sampled) == 10
+    assert sampled[0] == points[0] and sampled[-1] == points[-1]
+    assert (40, 9.0) in sampled
+    assert lttb(points[:5], 10) == points[:5]
+
+    buckets = minmax_buckets(points, 4, 0, 99)
+    assert buckets == [(0, 0.0, 0.0), (25, 0.0, 9.0), (50, 0.0, 0.0), (75, 0.0, 0.0)]
+
+
+def test_writer_rolls_blocks_and_continues_after_restart(db_session):
+    step = _step(db_session)
+    _record(db_session, step.id, 10, block_size=4)
+    blocks = db_session.query(StepSeriesBlock).order_by(StepSeriesBlock.seq).all()
+    assert [(b.seq, b.count) for b in blocks] == [(0, 4), (1, 4), (2, 2)]
+    assert blocks[0].summary["cpu_ms"] == [0, 2400]
+    assert blocks[1].start_ms == T0 + 4 * 5000
+
+    # A new writer (API restart) appends after the stored blocks
+    _record(db_session, step.id, 1, block_size=4)
+    assert db_session.query(StepSeriesBlock).filter(StepSeriesBlock.seq == 3).count() == 1
+
+
+def test_concurrent_writers_never_overwrite_blocks(db_session):
+    """Two workers writing one step each get their own seqs for every block"""
+    step = _step(db_session)
+    writers = [SeriesWriter(block_size=2), SeriesWriter(block_size=2)]
+    for i in range(6):
+        writer = writers[i % 2]
+        writer.append(step.id, T0 + i * 1000, {"rss_bytes": i})
+        writer.flush(db_session)
+        db_session.commit()
+
+    blocks = db_session.query(StepSeriesBlock).order_by(StepSeriesBlock.seq).all()
+    assert [b.seq for b in blocks] == [0, 1, 2, 3]
+    samples = sorted(ts for b in blocks for ts in decode_block(b.data, ["rss_bytes"])[0])
+    assert samples == [T0 + i * 1000 for i in range(6)]
+
+
+def test_series_api_downsamples_without_decoding_everything(client, db_session):
+    step = _step(db_session)
+    _record(db_session, step.id, 100, block_size=10)
+
+    raw = client.get(f"/steps/{step.id}/series", params={"points": 500}).json()
+    assert raw["samples"] == 100 and len(raw["points"]) == 100
+    assert raw["points"][50] == [T0 + 50 * 5000, 1000 + 500 + 5000]
+
+    lttb_view = client.get(f"/steps/{step.id}/series", params={"points": 20}).json()
+    assert len(lttb_view["points"]) == 20
+    assert [T0 + 50 * 5000, 6500] in lttb_view["points"]  # the spike survives
+
+    # Coarse min/max comes from block summaries only
+    coarse = client.get(
+        f"/steps/{step.id}/series", params={"points": 5, "method": "minmax"}
+    ).json()
+    assert coarse["blocks_decoded"] == 0
+    assert coarse["points"][2] == [T0 + 40 * 5000, 1400, 6500]
+
+    # A time range decodes only the blocks it overlaps, and only the requested column
+    ranged = client.get(
+        f"/steps/{step.id}/series",
+        params={
+            "metric": "cpu_ms",
+            "start": "2025-01-01T10:01:40",
+            "end": "2025-01-01T10:02:20",
+        },
+    ).json()
+    assert ranged["blocks_decoded"] == 1
+    assert [p[1] for p in ranged["points"]] == [i * 800 for i in range(20, 29)]
+
+    assert client.get(f"/steps/{step.id}/series", params={"metric": "nope"}).status_code == 422
+    assert client.get("/steps/999999/series").status_code == 404
@@ -0,0 +1,110 @@
+"""Tests for fast startup: lazy imports, schema check and model warm-up"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.config import Settings, settings
+from app.main import app
+from app.ml import inference, model_store
+from app.models.orm import Base
+from app.storage.postgres import check_schema, ensure_schema, missing_unique_indexes
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def empty_engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path}/schema.db")
+
+
+def test_app_import_skips_ml_dependencies(tmp_path):
+    """Importing the API does not import the ML stack"""
+    code = (
+        "import json, sys; import app.main; "
+        "print(json.dumps([m for m in ('sklearn', 'pandas', 'joblib', 'numpy') "
+        "if m in sys.modules]))"
+    )
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path}/import.db"}
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=API_DIR, env=env, capture_output=True, text=True
+    )
+    assert out.returncode == 0, out.stderr
+    assert json.loads(out.stdout) == []
+
+
+def test_schema_check_reports_missing_tables_and_columns(empty_engine):
+    """The check lists what a migration would have to add"""
+    missing_tables, missing_columns = check_schema(empty_engine)
+    assert set(missing_tables) == set(Base.metadata.tables)
+    assert missing_columns == []
+
+    Base.metadata.create_all(bind=empty_engine)
+    assert check_schema(empty_engine) == ([], [])
+
+    with empty_engine.begin() as conn:
+        conn.execute(text("ALTER TABLE suggestions DROP COLUMN applied"))
+    assert check_schema(empty_engine) == ([], ["suggestions.applied"])
+    with pytest.raises(RuntimeError, match="suggestions.applied"):
+        ensure_schema(empty_engine)
+
+
+def test_ensure_schema_creates_tables_only_when_allowed(empty_engine, monkeypatch):
+    """Missing tables fail startup unless db_create_missing_tables is set (off by default)"""
+    assert Settings.model_fields["db_create_missing_tables"].default is False
+    monkeypatch.setattr(settings, "db_create_missing_tables", False)
+    with pytest.raises(RuntimeError, match="out of date"):
+        ensure_schema(empty_engine)
+
+    monkeypatch.setattr(settings, "db_create_missing_tables", True)
+    ensure_schema(empty_engine)
+    assert check_schema(empty_engine) == ([], [])
+
+
+def test_ensure_schema_creates_missing_unique_indexes(empty_engine, monkeypatch):
+    """Upserts need their unique indexes, which create_all skips on existing tables"""
+    Base.metadata.create_all(bind=empty_engine)
+    with empty_engine.begin() as conn:
+        conn.execute(text("DROP INDEX uq_steps_run_span"))
+    assert [i.name for i in missing_unique_indexes(empty_engine)] == ["uq_steps_run_span"]
+
+    monkeypatch.setattr(settings, "db_create_missing_tables", False)
+    with pytest.raises(RuntimeError, match="index uq_steps_run_span"):
+        ensure_schema(empty_engine)
+
+    monkeypatch.setattr(settings, "db_create_missing_tables", True)
+    ensure_schema(empty_engine)
+    assert missing_unique_indexes(empty_engine) == []
+
+
+def test_warm_up_loads_active_model_once(tmp_path, monkeypatch):
+    """Warm-up loads the active version and later predictions reuse it"""
+    from sklearn.dummy import DummyRegressor
+
+    monkeypatch.setattr(settings, "model_path", str(tmp_path))
+    monkeypatch.setattr(model_store, "_models", {})
+    monkeypatch.setattr(model_store, "_active_version", settings.model_version)
+    model = DummyRegressor(constant=42.0).fit([[0] * 9], [42.0])
+    model_store.save_model(model, "v9", {"mae": 0.0})
+
+    assert model_store.warm_up("v9") == "v9"
+    assert set(model_store._models) == {"v9"}
+    assert model_store.predict_duration({"num_steps": 3}, {"concurrency": 2}) == 42.0
+
+
+def test_readyz_waits_for_warm_up(monkeypatch):
+    """Readiness fails while the model is still warming up"""
+    monkeypatch.setattr(inference.pool, "_warming", True)
+    client = TestClient(app)
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["status"] == "error: model warming up"
+
+    monkeypatch.setattr(inference.pool, "_warming", False)
+    assert client.get("/readyz").status_code == 200
@@ -0,0 +1,206 @@
+"""Tests for the OTLP/JSON trace receiver"""
+
+import gzip
+import json
+import secrets
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.models.orm import Pipeline, PipelineStats, Run, Step
+
+HEADERS = {"X-IM-Token": "dev-key-change-in-production"}
+T0 = 1_735_725_600_000_000_000  # 2025-01-01T10:00:00Z in nanoseconds
+S = 1_000_000_000
+
+
+def _any_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes: dict) -> list[dict]:
+    return [{"key": k, "value": _any_value(v)} for k, v in attributes.items()]
+
+
+class StandInExporter:
+    """Encodes finished spans the way the OTLP/HTTP JSON exporter does and posts them"""
+
+    def __init__(self, client: TestClient, resource: dict) -> None:
+        self.client = client
+        self.resource = resource
+        self.trace_id = secrets.token_hex(16)
+
+    def span(self, name, start_s, end_s, parent=None, error=False, **attributes) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": secrets.token_hex(8),
+            "parentSpanId": parent["spanId"] if parent else "",
+            "name": name,
+            "kind": 1,
+            "startTimeUnixNano": str(T0 + int(start_s * S)),
+            "endTimeUnixNano": str(T0 + int(end_s * S)),
+            "attributes": _attributes(attributes),
+            "status": {"code": 2} if error else {},
+        }
+
+    def export(self, spans: list[dict]):
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": _attributes(self.resource)},
+                    "scopeSpans": [{"scope": {"name": "inframind.test"}, "spans": spans}],
+                }
+            ]
+        }
+        return self.client.post(
+            "/v1/traces",
+            content=gzip.compress(json.dumps(payload).encode()),
+            headers={
+                **HEADERS,
+                "Content-Type": "application/json",
+                "Content-Encoding": "gzip",
+            },
+        )
+
+
+def test_trace_becomes_run_with_steps(client, db_session):
+    """Steps exported before their root span are attached when the root arrives"""
+    exporter = StandInExporter(
+        client,
+        {
+            "service.name": "ci-runner",
+            "cicd.pipeline.name": "otel/pipeline",
+            "k8s.node.name": "node-7",
+        },
+    )
+    root = exporter.span(
+        "pipeline",
+        0,
+        600,
+        **{
+            "cicd.pipeline.run.id": "otel-42",
+            "vcs.ref.head.name": "main",
+            "vcs.ref.head.revision": "abc123",
+            "cicd.pipeline.result": "success",
+            "inframind.concurrency": 8,
+        },
+    )
+    compile_span = exporter.span(
+        "make all",
+        5,
+        480,
+        parent=root,
+        **{
+            "cicd.pipeline.run.id": "otel-42",
+            "cicd.pipeline.task.name": "compile",
+            "inframind.rss_max_bytes": 4 * 1024**3,
+            "inframind.cache_hits": 12,
+            "process.exit.code": 0,
+        },
+    )
+    test_span = exporter.span(
+        "pytest",
+        480,
+        590.5,
+        parent=root,
+        error=True,
+        **{"cicd.pipeline.run.id": "otel-42", "process.exit.code": 1},
+    )
+
+    response = exporter.export([compile_span, test_span])
+    assert response.status_code == 200
+    assert response.json() == {}
+
+    run = db_session.query(Run).filter(Run.run_id == "otel-42").one()
+    assert run.status == "running"
+    assert run.pipeline.name == "otel/pipeline"
+    assert db_session.get(PipelineStats, run.pipeline_id) is None
+
+    assert exporter.export([root]).status_code == 200
+    assert exporter.export([root, test_span]).status_code == 200  # re-exported
+
+    db_session.expire_all()
+    run = db_session.query(Run).filter(Run.run_id == "otel-42").one()
+    assert (run.status, run.duration_s) == ("success", 600)
+    assert (run.branch, run.commit, run.node, run.concurrency) == ("main", "abc123", "node-7", 8)
+
+    steps = {s.step: s for s in db_session.query(Step).filter(Step.run_id == run.id)}
+    assert set(steps) == {"make all", "pytest"}
+    assert steps["make all"].stage == "compile"
+    assert steps["make all"].rss_max_bytes == 4 * 1024**3
+    assert steps["make all"].cache_hits == 12
+    assert steps["pytest"].stage == "pytest"
+    assert steps["pytest"].exit_code == 1
+    assert steps["pytest"].duration_s == pytest.approx(110.5)
+    assert steps["pytest"].span_id == test_span["spanId"]
+
+    # Folded into the rollup once, despite the re-export
+    stats = db_session.get(PipelineStats, run.pipeline_id)
+    assert stats.runs_total == 1
+    assert stats.step_count == 2
+
+
+def test_trace_id_identifies_runs_without_run_id_attribute(client, db_session):
+    """Without cicd.pipeline.run.id the trace id is the run id; error status fails the run"""
+    exporter = StandInExporter(client, {"service.name": "nightly"})
+    root = exporter.span("build", 0, 60, error=True)
+    assert exporter.export([root, exporter.span("step", 1, 2, parent=root)]).status_code == 200
+
+    run = db_session.query(Run).filter(Run.run_id == exporter.trace_id).one()
+    assert run.status == "failure"
+    assert db_session.query(Pipeline).filter(Pipeline.name == "nightly").count() == 1
+    assert db_session.query(Step).filter(Step.run_id == run.id).count() == 1
+
+
+def test_run_id_on_the_root_span_only_applies_to_the_whole_trace(client, db_session):
+    """Child spans without the run id join the root's run, whichever arrives first"""
+    exporter = StandInExporter(client, {"service.name": "root-only"})
+    root = exporter.span("pipeline", 0, 100, **{"cicd.pipeline.run.id": "root-7"})
+    build = exporter.span("build", 1, 50, parent=root)
+    test = exporter.span("test", 50, 99, parent=root)
+
+    # Same batch: the root's run id wins for every span
+    assert exporter.export([build, test, root]).status_code == 200
+    # Steps before their root: a run under the trace id, renamed when the root arrives
+    other = StandInExporter(client, {"service.name": "root-only"})
+    other_root = other.span("pipeline", 0, 100, **{"cicd.pipeline.run.id": "root-8"})
+    assert other.export([other.span("build", 1, 50, parent=other_root)]).status_code == 200
+    assert db_session.query(Run).filter(Run.run_id == other.trace_id).count() == 1
+    assert other.export([other_root]).status_code == 200
+
+    db_session.expire_all()
+    runs = {r.run_id: r for r in db_session.query(Run)}
+    assert set(runs) == {"root-7", "root-8"}
+    assert db_session.query(Step).filter(Step.run_id == runs["root-7"].id).count() == 2
+    assert db_session.query(Step).filter(Step.run_id == runs["root-8"].id).count() == 1
+    assert runs["root-8"].status == "success"
+
+
+def test_malformed_spans_are_reported_not_fatal(client, db_session):
+    """Spans without ids or timestamps are rejected as a partial success"""
+    exporter = StandInExporter(client, {"service.name": "partial"})
+    good = exporter.span("build", 0, 10)
+    bad = {k: v for k, v in exporter.span("broken", 0, 1).items() if k != "endTimeUnixNano"}
+
+    response = exporter.export([good, bad])
+    assert response.status_code == 200
+    assert response.json()["partialSuccess"]["rejectedSpans"] == "1"
+    assert db_session.query(Run).count() == 1
+
+
+def test_receiver_rejects_protobuf_and_requires_auth(client):
+    response = client.post(
+        "/v1/traces",
+        content=b"\x0a\x00",
+        headers={**HEADERS, "Content-Type": "application/x-protobuf"},
+    )
+    assert response.status_code == 415
+
+    response = client.post("/v1/traces", json={"resourceSpans": []})
+    assert response.status_code == 403
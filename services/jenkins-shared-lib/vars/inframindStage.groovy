@@ -17,7 +17,8 @@ def call(Map config = [:], Closure body) {
 
     // Notify start
     def startTime = System.currentTimeMillis()
-    notifyStepEvent(apiUrl, apiKey, env.BUILD_ID, stageName, spanId, 'start', [:])
+    def startEvent = stepEvent(env.BUILD_ID, stageName, spanId, 'start', [:])
+    notifyStepEvents(apiUrl, apiKey, [startEvent])
 
     def result = null
     def counters = [:]
@@ -26,7 +27,8 @@ def call(Map config = [:], Closure body) {
         // Execute stage body
         result = body()
 
-        // Collect basic counters (extend with real metrics in production)
+        // Fallback counters for steps the API cannot attribute node agent
+        // samples to; it keeps the larger of these and what it scraped
         counters = [
             cpu_time_s: (System.currentTimeMillis() - startTime) / 1000.0,
             rss_max_bytes: 0, // Would come from C++ agent
@@ -41,8 +43,10 @@ def call(Map config = [:], Closure body) {
         throw e
 
     } finally {
-        // Notify stop
-        notifyStepEvent(apiUrl, apiKey, env.BUILD_ID, stageName, spanId, 'stop', counters)
+        // Notify stop, resending the start: events merge by span_id, so a start
+        // that was lost or arrives late still yields a complete step
+        def stopEvent = stepEvent(env.BUILD_ID, stageName, spanId, 'stop', counters)
+        notifyStepEvents(apiUrl, apiKey, [startEvent, stopEvent])
 
         def duration = (System.currentTimeMillis() - startTime) / 1000.0
         echo "[InfraMind] Stage ${stageName} completed in ${duration}s"
@@ -51,28 +55,38 @@ def call(Map config = [:], Closure body) {
     return result
 }
 
-def notifyStepEvent(apiUrl, apiKey, runId, stage, spanId, event, counters) {
-    def payload = [
+def stepEvent(runId, stage, spanId, event, counters) {
+    return [
         run_id: runId,
         stage: stage,
         step: stage,
         span_id: spanId,
         event: event,
-        timestamp: new Date().format("yyyy-MM-dd'T'HH:mm:ss.SSS'Z'"),
+        timestamp: new Date().format("yyyy-MM-dd'T'HH:mm:ss.SSS'Z'", TimeZone.getTimeZone('UTC')),
         counters: counters
     ]
+}
 
-    try {
-        httpRequest(
-            url: "${apiUrl}/builds/step",
-            httpMode: 'POST',
-            contentType: 'APPLICATION_JSON',
-            customHeaders: [[name: 'X-IM-Token', value: apiKey]],
-            requestBody: groovy.json.JsonOutput.toJson(payload),
-            validResponseCodes: '200',
-            quiet: true
-        )
-    } catch (Exception e) {
-        echo "[InfraMind] WARNING: Failed to notify ${event}: ${e.message}"
+def notifyStepEvents(apiUrl, apiKey, events, int attempts = 3) {
+    // Replaying events is harmless, so failed requests are simply retried
+    for (int attempt = 1; attempt <= attempts; attempt++) {
+        try {
+            httpRequest(
+                url: "${apiUrl}/builds/steps:batch",
+                httpMode: 'POST',
+                contentType: 'APPLICATION_JSON',
+                customHeaders: [[name: 'X-IM-Token', value: apiKey]],
+                requestBody: groovy.json.JsonOutput.toJson([events: events]),
+                validResponseCodes: '200',
+                quiet: true
+            )
+            return
+        } catch (Exception e) {
+            if (attempt == attempts) {
+                echo "[InfraMind] WARNING: Failed to send ${events*.event} events: ${e.message}"
+            } else {
+                sleep(time: attempt, unit: 'SECONDS')
+            }
+        }
     }
 }